@@ -0,0 +1,141 @@
+"""
+Архив истории клиентов (ClientActivity) — два уровня хранения.
+
+Горячая таблица ClientActivity хранит последние ACTIVITY_HOT_DAYS суток: её читают карточка клиента,
+лента дашборда и глобальный поиск. Старые записи задание archive_activity переносит в
+ClientActivityArchive — одна строка на клиента и месяц (по TIME_ZONE проекта), записи в ней —
+JSON-список в формате ClientActivitySerializer, сжатый zlib (история одного месяца — сотни байт).
+
+Архив читается по запросу: карточка клиента (GET /api/clients/<id>/activity_archive/) распаковывает
+только строки этого клиента. Архив старше ACTIVITY_ARCHIVE_DAYS удаляется целыми месяцами;
+0 — хранится бессрочно.
+"""
+
+import json
+import zlib
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+# Записей горячей таблицы за одну транзакцию переноса
+BATCH = 2000
+
+
+def pack(entries):
+    return zlib.compress(json.dumps(entries, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def unpack(blob):
+    """Сжатый список из БД → list. Пустое значение — пустой список."""
+    if not blob:
+        return []
+    return json.loads(zlib.decompress(bytes(blob)))
+
+
+def _sort_key(entry):
+    return datetime.fromisoformat(entry['created_at']), entry['id']
+
+
+def _month(moment):
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def archive(keep_days, stop=None, on_progress=None):
+    """
+    Переносит записи старше keep_days суток в помесячный архив пачками по BATCH; каждая пачка —
+    одна транзакция (запись в архив и удаление из горячей таблицы вместе). stop() — между пачками.
+    on_progress(перенесено, всего). Возвращает (перенесено, всего, остановлено ли).
+    """
+    from .models import ClientActivity, ClientActivityArchive
+    from .serializers import ClientActivitySerializer
+
+    border = timezone.now() - timedelta(days=keep_days)
+    old = ClientActivity.objects.filter(created_at__lt=border)
+    total = old.count()
+    moved = 0
+    while moved < total:
+        if stop is not None and stop():
+            return moved, total, True
+        with transaction.atomic():
+            rows = list(
+                old.select_related('user').select_for_update(of=('self',)).order_by('created_at', 'id')[:BATCH]
+            )
+            if not rows:
+                break
+            buckets = {}
+            for row in rows:
+                entry = dict(ClientActivitySerializer(row).data, user_id=row.user_id)
+                buckets.setdefault((row.client_id, _month(row.created_at)), []).append(entry)
+
+            existing = {
+                (b.client_id, b.month): b
+                for b in ClientActivityArchive.objects.select_for_update().filter(
+                    client_id__in={key[0] for key in buckets}, month__in={key[1] for key in buckets},
+                )
+            }
+            created, updated = [], []
+            for (client_id, month), entries in buckets.items():
+                bucket = existing.get((client_id, month))
+                if bucket is None:
+                    bucket = ClientActivityArchive(client_id=client_id, month=month)
+                    created.append(bucket)
+                else:
+                    # Повторный перенос после сбоя не должен дублировать записи
+                    known = {e['id'] for e in entries}
+                    entries = entries + [e for e in unpack(bucket.data) if e['id'] not in known]
+                    bucket.updated_at = timezone.now()
+                    updated.append(bucket)
+                entries.sort(key=_sort_key, reverse=True)
+                bucket.data = pack(entries)
+                bucket.count = len(entries)
+
+            ClientActivityArchive.objects.bulk_create(created)
+            ClientActivityArchive.objects.bulk_update(updated, ['data', 'count', 'updated_at'])
+            ClientActivity.objects.filter(pk__in=[row.pk for row in rows]).delete()
+        moved += len(rows)
+        if on_progress is not None:
+            on_progress(moved, total)
+    return moved, total, False
+
+
+def purge(keep_days):
+    """Удаляет месяцы архива, целиком старше keep_days суток (0 — ничего). Возвращает число месяцев."""
+    from .models import ClientActivityArchive
+    if not keep_days:
+        return 0
+    border = _month(timezone.now() - timedelta(days=keep_days))
+    deleted, _ = ClientActivityArchive.objects.filter(month__lt=border).delete()
+    return deleted
+
+
+def entries(client_id, search='', date_from=None, date_to=None):
+    """
+    Архивные записи клиента, новые первые. search — подстрока действия или имени (без учёта регистра),
+    date_from / date_to — даты включительно; месяцы вне периода не распаковываются.
+    """
+    from .models import ClientActivityArchive
+
+    qs = ClientActivityArchive.objects.filter(client_id=client_id)
+    if date_from:
+        qs = qs.filter(month__gte=date_from.replace(day=1))
+    if date_to:
+        qs = qs.filter(month__lte=date_to)
+    search = search.lower()
+    result = []
+    for bucket in qs.order_by('-month'):
+        for entry in unpack(bucket.data):
+            day = datetime.fromisoformat(entry['created_at']).date()
+            if date_from and day < date_from or date_to and day > date_to:
+                continue
+            if search and search not in entry['action'].lower() and search not in (entry.get('user_name') or '').lower():
+                continue
+            result.append(entry)
+    return result
+
+
+def count(client_id):
+    """Число записей клиента в архиве."""
+    from django.db.models import Sum
+    from .models import ClientActivityArchive
+    return ClientActivityArchive.objects.filter(client_id=client_id).aggregate(n=Sum('count'))['n'] or 0
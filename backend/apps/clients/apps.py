@@ -6,7 +6,14 @@ class ClientsConfig(AppConfig):
     verbose_name = 'Клиенты'
 
     def ready(self):
-        """Сброс зависших заданий при старте сервера."""
+        """
+        Сброс зависших заданий при старте сервера — только в режиме JOBS_EAGER,
+        когда задания выполняются в процессе веб-сервера. С воркером задания переживают
+        перезапуск веб-сервера, а задания упавшего воркера сбрасывает jobs.reap().
+        """
+        from django.conf import settings
+        if not settings.JOBS_EAGER:
+            return
         try:
             from .models import ScheduledTask
             ScheduledTask.objects.filter(status='running').update(
@@ -0,0 +1,160 @@
+"""
+История доступности адресов клиентов (external_ip / mikrotik_ip / server_ip).
+
+Одна строка HostAvailability — один адрес за одни сутки (по TIME_ZONE проекта).
+Минута суток — номер бита в двух битовых картах по 1440 бит:
+  probed — в эту минуту была проверка, up — адрес ответил.
+Карты хранятся сжатыми zlib: у хоста без сбоев это ~20 байт вместо строки на каждую проверку.
+"""
+
+import zlib
+from datetime import datetime, time as dtime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+MINUTES_PER_DAY = 1440
+BITMAP_BYTES = MINUTES_PER_DAY // 8
+
+# Ниже этой доступности (%) хост попадает в список проблемных в сводке
+SLA_PERCENT = 99.0
+
+
+def unpack(blob):
+    """Сжатая карта из БД → bytearray(180). Пустое значение — все нули."""
+    if not blob:
+        return bytearray(BITMAP_BYTES)
+    return bytearray(zlib.decompress(bytes(blob)))
+
+
+def pack(bits):
+    return zlib.compress(bytes(bits), 9)
+
+
+def set_bit(bits, minute, value=True):
+    if value:
+        bits[minute >> 3] |= 1 << (minute & 7)
+    else:
+        bits[minute >> 3] &= ~(1 << (minute & 7)) & 0xFF
+
+
+def get_bit(bits, minute):
+    return bool(bits[minute >> 3] & (1 << (minute & 7)))
+
+
+def count_bits(bits):
+    return int.from_bytes(bits, 'little').bit_count()
+
+
+def minute_of_day(moment):
+    local = timezone.localtime(moment)
+    return local.date(), local.hour * 60 + local.minute
+
+
+def minute_to_datetime(day, minute):
+    naive = datetime.combine(day, dtime()) + timedelta(minutes=minute)
+    return timezone.make_aware(naive)
+
+
+def record(results, now=None):
+    """
+    Записывает результаты одного обхода.
+    results: {(client_id, host): (ip, alive)}.
+    Строки за сутки читаются и пишутся пачкой (bulk_create / bulk_update).
+    """
+    from .models import HostAvailability
+
+    now = now or timezone.now()
+    day, minute = minute_of_day(now)
+
+    with transaction.atomic():
+        rows = {
+            (r.client_id, r.host): r
+            for r in HostAvailability.objects.select_for_update().filter(date=day)
+        }
+        missing = [key for key in results if key not in rows]
+        # Для новых строк суток переносим «недоступен с» из вчерашней строки
+        carried = {}
+        if missing:
+            client_ids = {cid for cid, _ in missing}
+            for prev in HostAvailability.objects.filter(
+                date=day - timedelta(days=1), client_id__in=client_ids, last_up=False,
+            ).only('client_id', 'host', 'down_since'):
+                carried[(prev.client_id, prev.host)] = prev.down_since
+
+        to_create, to_update = [], []
+        for key, (ip, alive) in results.items():
+            row = rows.get(key)
+            if row is None:
+                row = HostAvailability(
+                    client_id=key[0], host=key[1], date=day,
+                    down_since=carried.get(key),
+                    last_up=False if key in carried else None,
+                )
+                to_create.append(row)
+            else:
+                to_update.append(row)
+
+            probed, up = unpack(row.probed_bits), unpack(row.up_bits)
+            set_bit(probed, minute)
+            set_bit(up, minute, alive)
+            row.probed_bits, row.up_bits = pack(probed), pack(up)
+
+            if row.ip and row.ip != ip:
+                row.down_since = None   # адрес сменился — прежний простой не относится к новому
+            row.ip = ip
+            if alive:
+                row.down_since = None
+            elif row.down_since is None:
+                row.down_since = now
+            row.last_up = alive
+            row.last_probe_at = now
+
+        HostAvailability.objects.bulk_create(to_create, batch_size=500)
+        HostAvailability.objects.bulk_update(
+            to_update,
+            ['ip', 'probed_bits', 'up_bits', 'last_up', 'last_probe_at', 'down_since'],
+            batch_size=500,
+        )
+    return len(to_create), len(to_update)
+
+
+def day_stats(row):
+    """(число проверок, число успешных) за сутки."""
+    return count_bits(unpack(row.probed_bits)), count_bits(unpack(row.up_bits))
+
+
+def outages(row):
+    """
+    Интервалы недоступности за сутки — RLE по минутам с проверкой:
+    [(начало, конец)], конец — минута последней неудачной проверки + 1.
+    """
+    probed, up = unpack(row.probed_bits), unpack(row.up_bits)
+    result = []
+    start = last = None
+    for minute in range(MINUTES_PER_DAY):
+        if not get_bit(probed, minute):
+            continue
+        if get_bit(up, minute):
+            if start is not None:
+                result.append((start, last + 1))
+                start = None
+        else:
+            if start is None:
+                start = minute
+            last = minute
+    if start is not None:
+        result.append((start, last + 1))
+    return [(minute_to_datetime(row.date, s), minute_to_datetime(row.date, e)) for s, e in result]
+
+
+def percent(up, probed):
+    return round(up * 100.0 / probed, 2) if probed else None
+
+
+def purge(keep_days):
+    """Удаляет историю старше keep_days суток."""
+    from .models import HostAvailability
+    border = timezone.localdate() - timedelta(days=keep_days)
+    deleted, _ = HostAvailability.objects.filter(date__lt=border).delete()
+    return deleted
@@ -0,0 +1,502 @@
+"""
+Дамп и загрузка БД для резервного копирования (задания backup_system / restore_backup).
+
+Дамп пишется сразу в архив бэкапа (backup_archive.ArchiveWriter), время и память зависят от диска,
+а не от числа строк:
+  - BACKUP_DB_FORMAT=custom (по умолчанию) — db.dump: вывод pg_dump идёт в архив по мере выгрузки,
+    без сжатия (сжимает архив);
+  - directory — db.dir: таблицы выгружаются параллельно в BACKUP_DB_JOBS процессов во временную
+    папку рядом с архивом и добавляются в него;
+  - json — db.json: объекты моделей сериализуются в архив по мере выборки (iterator), как dumpdata.
+JSON — и запасной вариант, если pg_dump нет, он не подходит к серверу (версия старше клиента)
+или СУБД не PostgreSQL.
+
+Восстановление понимает все форматы (и db.json старых бэкапов), портал во время загрузки работает
+на прежних данных:
+  - дамп pg_dump загружается в схему STAGING_SCHEMA — по таблице в BACKUP_DB_JOBS потоков
+    (pg_restore --data-only → COPY), число строк сверяется с дампом;
+  - затем одной транзакцией таблицы очищаются (кроме SKIP_TABLES и служебных django_*), строки
+    переносятся из промежуточной схемы, последовательности выставляются по данным. Простой — только
+    эта транзакция; остановка или ошибка до неё живые данные не трогает;
+  - db.json — очистка и loaddata в одной транзакции.
+Данные пропускаемых таблиц pg_dump не выгружает, при загрузке они тоже пропускаются.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+DUMP_FILES = {'custom': 'db.dump', 'directory': 'db.dir', 'json': 'db.json'}
+
+# Таблицы, которые восстановление не очищает и дамп pg_dump не выгружает (вместе с django_*)
+SKIP_TABLES = {
+    'django_migrations',
+    'django_content_type',
+    'auth_permission',
+    'auth_group',
+    'auth_group_permissions',
+    'clients_backgroundjob',  # очередь: в ней выполняется само восстановление
+}
+
+# Модели, которые JSON-дамп не выгружает (как --exclude у dumpdata)
+JSON_EXCLUDE = {'contenttypes', 'auth.permission', 'clients.backgroundjob'}
+
+# Схема, в которую восстановление загружает дамп до замены живых данных
+STAGING_SCHEMA = 'restore_staging'
+
+# Проверка остановки при ожидании pg_dump, сек
+_POLL = 1.0
+_BLOCK = 1024 * 1024
+
+
+def _skipped(table):
+    return table in SKIP_TABLES or table.startswith('django_')
+
+
+def _pg_conn():
+    """Аргументы подключения и окружение (пароль) для pg_dump / pg_restore."""
+    db = settings.DATABASES['default']
+    args = ['-h', db['HOST'] or 'localhost', '-p', str(db['PORT'] or 5432), '-U', db['USER'], '-d', db['NAME']]
+    env = dict(os.environ, PGPASSWORD=db['PASSWORD'] or '')
+    return args, env
+
+
+def _run(cmd, env, stop=None):
+    """
+    Запускает команду с ожиданием (stderr — во временный файл, без буфера в памяти).
+    stop() → причина — процесс завершается, возвращается False; ошибка — RuntimeError с хвостом stderr.
+    """
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=err)
+        while True:
+            try:
+                code = proc.wait(timeout=_POLL)
+                break
+            except subprocess.TimeoutExpired:
+                if stop is not None and stop():
+                    proc.terminate()
+                    try:
+                        proc.wait(timeout=30)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                        proc.wait()
+                    return False
+        if code != 0:
+            err.seek(0)
+            tail = err.read()[-2000:].decode('utf-8', 'replace').strip()
+            raise RuntimeError(f'{os.path.basename(cmd[0])}: код {code}\n{tail}')
+    return True
+
+
+def _size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(dp, f)) for dp, dn, fn in os.walk(path) for f in fn)
+    return os.path.getsize(path)
+
+
+@contextmanager
+def _snapshot():
+    """
+    Отдельное соединение в REPEATABLE READ с экспортированным снимком: pg_dump (--snapshot) и подсчёт
+    строк для манифеста видят одни и те же данные. Отдельное — чтобы прогресс и проверка отмены
+    в основном соединении не застревали в долгой транзакции. Выдаёт (id снимка, курсор).
+    """
+    raw = connection.get_new_connection(connection.get_connection_params())
+    try:
+        raw.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cursor = raw.cursor()
+        cursor.execute('SELECT pg_export_snapshot()')
+        yield cursor.fetchone()[0], cursor
+    finally:
+        raw.close()
+
+
+def _row_counts(cursor):
+    """Строк по выгружаемым таблицам: {таблица: число}."""
+    counts = {}
+    for table in connection.introspection.table_names():
+        if not _skipped(table):
+            cursor.execute(f'SELECT count(*) FROM "{table}"')
+            counts[table] = cursor.fetchone()[0]
+    return counts
+
+
+def _dump_pg(archive, fmt, stop, tmp_root, snapshot):
+    conn_args, env = _pg_conn()
+    pg_dump = shutil.which('pg_dump')
+    excludes = [f'--exclude-table-data={table}' for table in sorted(SKIP_TABLES) + ['django_*']]
+    excludes.append(f'--snapshot={snapshot}')
+
+    if fmt == 'directory':
+        # Параллельная выгрузка пишет по файлу на таблицу — во временную папку рядом с архивом
+        tmp = tempfile.mkdtemp(prefix='.pg_dump-', dir=tmp_root)
+        try:
+            path = os.path.join(tmp, DUMP_FILES['directory'])
+            cmd = [pg_dump, *conn_args, '--format=directory', f'--file={path}', '--no-owner', *excludes]
+            if settings.BACKUP_DB_JOBS > 1:
+                cmd.append(f'--jobs={settings.BACKUP_DB_JOBS}')
+            if not _run(cmd, env, stop):
+                return None
+            archive.add_tree(path, DUMP_FILES['directory'])
+            return _size(path)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    # custom — из stdout pg_dump прямо в архив; сжимает архив, поэтому --compress=0
+    cmd = [pg_dump, *conn_args, '--format=custom', '--compress=0', '--no-owner', *excludes]
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=err)
+        try:
+            # Первый блок — до записи в архив: pg_dump, упавший сразу (версия сервера), архив не трогает
+            pending = [proc.stdout.read(_BLOCK)]
+            if pending[0]:
+                size = archive.add_stream(
+                    DUMP_FILES['custom'], lambda n: pending.pop() if pending else proc.stdout.read(n), stop=stop,
+                )
+            else:
+                size = 0
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        if size is None:
+            proc.terminate()
+            proc.wait()
+            return None
+        code = proc.wait()
+        if code != 0:
+            err.seek(0)
+            raise RuntimeError(f'pg_dump: код {code}\n{err.read()[-2000:].decode("utf-8", "replace").strip()}')
+    return size
+
+
+def _dump_json(archive):
+    """Объекты моделей по порядку зависимостей — в архив по мере выборки (как dumpdata --natural-*)."""
+    from django.apps import apps
+    from django.core import serializers
+
+    models = serializers.sort_dependencies(
+        [(app, None) for app in apps.get_app_configs() if app.models_module is not None], allow_cycles=True,
+    )
+    rows = {}
+
+    def _objects():
+        for model in models:
+            meta = model._meta
+            if meta.proxy or not meta.managed or {meta.app_label, meta.label_lower} & JSON_EXCLUDE:
+                continue
+            rows[meta.db_table] = 0
+            for obj in model._base_manager.order_by(meta.pk.name).iterator(chunk_size=2000):
+                rows[meta.db_table] += 1
+                yield obj
+
+    out = archive.stream(DUMP_FILES['json'])
+    serializers.serialize(
+        'json', _objects(), stream=out, use_natural_foreign_keys=True, use_natural_primary_keys=True,
+    )
+    out.close()
+    return out.total, rows
+
+
+def estimate_size():
+    """Размер БД в байтах для прогресса дампа (на PostgreSQL) или None."""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_database_size(current_database())')
+        return cursor.fetchone()[0]
+
+
+def dump_database(archive, stop=None, tmp_root=None):
+    """
+    Дамп БД в архив бэкапа (backup_archive.ArchiveWriter). Возвращает {'format', 'size', 'rows',
+    'fallback'} (size — байт до сжатия, rows — строк по таблицам на момент дампа, fallback — почему
+    pg_dump не использован) или None, если остановлено.
+    """
+    fmt = settings.BACKUP_DB_FORMAT
+    fallback = ''
+    if fmt != 'json':
+        if connection.vendor != 'postgresql':
+            fallback = 'СУБД не PostgreSQL'
+        elif not shutil.which('pg_dump'):
+            fallback = 'pg_dump не установлен'
+        else:
+            written = archive.bytes
+            try:
+                with _snapshot() as (snapshot, cursor):
+                    size = _dump_pg(archive, fmt, stop, tmp_root, snapshot)
+                    rows = _row_counts(cursor) if size is not None else None
+            except Exception as e:
+                if archive.bytes != written:
+                    raise   # часть дампа уже в архиве — запасной вариант не поможет
+                # Чаще всего — версия pg_dump младше сервера; бэкап всё равно нужен
+                fallback = str(e)[:500]
+            else:
+                if size is None:
+                    return None
+                return {'format': fmt, 'size': size, 'rows': rows, 'fallback': ''}
+    size, rows = _dump_json(archive)
+    return {'format': 'json', 'size': size, 'rows': rows, 'fallback': fallback}
+
+
+def find_dump(root):
+    """(формат, путь) дампа в распакованном бэкапе или (None, None)."""
+    for fmt, name in DUMP_FILES.items():
+        path = os.path.join(root, name)
+        if os.path.exists(path):
+            return fmt, path
+    return None, None
+
+
+def _truncate(cursor):
+    """
+    Очищает восстанавливаемые таблицы одним TRUNCATE без CASCADE: CASCADE прошёл бы по ключам
+    и в пропускаемые таблицы — очередь заданий (в ней выполняется само восстановление) опустела бы.
+    Пропускаемые таблицы с ключом на очищаемые (django_admin_log) очищаются явно — их строки
+    ссылаются на прежних пользователей. Ключа BackgroundJob.user в БД нет (db_constraint=False);
+    задания пользователей, которых нет в восстановленных данных, остаются без автора.
+    """
+    tables = connection.introspection.table_names(cursor)
+    live = [t for t in tables if not _skipped(t)]
+    dependent = [
+        t for t in tables
+        if _skipped(t) and any(ref in live for _, ref in connection.introspection.get_relations(cursor, t).values())
+    ]
+    cursor.execute('TRUNCATE TABLE ' + ', '.join(f'"{t}"' for t in live + dependent) + ' RESTART IDENTITY')
+
+
+def _detach_jobs(cursor):
+    """Задания пользователей, которых нет после восстановления, — без автора (как on_delete=SET_NULL)."""
+    cursor.execute(
+        'UPDATE clients_backgroundjob SET user_id = NULL '
+        'WHERE user_id IS NOT NULL AND user_id NOT IN (SELECT id FROM accounts_user)'
+    )
+
+
+def _job_authors():
+    """
+    Авторы заданий очереди: {естественный ключ пользователя: [id заданий]}. db.json хранит
+    пользователей без pk (--natural-primary), после loaddata их id другие — задания
+    перепривязываются по ключу (_reattach_jobs).
+    """
+    from django.contrib.auth import get_user_model
+    from .models import BackgroundJob
+    field = get_user_model().USERNAME_FIELD
+    authors = {}
+    for job_id, key in BackgroundJob.objects.filter(user__isnull=False).values_list('pk', f'user__{field}'):
+        if key is not None:
+            authors.setdefault(key, []).append(job_id)
+    return authors
+
+
+def _reattach_jobs(authors):
+    from django.contrib.auth import get_user_model
+    from .models import BackgroundJob
+    User = get_user_model()
+    users = dict(User.objects.filter(**{f'{User.USERNAME_FIELD}__in': list(authors)})
+                 .values_list(User.USERNAME_FIELD, 'pk'))
+    for key, job_ids in authors.items():
+        BackgroundJob.objects.filter(pk__in=job_ids).update(user_id=users.get(key))
+
+
+def truncate_tables():
+    """Очищает пользовательские таблицы перед загрузкой дампа (очередь заданий не трогает)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SET session_replication_role = 'replica';")
+        _truncate(cursor)
+        cursor.execute("SET session_replication_role = 'origin';")
+
+
+def _data_entries(path, env):
+    """Строки оглавления дампа с данными восстанавливаемых таблиц: [(строка, таблица)]."""
+    toc = subprocess.run(
+        [shutil.which('pg_restore'), '--list', path], env=env, capture_output=True, text=True, check=True,
+    ).stdout.splitlines()
+    entries = []
+    for line in toc:
+        if line.startswith(';') or ' TABLE DATA ' not in line:
+            continue
+        schema, table = line.split(' TABLE DATA ', 1)[1].split()[:2]
+        if schema == 'public' and not _skipped(table):
+            entries.append((line, table))
+    return entries
+
+
+class _CopyData:
+    """Строки данных COPY из скрипта pg_restore до «\\.» — файлоподобный объект для copy_expert."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buf = b''
+        self._done = False
+        self.rows = 0
+
+    def read(self, size=-1):
+        while not self._done and (size < 0 or len(self._buf) < size):
+            line = next(self._lines, b'\\.\n')
+            if line.rstrip(b'\n') == b'\\.':
+                self._done = True
+                break
+            self._buf += line
+            self.rows += 1
+        if size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+
+def _load_table(path, env, toc_line):
+    """
+    Данные одной таблицы: pg_restore --data-only выдаёт скрипт с COPY public.<таблица> …,
+    COPY перенаправляется в STAGING_SCHEMA. Возвращает (список колонок, строк загружено).
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.list', encoding='utf-8') as list_file:
+        list_file.write(toc_line + '\n')
+        list_file.flush()
+        with tempfile.TemporaryFile() as err:
+            proc = subprocess.Popen(
+                [shutil.which('pg_restore'), '--data-only', f'--use-list={list_file.name}', '--file=-', path],
+                env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=err,
+            )
+            columns, rows = None, 0
+            try:
+                lines = iter(proc.stdout)
+                for line in lines:
+                    if not line.startswith(b'COPY public.'):
+                        continue   # SET … в начале скрипта
+                    # COPY public.<таблица> (<колонки>) FROM stdin;
+                    target = line[len(b'COPY public.'):].decode('utf-8').rstrip().removesuffix(' FROM stdin;')
+                    columns = target.split(' (', 1)[1].rstrip(')')
+                    data = _CopyData(lines)
+                    with connection.cursor() as cursor:   # в потоке пула — своё соединение
+                        cursor.copy_expert(f'COPY {STAGING_SCHEMA}.{target} FROM STDIN', data)
+                    rows += data.rows
+                for _ in lines:
+                    pass
+            except BaseException:
+                proc.kill()
+                raise
+            finally:
+                proc.stdout.close()
+                code = proc.wait()
+                connection.close()
+            if code != 0:
+                err.seek(0)
+                raise RuntimeError(f'pg_restore: код {code}\n{err.read()[-2000:].decode("utf-8", "replace").strip()}')
+    return columns, rows
+
+
+def _prepare_staging(tables):
+    """Схема STAGING_SCHEMA с пустыми копиями таблиц (без индексов и ключей — загрузка быстрее)."""
+    with connection.cursor() as cursor:
+        live = set(connection.introspection.table_names(cursor))
+        absent = [t for t in tables if t not in live]
+        if absent:
+            raise RuntimeError('В БД нет таблиц из дампа (бэкап новее кода?): ' + ', '.join(absent))
+        cursor.execute(f'DROP SCHEMA IF EXISTS {STAGING_SCHEMA} CASCADE')
+        cursor.execute(f'CREATE SCHEMA {STAGING_SCHEMA}')
+        for table in tables:
+            cursor.execute(f'CREATE UNLOGGED TABLE {STAGING_SCHEMA}."{table}" (LIKE public."{table}")')
+
+
+def _validate_staging(loaded):
+    """Число строк в промежуточных таблицах должно совпасть с числом строк в дампе."""
+    with connection.cursor() as cursor:
+        for table, (columns, rows) in loaded.items():
+            cursor.execute(f'SELECT count(*) FROM {STAGING_SCHEMA}."{table}"')
+            count = cursor.fetchone()[0]
+            if count != rows:
+                raise RuntimeError(f'{table}: в дампе {rows} строк, загружено {count}')
+
+
+def _swap(loaded):
+    """
+    Одна транзакция: очистка живых таблиц и перенос строк из промежуточных, сброс последовательностей.
+    До COMMIT остальные сеансы видят (или ждут) прежние данные — пустого портала не бывает.
+    """
+    from django.apps import apps
+    from django.core.management.color import no_style
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SET LOCAL session_replication_role = 'replica'")
+        _truncate(cursor)
+        for table, (columns, rows) in loaded.items():
+            if not rows:
+                continue
+            cursor.execute(
+                f'INSERT INTO public."{table}" ({columns}) SELECT {columns} FROM {STAGING_SCHEMA}."{table}"'
+            )
+            if cursor.rowcount != rows:
+                raise RuntimeError(f'{table}: перенесено {cursor.rowcount} строк из {rows}')
+        models = [m for m in apps.get_models(include_auto_created=True) if m._meta.db_table in loaded]
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+        _detach_jobs(cursor)
+
+
+def _restore_pg(path, stop, on_progress):
+    if connection.vendor != 'postgresql' or not shutil.which('pg_restore'):
+        raise RuntimeError('Дамп pg_dump загружается только pg_restore в PostgreSQL')
+    _, env = _pg_conn()
+    entries = _data_entries(path, env)
+    _prepare_staging([table for _, table in entries])
+    try:
+        cancel = threading.Event()
+        loaded = {}
+
+        def _task(toc_line):
+            return None if cancel.is_set() else _load_table(path, env, toc_line)
+
+        with ThreadPoolExecutor(max_workers=max(settings.BACKUP_DB_JOBS, 1)) as pool:
+            futures = {pool.submit(_task, line): table for line, table in entries}
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    if result is not None:
+                        loaded[futures[future]] = result
+                    if on_progress is not None:
+                        on_progress(len(loaded), len(entries))
+                    if stop is not None and stop():
+                        cancel.set()
+                        return None
+            except BaseException:
+                cancel.set()
+                raise
+
+        _validate_staging(loaded)
+        if stop is not None and stop():
+            return None
+        _swap(loaded)
+        return {'tables': len(loaded), 'rows': sum(rows for _, rows in loaded.values())}
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP SCHEMA IF EXISTS {STAGING_SCHEMA} CASCADE')
+
+
+def restore_database(fmt, path, stop=None, on_progress=None):
+    """
+    Восстанавливает БД из дампа. Возвращает {'tables', 'rows'} (для db.json — None в значениях)
+    или None, если остановлено через stop() — тогда живые данные не изменялись.
+    on_progress(загружено таблиц, всего) — по мере загрузки в промежуточную схему.
+    """
+    if fmt != 'json':
+        return _restore_pg(path, stop, on_progress)
+    if stop is not None and stop():
+        return None
+    from django.core.management import call_command
+    # Очистка и loaddata — одной транзакцией: ошибка загрузки не оставит БД пустой
+    with transaction.atomic():
+        authors = _job_authors()
+        truncate_tables()
+        call_command('loaddata', path, format='json', verbosity=0, exclude=['clients.backgroundjob'])
+        _reattach_jobs(authors)
+        with connection.cursor() as cursor:
+            _detach_jobs(cursor)
+    return {'tables': None, 'rows': None}
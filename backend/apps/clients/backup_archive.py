@@ -0,0 +1,333 @@
+"""
+Архив бэкапа: запись одним проходом со сжатием на лету и распаковка при восстановлении.
+
+ArchiveWriter пишет tar прямо в сжимающий поток — дамп БД и манифест медиа добавляются по мере
+получения, без временной папки, повторного чтения и shutil.make_archive. Данные неизвестной длины
+(вывод pg_dump, JSON-дамп) пишутся частями по BACKUP_ARCHIVE_PART_MB: заголовку tar нужен размер
+заранее, поэтому часть копится в памяти и ложится в архив как <имя>.part-00000, <имя>.part-00001, …
+Поток, уложившийся в одну часть, пишется одним файлом <имя>. extract() склеивает части обратно.
+
+Сжатие — BACKUP_COMPRESSION:
+  - gzip (.tar.gz) — pigz в BACKUP_COMPRESSION_THREADS потоков, если установлен, иначе модуль gzip;
+  - xz (.tar.xz) — утилита xz -T, иначе модуль lzma (в один поток);
+  - zstd (.tar.zst) — модуль zstandard (с потоками) или утилита zstd; нет ни того ни другого — gzip.
+BACKUP_COMPRESSION_LEVEL — уровень (0 — по умолчанию для алгоритма).
+
+SHA-256 готового архива считается по пути в файл (ArchiveWriter.sha256) — без повторного чтения.
+"""
+
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+
+from django.conf import settings
+
+CODECS = {
+    'gzip': {'ext': '.tar.gz',  'level': 6, 'tool': 'pigz', 'threads': '-p{}'},
+    'xz':   {'ext': '.tar.xz',  'level': 6, 'tool': 'xz',   'threads': '-T{}'},
+    'zstd': {'ext': '.tar.zst', 'level': 3, 'tool': 'zstd', 'threads': '-T{}'},
+}
+EXTENSIONS = tuple(c['ext'] for c in CODECS.values())
+PART_SUFFIX = '.part-'
+_CHUNK = 1024 * 1024
+
+
+def is_archive(fname):
+    return fname.startswith('backup_') and fname.endswith(EXTENSIONS)
+
+
+def archive_stem(fname):
+    """'backup_2025-01-01_03-00-00.tar.zst' → 'backup_2025-01-01_03-00-00'."""
+    for ext in EXTENSIONS:
+        if fname.endswith(ext):
+            return fname[:-len(ext)]
+    return fname
+
+
+def _codec_of(path):
+    for name, codec in CODECS.items():
+        if path.endswith(codec['ext']):
+            return name
+    raise ValueError(f'Неизвестный формат архива: {os.path.basename(path)}')
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve_codec(name=None):
+    """Алгоритм, который будет использован на самом деле (zstd без модуля и утилиты → gzip)."""
+    name = name or settings.BACKUP_COMPRESSION
+    if name not in CODECS:
+        raise ValueError(f'BACKUP_COMPRESSION: {name} (допустимо: {", ".join(CODECS)})')
+    if name == 'zstd' and _zstandard() is None and not shutil.which('zstd'):
+        return 'gzip'
+    return name
+
+
+def _threads():
+    return settings.BACKUP_COMPRESSION_THREADS or os.cpu_count() or 1
+
+
+class _Hashing:
+    """Запись в файл с подсчётом SHA-256 записанного."""
+
+    def __init__(self, f):
+        self._f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+class _Output:
+    """Сжимающий поток в файл: модуль zstandard, внешняя утилита (pigz / xz / zstd) или gzip / lzma."""
+
+    def __init__(self, path, codec, level):
+        self.file = open(path, 'wb')
+        self.sink = _Hashing(self.file)
+        self.proc = None
+        self._pump = None
+        self.tool = CODECS[codec]['tool']
+        threads = _threads()
+        zstd = _zstandard() if codec == 'zstd' else None
+        tool = shutil.which(self.tool)
+        if zstd is not None:
+            compressor = zstd.ZstdCompressor(level=level, threads=threads if threads > 1 else 0)
+            self._writer = compressor.stream_writer(self.sink, closefd=False)
+        elif tool and (threads > 1 or codec == 'zstd'):
+            self.proc = subprocess.Popen(
+                [tool, '-c', '-q', f'-{level}', CODECS[codec]['threads'].format(threads)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            )
+            self._writer = self.proc.stdin
+            # Вывод утилиты — в файл через хеш, в отдельном потоке
+            self._pump = threading.Thread(
+                target=lambda: shutil.copyfileobj(self.proc.stdout, self.sink, _CHUNK), daemon=True,
+            )
+            self._pump.start()
+        elif codec == 'xz':
+            self._writer = lzma.LZMAFile(self.sink, 'wb', preset=level)
+        else:
+            self._writer = gzip.GzipFile(fileobj=self.sink, mode='wb', compresslevel=level)
+
+    def write(self, data):
+        return self._writer.write(data)
+
+    def close(self):
+        try:
+            self._writer.close()
+            if self.proc is not None:
+                self._pump.join()
+                if self.proc.wait() != 0:
+                    raise RuntimeError(f'{self.tool}: код {self.proc.returncode}')
+        finally:
+            self.file.close()
+
+    def abort(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self._pump.join()
+        self.file.close()
+
+
+class _Counting:
+    """Чтение файла с подсчётом байт для прогресса."""
+
+    def __init__(self, f, count):
+        self._f = f
+        self._count = count
+
+    def read(self, n=-1):
+        data = self._f.read(n)
+        self._count(len(data))
+        return data
+
+
+class _Parts:
+    """Поток неизвестной длины в архив частями (см. docstring модуля). Принимает bytes и str."""
+
+    def __init__(self, archive, name):
+        self.archive = archive
+        self.name = name
+        self.part_size = int(settings.BACKUP_ARCHIVE_PART_MB * 1024 * 1024)
+        self.total = 0
+        self._buf = bytearray()
+        self._index = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._buf += data
+        self.total += len(data)
+        while len(self._buf) >= self.part_size:
+            self._emit(self._buf[:self.part_size])
+            del self._buf[:self.part_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _emit(self, data):
+        self.archive.add_bytes(f'{self.name}{PART_SUFFIX}{self._index:05d}', data)
+        self._index += 1
+
+    def close(self):
+        if self._index == 0:
+            self.archive.add_bytes(self.name, self._buf)
+        elif self._buf:
+            self._emit(self._buf)
+        self._buf = bytearray()
+
+
+class ArchiveWriter:
+    """
+    tar-архив со сжатием на лету. Пишется в <path>.partial и переименовывается в close():
+    незаконченный архив не попадёт в список бэкапов. Файлы кладутся в папку root внутри архива.
+    on_progress(байт) — после каждого записанного блока (байты до сжатия).
+    После close() в sha256 — контрольная сумма архива.
+    """
+
+    def __init__(self, path, root, codec=None, level=None, on_progress=None):
+        self.codec = resolve_codec(codec)
+        self.level = level or settings.BACKUP_COMPRESSION_LEVEL or CODECS[self.codec]['level']
+        self.path = path
+        self.root = root
+        self.bytes = 0
+        self.sha256 = None
+        self.on_progress = on_progress
+        self._partial = path + '.partial'
+        self._out = _Output(self._partial, self.codec, self.level)
+        self._tar = tarfile.open(fileobj=self._out, mode='w|', format=tarfile.PAX_FORMAT)
+
+    def _info(self, name, size):
+        info = tarfile.TarInfo(f'{self.root}/{name}')
+        info.size = size
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        return info
+
+    def _count(self, n):
+        self.bytes += n
+        if self.on_progress is not None and n:
+            self.on_progress(self.bytes)
+
+    def add_bytes(self, name, data):
+        self._tar.addfile(self._info(name, len(data)), io.BytesIO(data))
+        self._count(len(data))
+
+    def add_file(self, path, name):
+        with open(path, 'rb') as f:
+            self._tar.addfile(self._info(name, os.fstat(f.fileno()).st_size), _Counting(f, self._count))
+
+    def add_tree(self, path, name):
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for fname in sorted(filenames):
+                full = os.path.join(dirpath, fname)
+                self.add_file(full, f'{name}/{os.path.relpath(full, path)}'.replace(os.sep, '/'))
+
+    def stream(self, name):
+        """Файлоподобный объект для записи потока неизвестной длины; закрыть — close()."""
+        return _Parts(self, name)
+
+    def add_stream(self, name, read, stop=None):
+        """
+        Читает read(n) до пустого ответа и пишет в архив частями.
+        Возвращает число байт или None, если stop() сработал (архив после этого только abort()).
+        """
+        parts = self.stream(name)
+        while True:
+            chunk = read(_CHUNK)
+            if not chunk:
+                break
+            parts.write(chunk)
+            if stop is not None and stop():
+                return None
+        parts.close()
+        return parts.total
+
+    def close(self):
+        """Дописывает архив и переименовывает в path. Возвращает размер архива."""
+        self._tar.close()
+        self._out.close()
+        self.sha256 = self._out.sink.digest.hexdigest()
+        os.replace(self._partial, self.path)
+        return os.path.getsize(self.path)
+
+    def abort(self):
+        # Без этого tarfile при сборке мусора попытается дописать конец архива в закрытый поток
+        self._tar.fileobj.closed = True
+        try:
+            self._out.abort()
+        finally:
+            if os.path.exists(self._partial):
+                os.remove(self._partial)
+
+
+def _open_input(path):
+    """Распаковывающий поток архива: (поток, процесс или None)."""
+    codec = _codec_of(path)
+    if codec == 'zstd':
+        zstd = _zstandard()
+        if zstd is not None:
+            return zstd.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True), None
+        tool = shutil.which('zstd')
+        if not tool:
+            raise RuntimeError('Для .tar.zst нужен модуль zstandard или утилита zstd')
+        proc = subprocess.Popen([tool, '-d', '-c', '-q', path], stdout=subprocess.PIPE)
+        return proc.stdout, proc
+    if codec == 'xz':
+        return lzma.open(path, 'rb'), None
+    return gzip.open(path, 'rb'), None
+
+
+def _safe_path(dest, name):
+    path = os.path.realpath(os.path.join(dest, name))
+    if not path.startswith(os.path.realpath(dest) + os.sep):
+        raise RuntimeError(f'Недопустимый путь в архиве: {name}')
+    return path
+
+
+def extract(path, dest):
+    """
+    Распаковывает архив бэкапа в dest одним проходом. Части <имя>.part-NNNNN дописываются
+    в <имя> по порядку. Пути вне dest, ссылки и устройства не распаковываются.
+    """
+    stream, proc = _open_input(path)
+    try:
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                if member.isdir():
+                    os.makedirs(_safe_path(dest, member.name), exist_ok=True)
+                    continue
+                if not member.isfile():
+                    continue
+                name, append = member.name, False
+                base, sep, index = name.rpartition(PART_SUFFIX)
+                if sep and index.isdigit():
+                    name, append = base, int(index) > 0
+                target = _safe_path(dest, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'ab' if append else 'wb') as out:
+                    shutil.copyfileobj(tar.extractfile(member), out, _CHUNK)
+    finally:
+        stream.close()
+        if proc is not None and proc.wait() != 0:
+            raise RuntimeError(f'zstd: код {proc.returncode}')
@@ -0,0 +1,162 @@
+"""
+Индекс резервных копий: BACKUP_DIR/index.json — по записи на архив с его манифестом.
+
+Манифест пишет задание backup_system (manifest.json в архиве и запись в индексе): размеры дампа
+и архива, строки по таблицам, число и объём медиафайлов, SHA-256 архива, длительность. Список
+бэкапов и дашборд читают только индекс — без stat каждого архива и без распаковки.
+
+Индекс сверяется с содержимым папки по именам (один listdir): архив, удалённый или подложенный
+вручную, обновляет индекс при следующем чтении; для архивов без манифеста (старые, ручные)
+в записи только имя, размер и время.
+
+verify() проверяет копию без восстановления: размер и SHA-256 архива по манифесту, наличие
+и размер блобов медиа в хранилище.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+from . import backup_media
+from .backup_archive import archive_stem, is_archive
+
+INDEX_NAME = 'index.json'
+MANIFEST_NAME = 'manifest.json'
+_CHUNK = 1024 * 1024
+
+
+@contextmanager
+def _locked(backup_dir):
+    """Исключительная блокировка индекса: бэкап и чтение списка могут обновлять его одновременно."""
+    os.makedirs(backup_dir, exist_ok=True)
+    with open(os.path.join(backup_dir, '.index.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _read(backup_dir):
+    try:
+        with open(os.path.join(backup_dir, INDEX_NAME), encoding='utf-8') as f:
+            return {e['file']: e for e in json.load(f)['backups']}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write(backup_dir, entries):
+    backup_media.write_json(
+        os.path.join(backup_dir, INDEX_NAME),
+        {'version': 1, 'backups': sorted(entries.values(), key=lambda e: e['file'], reverse=True)},
+    )
+
+
+def _basic(backup_dir, fname):
+    """Запись для архива без манифеста."""
+    st = os.stat(os.path.join(backup_dir, fname))
+    return {'file': fname, 'name': archive_stem(fname), 'size': st.st_size, 'created_at': st.st_mtime}
+
+
+def _reconciled(backup_dir, entries):
+    """Записи, приведённые к архивам в папке. Возвращает (записи, изменились ли)."""
+    present = {f for f in os.listdir(backup_dir) if is_archive(f)} if os.path.isdir(backup_dir) else set()
+    changed = entries is None
+    entries = dict(entries or {})
+    for fname in set(entries) - present:
+        del entries[fname]
+        changed = True
+    for fname in present - set(entries):
+        try:
+            entries[fname] = _basic(backup_dir, fname)
+        except FileNotFoundError:
+            continue
+        changed = True
+    return entries, changed
+
+
+def backups(backup_dir):
+    """Записи индекса, новые первые."""
+    entries = _read(backup_dir)
+    fresh, changed = _reconciled(backup_dir, entries)
+    if changed and os.path.isdir(backup_dir):
+        with _locked(backup_dir):
+            fresh, changed = _reconciled(backup_dir, _read(backup_dir))
+            if changed:
+                _write(backup_dir, fresh)
+    return sorted(fresh.values(), key=lambda e: e['file'], reverse=True)
+
+
+def archive_size(entry):
+    return entry['archive']['size'] if 'archive' in entry else entry['size']
+
+
+def add(backup_dir, manifest):
+    """Запись нового бэкапа (манифест с разделом archive: size, sha256)."""
+    with _locked(backup_dir):
+        entries, _ = _reconciled(backup_dir, _read(backup_dir))
+        entries[manifest['file']] = manifest
+        _write(backup_dir, entries)
+
+
+def update(backup_dir, fname, **fields):
+    """Дополняет запись архива (например, отметкой об удалённой копии)."""
+    with _locked(backup_dir):
+        entries, _ = _reconciled(backup_dir, _read(backup_dir))
+        if fname in entries:
+            entries[fname].update(fields)
+            _write(backup_dir, entries)
+
+
+def remove(backup_dir, files):
+    """Убирает записи удалённых архивов (после очистки старых копий)."""
+    with _locked(backup_dir):
+        entries, _ = _reconciled(backup_dir, _read(backup_dir))
+        for fname in files:
+            entries.pop(fname, None)
+        _write(backup_dir, entries)
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify(backup_dir, fname):
+    """
+    Проверка бэкапа по манифесту без восстановления. Возвращает {'ok', 'errors', 'checked'}:
+    checked — что удалось проверить (у архивов без манифеста — только наличие).
+    """
+    path = os.path.join(backup_dir, fname)
+    if not os.path.exists(path):
+        return {'ok': False, 'errors': [f'Файл не найден: {fname}'], 'checked': []}
+    entry = {e['file']: e for e in backups(backup_dir)}.get(fname, {})
+    errors, checked = [], []
+
+    archive = entry.get('archive')
+    if archive:
+        size = os.path.getsize(path)
+        if size != archive['size']:
+            errors.append(f'Размер архива {size} Б, в манифесте {archive["size"]} Б')
+        elif sha256_file(path) != archive['sha256']:
+            errors.append('Контрольная сумма архива не совпадает с манифестом')
+        checked.append('архив (SHA-256)')
+
+    media_manifest = backup_media.manifest_path(backup_dir, archive_stem(fname))
+    if os.path.exists(media_manifest):
+        files = backup_media.read_manifest(media_manifest)
+        missing = backup_media.missing_blobs(files, backup_dir)
+        if missing:
+            errors.append(f'Нет в хранилище медиа: {len(missing)} файлов (' + ', '.join(missing[:5]) + ')')
+        else:
+            damaged = [
+                rel for rel, sha, size, _ in files
+                if os.path.getsize(backup_media.blob_path(backup_dir, sha)) != size
+            ]
+            if damaged:
+                errors.append(f'Размер блобов медиа не совпадает: {len(damaged)} (' + ', '.join(damaged[:5]) + ')')
+        checked.append(f'медиа ({len(files)} файлов)')
+
+    return {'ok': not errors, 'errors': errors, 'checked': checked}
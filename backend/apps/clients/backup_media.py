@@ -0,0 +1,243 @@
+"""
+Медиафайлы в бэкапах: контентно-адресуемое хранилище с дедупликацией между копиями.
+
+Файл хранится один раз под именем своего SHA-256 в BACKUP_DIR/media-blobs/objects/ab/abcd…,
+бэкап содержит только манифест media.json — [путь, sha256, размер, mtime_ns] каждого файла.
+Семь ежедневных копий стоят одной полной копии медиа и изменений между ними.
+
+Ночной бэкап — обход папки и копирование только новых файлов: хеш файла с теми же размером и
+mtime, что в прошлый раз (cache.json), не пересчитывается. Файл копируется с подсчётом хеша
+за одно чтение во временный и переименовывается — незаконченный блоб не появится под своим именем.
+Жёсткие ссылки на живые файлы не используются: файл, изменённый на месте, испортил бы все копии.
+
+Копия манифеста каждого бэкапа лежит в media-blobs/manifests/: по ним gc() после удаления старых
+бэкапов удаляет блобы, на которые не ссылается ни одна оставшаяся копия.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+BLOB_DIR = 'media-blobs'
+MANIFEST_NAME = 'media.json'
+_CHUNK = 1024 * 1024
+# Проверка остановки — раз в столько файлов
+_STOP_EVERY = 200
+
+
+def _store_dir(backup_dir):
+    return os.path.join(backup_dir, BLOB_DIR)
+
+
+def blob_path(backup_dir, sha):
+    return os.path.join(_store_dir(backup_dir), 'objects', sha[:2], sha)
+
+
+def manifest_path(backup_dir, name):
+    """Копия манифеста бэкапа name в хранилище (её же кладут в архив как media.json)."""
+    return os.path.join(_store_dir(backup_dir), 'manifests', f'{name}.json')
+
+
+def write_json(path, data):
+    """Запись через временный файл: прерванная запись не оставит полупустой JSON."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def read_json(path, default):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _copy_hashed(src, dst_dir):
+    """Копирует src во временный файл в dst_dir, считая SHA-256. Возвращает (sha, временный путь)."""
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=dst_dir, prefix='.tmp-')
+    try:
+        with open(src, 'rb') as fin, os.fdopen(fd, 'wb') as fout:
+            for chunk in iter(lambda: fin.read(_CHUNK), b''):
+                digest.update(chunk)
+                fout.write(chunk)
+    except Exception:
+        os.unlink(tmp)
+        raise
+    return digest.hexdigest(), tmp
+
+
+def _store(backup_dir, src):
+    """Кладёт файл в хранилище. Возвращает (sha, True — блоб новый)."""
+    incoming = os.path.join(_store_dir(backup_dir), 'objects')
+    os.makedirs(incoming, exist_ok=True)
+    sha, tmp = _copy_hashed(src, incoming)
+    dst = blob_path(backup_dir, sha)
+    if os.path.exists(dst):
+        os.unlink(tmp)
+        return sha, False
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(tmp, dst)
+    return sha, True
+
+
+def _walk(media_dir):
+    for dirpath, dirnames, filenames in os.walk(media_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            full = os.path.join(dirpath, name)
+            yield os.path.relpath(full, media_dir).replace(os.sep, '/'), full
+
+
+def snapshot(media_dir, backup_dir, name, stop=None):
+    """
+    Снимок media_dir для бэкапа name: новые файлы — в хранилище, манифест — в manifest_path().
+    Возвращает {'files', 'size', 'new_files', 'new_size'} или None, если остановлено через stop().
+    """
+    store = _store_dir(backup_dir)
+    cache_path = os.path.join(store, 'cache.json')
+    cache = read_json(cache_path, {})
+    files, new_cache = [], {}
+    stats = {'files': 0, 'size': 0, 'new_files': 0, 'new_size': 0}
+
+    if os.path.isdir(media_dir):
+        for i, (rel, full) in enumerate(_walk(media_dir)):
+            if stop is not None and i % _STOP_EVERY == 0 and stop():
+                return None
+            try:
+                st = os.stat(full)
+            except FileNotFoundError:
+                continue   # удалён во время обхода
+            cached = cache.get(rel)
+            if (cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns
+                    and os.path.exists(blob_path(backup_dir, cached[2]))):
+                sha = cached[2]
+            else:
+                sha, created = _store(backup_dir, full)
+                if created:
+                    stats['new_files'] += 1
+                    stats['new_size'] += st.st_size
+            files.append([rel, sha, st.st_size, st.st_mtime_ns])
+            new_cache[rel] = [st.st_size, st.st_mtime_ns, sha]
+            stats['files'] += 1
+            stats['size'] += st.st_size
+
+    write_json(manifest_path(backup_dir, name), {'version': 1, 'files': files})
+    write_json(cache_path, new_cache)
+    return stats
+
+
+def read_manifest(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['files']
+
+
+def missing_blobs(files, backup_dir):
+    """Файлы манифеста, блобов которых нет в хранилище (проверка до начала восстановления)."""
+    return [f[0] for f in files if not os.path.exists(blob_path(backup_dir, f[1]))]
+
+
+def _same(path, size, sha):
+    try:
+        if os.path.getsize(path) != size:
+            return False
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b''):
+                digest.update(chunk)
+        return digest.hexdigest() == sha
+    except OSError:
+        return False
+
+
+def _sync(entries, media_dir):
+    """entries — [(путь, sha256, размер, mtime_ns, источник)]; см. restore()."""
+    stats = {'copied': 0, 'kept': 0, 'removed': 0}
+    wanted = set()
+    for rel, sha, size, mtime_ns, src in entries:
+        wanted.add(rel)
+        dst = os.path.join(media_dir, *rel.split('/'))
+        if _same(dst, size, sha):
+            stats['kept'] += 1
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        _, tmp = _copy_hashed(src, os.path.dirname(dst))
+        os.replace(tmp, dst)
+        os.utime(dst, ns=(mtime_ns, mtime_ns))
+        stats['copied'] += 1
+
+    if os.path.isdir(media_dir):
+        for rel, full in list(_walk(media_dir)):
+            if rel not in wanted:
+                os.remove(full)
+                stats['removed'] += 1
+        for dirpath, dirnames, filenames in os.walk(media_dir, topdown=False):
+            if dirpath != media_dir and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+    return stats
+
+
+def restore(files, media_dir, backup_dir):
+    """
+    Приводит media_dir к манифесту: отличающиеся и отсутствующие файлы копируются из хранилища
+    (через временный файл и переименование), лишние удаляются. Совпадающие не переписываются.
+    Возвращает {'copied', 'kept', 'removed'}.
+    """
+    return _sync(
+        [(rel, sha, size, mtime_ns, blob_path(backup_dir, sha)) for rel, sha, size, mtime_ns in files], media_dir,
+    )
+
+
+def restore_dir(src_dir, media_dir):
+    """Как restore(), но из папки media/ бэкапа старого формата (без хранилища)."""
+    entries = []
+    for rel, full in _walk(src_dir):
+        st = os.stat(full)
+        digest = hashlib.sha256()
+        with open(full, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b''):
+                digest.update(chunk)
+        entries.append((rel, digest.hexdigest(), st.st_size, st.st_mtime_ns, full))
+    return _sync(entries, media_dir)
+
+
+def gc(backup_dir, keep):
+    """
+    Удаляет манифесты бэкапов не из keep (имена без расширения) и блобы, на которые не ссылается
+    ни один оставшийся манифест. Возвращает {'blobs', 'removed', 'removed_size', 'size'}.
+    """
+    store = _store_dir(backup_dir)
+    manifests_dir = os.path.join(store, 'manifests')
+    referenced = set()
+    if os.path.isdir(manifests_dir):
+        for fname in os.listdir(manifests_dir):
+            path = os.path.join(manifests_dir, fname)
+            if fname[:-len('.json')] not in keep:
+                os.remove(path)
+                continue
+            referenced.update(f[1] for f in read_json(path, {}).get('files', []))
+
+    stats = {'blobs': 0, 'removed': 0, 'removed_size': 0, 'size': 0}
+    objects = os.path.join(store, 'objects')
+    if not os.path.isdir(objects):
+        return stats
+    for prefix in os.listdir(objects):
+        sub = os.path.join(objects, prefix)
+        if not os.path.isdir(sub):
+            os.remove(sub)   # .tmp- — незаконченная запись прерванного бэкапа
+            continue
+        for sha in os.listdir(sub):
+            path = os.path.join(sub, sha)
+            size = os.path.getsize(path)
+            if sha in referenced:
+                stats['blobs'] += 1
+                stats['size'] += size
+            else:
+                os.remove(path)
+                stats['removed'] += 1
+                stats['removed_size'] += size
+    return stats
@@ -0,0 +1,451 @@
+"""
+Удалённая копия бэкапов в S3-совместимом хранилище (Yandex Object Storage, MinIO, AWS S3 …).
+
+Включается BACKUP_S3_ENDPOINT и BACKUP_S3_BUCKET; запросы подписываются AWS Signature V4 через
+urllib, без boto3. Адрес — path-style: <endpoint>/<bucket>/<ключ>. Раскладка в бакете (BACKUP_S3_PREFIX):
+  archives/<архив>            — архивы бэкапов;
+  manifests/<имя>.json        — манифесты медиа (media.json) для восстановления и очистки блобов;
+  media-blobs/ab/<sha256>     — блобы медиа, каждый один раз, как в локальном хранилище.
+
+replicate() — этап после бэкапа: выгружает все архивы из индекса без отметки remote (новые первыми),
+так что не доехавшая в прошлый раз копия догружается следующим запуском. Архив больше одной части
+(BACKUP_S3_PART_MB) идёт multipart-загрузкой в BACKUP_S3_CONCURRENCY потоков; upload id и номера
+частей пишутся в BACKUP_DIR/.s3-upload/ — прерванная загрузка продолжается с недостающих частей
+(список уже принятых — ListParts). Блобы медиа выгружаются только те, которых нет в бакете.
+
+Скорость ограничивается общим на все потоки BACKUP_S3_BANDWIDTH_KBPS; с BACKUP_S3_BANDWIDTH_HOURS
+(например, 8-21) — только в эти часы, ночью канал свободен.
+
+Хранение: в бакете остаются BACKUP_S3_KEEP последних архивов (локально — 7), блобы, на которые
+не ссылается ни один оставшийся манифест, удаляются.
+"""
+
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import backup_index, backup_media
+from .backup_archive import archive_stem
+
+_NS = {'s3': 'http://s3.amazonaws.com/doc/2006-03-01/'}
+_EMPTY_SHA = hashlib.sha256(b'').hexdigest()
+_CHUNK = 64 * 1024
+_STATE_DIR = '.s3-upload'
+_RETRIES = 3
+
+
+def enabled():
+    return bool(settings.BACKUP_S3_ENDPOINT and settings.BACKUP_S3_BUCKET)
+
+
+class RemoteError(Exception):
+    pass
+
+
+# ── Подпись и запросы ─────────────────────────────────────
+
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+def sign(method, url, headers, payload_sha, access_key, secret_key, region, now=None):
+    """
+    Заголовки запроса с подписью AWS Signature V4 (сервис s3). url — уже закодированный (путь
+    S3 кодируется один раз), headers — дополнительные заголовки, они тоже подписываются.
+    Возвращает новый словарь заголовков.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    day = amz_date[:8]
+    parts = urllib.parse.urlsplit(url)
+    signed = {k.lower(): str(v).strip() for k, v in headers.items()}
+    signed.update({'host': parts.netloc, 'x-amz-content-sha256': payload_sha, 'x-amz-date': amz_date})
+    names = sorted(signed)
+    query = sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True))
+    canonical = '\n'.join([
+        method,
+        parts.path or '/',
+        '&'.join(f'{urllib.parse.quote(k, safe="-_.~")}={urllib.parse.quote(v, safe="-_.~")}' for k, v in query),
+        ''.join(f'{n}:{signed[n]}\n' for n in names),
+        ';'.join(names),
+        payload_sha,
+    ])
+    scope = f'{day}/{region}/s3/aws4_request'
+    to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+    key = _hmac(_hmac(_hmac(_hmac(f'AWS4{secret_key}'.encode(), day), region), 's3'), 'aws4_request')
+    signature = hmac.new(key, to_sign.encode(), hashlib.sha256).hexdigest()
+    signed['authorization'] = (
+        f'AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={";".join(names)}, Signature={signature}'
+    )
+    del signed['host']
+    return signed
+
+
+class _Throttle:
+    """Общее на все потоки ограничение скорости (токены — байты в секунду)."""
+
+    def __init__(self, kbps, hours):
+        self.rate = kbps * 1024
+        self.hours = _parse_hours(hours)
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def _active(self):
+        if not self.rate:
+            return False
+        if self.hours is None:
+            return True
+        start, end = self.hours
+        hour = timezone.localtime().hour
+        return start <= hour < end if start <= end else (hour >= start or hour < end)
+
+    def take(self, n):
+        if not self._active():
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + n / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def _parse_hours(value):
+    """'8-21' → (8, 21); пусто — ограничение круглые сутки."""
+    if not value:
+        return None
+    start, _, end = value.partition('-')
+    return int(start), int(end)
+
+
+class _Body:
+    """Тело запроса из памяти с ограничением скорости (urllib читает блоками)."""
+
+    def __init__(self, data, throttle):
+        self._data = memoryview(data)
+        self._pos = 0
+        self._throttle = throttle
+
+    def read(self, n=-1):
+        n = _CHUNK if n is None or n < 0 else min(n, _CHUNK)
+        chunk = self._data[self._pos:self._pos + n]
+        self._pos += len(chunk)
+        if chunk:
+            self._throttle.take(len(chunk))
+        return bytes(chunk)
+
+
+class Client:
+    """Минимальный клиент S3: объекты, листинг, multipart."""
+
+    def __init__(self, throttle=None):
+        self.endpoint = settings.BACKUP_S3_ENDPOINT.rstrip('/')
+        self.bucket = settings.BACKUP_S3_BUCKET
+        self.prefix = settings.BACKUP_S3_PREFIX
+        self.throttle = throttle or _Throttle(settings.BACKUP_S3_BANDWIDTH_KBPS, settings.BACKUP_S3_BANDWIDTH_HOURS)
+
+    def _url(self, key='', query=None):
+        url = f'{self.endpoint}/{self.bucket}'
+        if key:
+            url += '/' + urllib.parse.quote(self.prefix + key, safe='/-_.~')
+        if query:
+            url += '?' + urllib.parse.urlencode(query, quote_via=urllib.parse.quote)
+        return url
+
+    def request(self, method, key='', query=None, data=b'', headers=None):
+        """Запрос с подписью и повторами при сетевых ошибках и 5xx. Возвращает (заголовки, тело)."""
+        url = self._url(key, query)
+        payload_sha = hashlib.sha256(data).hexdigest() if data else _EMPTY_SHA
+        for attempt in range(_RETRIES):
+            signed = sign(
+                method, url, dict(headers or {}), payload_sha,
+                settings.BACKUP_S3_ACCESS_KEY, settings.BACKUP_S3_SECRET_KEY, settings.BACKUP_S3_REGION,
+            )
+            if data:
+                signed['content-length'] = str(len(data))
+            req = urllib.request.Request(
+                url, data=_Body(data, self.throttle) if data else None, headers=signed, method=method,
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=settings.BACKUP_S3_TIMEOUT) as r:
+                    return r.headers, r.read()
+            except urllib.error.HTTPError as e:
+                body = e.read()[:500].decode('utf-8', 'replace')
+                if e.code < 500 or attempt == _RETRIES - 1:
+                    raise RemoteError(f'{method} {key or self.bucket}: HTTP {e.code} {body}') from None
+            except OSError as e:
+                if attempt == _RETRIES - 1:
+                    raise RemoteError(f'{method} {key or self.bucket}: {e}') from None
+            time.sleep(2 ** attempt)
+
+    def put(self, key, data):
+        self.request('PUT', key, data=data)
+
+    def get(self, key):
+        return self.request('GET', key)[1]
+
+    def delete(self, key):
+        self.request('DELETE', key)
+
+    def list(self, prefix):
+        """Ключи (без BACKUP_S3_PREFIX) с размером: {ключ: размер}."""
+        result, token = {}, None
+        while True:
+            query = {'list-type': '2', 'prefix': self.prefix + prefix}
+            if token:
+                query['continuation-token'] = token
+            root = ET.fromstring(self.request('GET', query=query)[1])
+            for item in root.findall('s3:Contents', _NS):
+                key = item.find('s3:Key', _NS).text[len(self.prefix):]
+                result[key] = int(item.find('s3:Size', _NS).text)
+            if root.findtext('s3:IsTruncated', namespaces=_NS) != 'true':
+                return result
+            token = root.findtext('s3:NextContinuationToken', namespaces=_NS)
+
+    # ── multipart ──
+
+    def create_upload(self, key):
+        root = ET.fromstring(self.request('POST', key, query={'uploads': ''})[1])
+        return root.findtext('s3:UploadId', namespaces=_NS)
+
+    def upload_part(self, key, upload_id, number, data):
+        headers, _ = self.request('PUT', key, query={'partNumber': str(number), 'uploadId': upload_id}, data=data)
+        return headers['ETag']
+
+    def list_parts(self, key, upload_id):
+        """Принятые части: {номер: etag}. RemoteError — загрузки уже нет."""
+        parts, marker = {}, None
+        while True:
+            query = {'uploadId': upload_id}
+            if marker:
+                query['part-number-marker'] = marker
+            root = ET.fromstring(self.request('GET', key, query=query)[1])
+            for part in root.findall('s3:Part', _NS):
+                parts[int(part.findtext('s3:PartNumber', namespaces=_NS))] = part.findtext('s3:ETag', namespaces=_NS)
+            if root.findtext('s3:IsTruncated', namespaces=_NS) != 'true':
+                return parts
+            marker = root.findtext('s3:NextPartNumberMarker', namespaces=_NS)
+
+    def complete_upload(self, key, upload_id, parts):
+        body = '<CompleteMultipartUpload>' + ''.join(
+            f'<Part><PartNumber>{n}</PartNumber><ETag>{etag}</ETag></Part>' for n, etag in sorted(parts.items())
+        ) + '</CompleteMultipartUpload>'
+        _, data = self.request('POST', key, query={'uploadId': upload_id}, data=body.encode())
+        # Ошибка сборки приходит с кодом 200 в теле ответа
+        if b'<Error>' in data:
+            raise RemoteError(f'CompleteMultipartUpload {key}: {data[:500].decode("utf-8", "replace")}')
+
+    def abort_upload(self, key, upload_id):
+        self.request('DELETE', key, query={'uploadId': upload_id})
+
+
+# ── Выгрузка ──────────────────────────────────────────────
+
+def _state_path(backup_dir, fname):
+    return os.path.join(backup_dir, _STATE_DIR, fname + '.json')
+
+
+def _read_part(path, number, part_size):
+    with open(path, 'rb') as f:
+        f.seek((number - 1) * part_size)
+        return f.read(part_size)
+
+
+def _upload_file(client, path, key, stop, on_bytes, state_dir=None):
+    """
+    Файл в бакет: одна часть — PUT, больше — multipart с продолжением по сохранённому upload id
+    (в state_dir/.s3-upload/, по умолчанию — папка файла).
+    Возвращает False, если остановлено через stop() (загрузка продолжится в следующий раз).
+    """
+    size = os.path.getsize(path)
+    part_size = int(settings.BACKUP_S3_PART_MB * 1024 * 1024)
+    if size <= part_size:
+        with open(path, 'rb') as f:
+            client.put(key, f.read())
+        on_bytes(size)
+        return True
+
+    folder, fname = os.path.split(path)
+    state_path = _state_path(state_dir or folder, fname)
+    state = backup_media.read_json(state_path, None)
+    done = {}
+    if state and state.get('size') == size and state.get('part_size') == part_size:
+        try:
+            done = client.list_parts(key, state['upload_id'])
+        except RemoteError:
+            state = None   # загрузку уже убрали (очистка незавершённых на стороне хранилища)
+    else:
+        state = None
+    if state is None:
+        state = {'upload_id': client.create_upload(key), 'size': size, 'part_size': part_size}
+        backup_media.write_json(state_path, state)
+
+    count = (size + part_size - 1) // part_size
+    on_bytes(sum(min(part_size, size - (n - 1) * part_size) for n in done))
+    cancel = threading.Event()
+
+    def _part(number):
+        if cancel.is_set():
+            return number, None
+        data = _read_part(path, number, part_size)
+        etag = client.upload_part(key, state['upload_id'], number, data)
+        return number, (etag, len(data))
+
+    with ThreadPoolExecutor(max_workers=max(settings.BACKUP_S3_CONCURRENCY, 1)) as pool:
+        futures = [pool.submit(_part, n) for n in range(1, count + 1) if n not in done]
+        try:
+            for future in as_completed(futures):
+                number, result = future.result()
+                if result is not None:
+                    done[number] = result[0]
+                    on_bytes(result[1])
+                if stop is not None and stop():
+                    cancel.set()
+        except BaseException:
+            cancel.set()
+            raise
+    if len(done) < count:
+        return False
+    client.complete_upload(key, state['upload_id'], done)
+    os.remove(state_path)
+    return True
+
+
+def _upload_blobs(client, backup_dir, files, stop, remote):
+    """
+    Блобы манифеста, которых нет в бакете. Возвращает (выгружено, байт) или None, если остановлено.
+    remote — ключи media-blobs/ в бакете (список берётся один раз на репликацию), выгруженные
+    добавляются в него, чтобы следующий архив их не выгружал повторно.
+    Блобы до одной части — PUT в BACKUP_S3_CONCURRENCY потоков; крупнее (видео, архивы в FAQ) —
+    по одному через _upload_file: multipart с продолжением, в память читается только часть.
+    """
+    part_size = int(settings.BACKUP_S3_PART_MB * 1024 * 1024)
+    small, large = {}, {}
+    for _, sha, size, _ in files:
+        if f'media-blobs/{sha[:2]}/{sha}' not in remote:
+            (large if size > part_size else small)[sha] = size
+    uploaded = [0, 0]
+    lock = threading.Lock()
+
+    def _blob(sha):
+        key = f'media-blobs/{sha[:2]}/{sha}'
+        with open(backup_media.blob_path(backup_dir, sha), 'rb') as f:
+            client.put(key, f.read())
+        with lock:
+            remote.add(key)
+            uploaded[0] += 1
+            uploaded[1] += small[sha]
+
+    with ThreadPoolExecutor(max_workers=max(settings.BACKUP_S3_CONCURRENCY, 1)) as pool:
+        futures = []
+        for sha in small:
+            if stop is not None and stop():
+                break
+            futures.append(pool.submit(_blob, sha))
+        for future in futures:
+            future.result()
+    if len(futures) < len(small):
+        return None
+
+    for sha, size in large.items():
+        if stop is not None and stop():
+            return None
+        key = f'media-blobs/{sha[:2]}/{sha}'
+        if not _upload_file(client, backup_media.blob_path(backup_dir, sha), key, stop, lambda n: None,
+                            state_dir=backup_dir):
+            return None
+        remote.add(key)
+        uploaded[0] += 1
+        uploaded[1] += size
+    return tuple(uploaded)
+
+
+def _apply_retention(client, keep):
+    """В бакете — keep последних архивов; блобы без ссылок из оставшихся манифестов удаляются."""
+    archives = sorted((k for k in client.list('archives/') if k != 'archives/'), reverse=True)
+    removed = archives[keep:]
+    for key in removed:
+        client.delete(key)
+    kept = {archive_stem(os.path.basename(k)) for k in archives[:keep]}
+
+    referenced = set()
+    for key in client.list('manifests/'):
+        name = os.path.basename(key)[:-len('.json')]
+        if name not in kept:
+            client.delete(key)
+            continue
+        referenced.update(f[1] for f in json.loads(client.get(key))['files'])
+    blobs = 0
+    for key in client.list('media-blobs/'):
+        if os.path.basename(key) not in referenced:
+            client.delete(key)
+            blobs += 1
+    return len(removed), blobs
+
+
+def replicate(backup_dir, stop=None, on_progress=None):
+    """
+    Выгружает в бакет архивы без удалённой копии, их медиа и применяет хранение.
+    Возвращает {'archives', 'bytes', 'blobs', 'blob_bytes', 'removed', 'removed_blobs', 'stopped'}.
+    on_progress(байт, всего) — по мере выгрузки архивов.
+    Любой сбой — RemoteError: локальные ошибки чтения и непонятный ответ хранилища тоже
+    (бэкап при этом считается сделанным, ошибка идёт в итог задания).
+    """
+    try:
+        return _replicate(backup_dir, stop, on_progress)
+    except (OSError, ET.ParseError, ValueError) as e:
+        raise RemoteError(f'{type(e).__name__}: {e}') from e
+
+
+def _replicate(backup_dir, stop, on_progress):
+    client = Client()
+    pending = [e for e in backup_index.backups(backup_dir) if not e.get('remote')]
+    total = sum(backup_index.archive_size(e) for e in pending)
+    stats = {'archives': 0, 'bytes': 0, 'blobs': 0, 'blob_bytes': 0, 'removed': 0, 'removed_blobs': 0,
+             'stopped': False}
+    sent = [0]
+    lock = threading.Lock()
+    remote_blobs = None
+
+    def _on_bytes(n):
+        with lock:
+            sent[0] += n
+            if on_progress is not None:
+                on_progress(sent[0], total)
+
+    for entry in pending:
+        fname = entry['file']
+        media_manifest = backup_media.manifest_path(backup_dir, entry['name'])
+        if os.path.exists(media_manifest):
+            if remote_blobs is None:
+                remote_blobs = set(client.list('media-blobs/'))
+            blobs = _upload_blobs(client, backup_dir, backup_media.read_manifest(media_manifest), stop,
+                                  remote_blobs)
+            if blobs is None:
+                stats['stopped'] = True
+                return stats
+            stats['blobs'] += blobs[0]
+            stats['blob_bytes'] += blobs[1]
+            with open(media_manifest, 'rb') as f:
+                client.put(f'manifests/{entry["name"]}.json', f.read())
+        if not _upload_file(client, os.path.join(backup_dir, fname), f'archives/{fname}', stop, _on_bytes):
+            stats['stopped'] = True
+            return stats
+        backup_index.update(backup_dir, fname, remote={'uploaded_at': time.time()})
+        stats['archives'] += 1
+        stats['bytes'] += backup_index.archive_size(entry)
+
+    stats['removed'], stats['removed_blobs'] = _apply_retention(client, settings.BACKUP_S3_KEEP)
+    return stats
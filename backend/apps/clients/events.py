@@ -0,0 +1,153 @@
+"""
+Изменения состояния регламентных заданий (ScheduledTask) для push-канала (SSE / long-poll).
+
+На PostgreSQL триггер (миграция 0039) при изменении status / progress / progress_text делает
+pg_notify('scheduled_task', task_id) — из любого процесса: воркера, веб-сервера, manage.py.
+В процессе веб-сервера один поток слушает канал (LISTEN) только пока есть хоть один подписчик
+и будит ожидающие запросы. На других СУБД тот же поток раз в секунду сравнивает состояние заданий.
+
+Подписчик не делает запросов к БД, пока задание не изменилось: открытая вкладка без запущенных
+заданий не создаёт нагрузки, кроме keepalive-комментария в потоке.
+"""
+
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections
+
+CHANNEL = 'scheduled_task'
+# Проверка «остались ли подписчики» и переподключение после ошибки, сек
+_IDLE_CHECK = 1.0
+
+
+class _Hub:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._changed = {}      # task_id → seq последнего изменения
+        self._subscribers = 0
+        self._thread = None
+
+    @property
+    def seq(self):
+        with self._cond:
+            return self._seq
+
+    def subscribe(self, limit=None):
+        with self._cond:
+            if limit is not None and self._subscribers >= limit:
+                return False
+            self._subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='task-events', daemon=True)
+                self._thread.start()
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def publish(self, task_ids):
+        with self._cond:
+            for task_id in task_ids:
+                self._seq += 1
+                self._changed[task_id] = self._seq
+            self._cond.notify_all()
+
+    def wait(self, since, task_ids=None, timeout=None):
+        """
+        Ждёт изменения заданий после seq=since (task_ids=None — любых).
+        Возвращает (seq, [изменившиеся task_id]); пустой список — истёк timeout.
+        """
+        def _changed():
+            return [t for t, s in self._changed.items() if s > since and (task_ids is None or t in task_ids)]
+
+        with self._cond:
+            self._cond.wait_for(_changed, timeout)
+            return self._seq, _changed()
+
+    def _idle(self):
+        with self._cond:
+            return self._subscribers <= 0
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    # Решение о выходе — под той же блокировкой, что и запуск потока в subscribe()
+                    if self._subscribers <= 0:
+                        self._thread = None
+                        return
+                try:
+                    if connection.vendor == 'postgresql':
+                        self._listen()
+                    else:
+                        self._poll()
+                except Exception:
+                    time.sleep(_IDLE_CHECK)
+        finally:
+            connection.close()
+
+    def _listen(self):
+        """LISTEN на отдельном соединении psycopg2 (вне пула Django, в autocommit)."""
+        wrapper = connections['default']
+        raw = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            while not self._idle():
+                if select.select([raw], [], [], _IDLE_CHECK)[0]:
+                    raw.poll()
+                    task_ids = {n.payload for n in raw.notifies}
+                    raw.notifies.clear()
+                    if task_ids:
+                        self.publish(task_ids)
+        finally:
+            raw.close()
+
+    def _poll(self):
+        from .models import ScheduledTask
+        last = None
+        while not self._idle():
+            state = {
+                row[0]: row[1:]
+                for row in ScheduledTask.objects.values_list('task_id', 'status', 'progress', 'progress_text')
+            }
+            if last is not None:
+                changed = [t for t, s in state.items() if last.get(t) != s]
+                if changed:
+                    self.publish(changed)
+            last = state
+            time.sleep(_IDLE_CHECK)
+
+
+_hub = _Hub()
+
+
+def subscribe():
+    """
+    Регистрирует ожидающий запрос. False — в процессе уже TASK_EVENTS_MAX_WAITERS ожидающих
+    (каждый занимает поток gunicorn), запрос должен ответить сразу.
+    """
+    return _hub.subscribe(settings.TASK_EVENTS_MAX_WAITERS)
+
+
+def unsubscribe():
+    _hub.unsubscribe()
+
+
+def current_seq():
+    return _hub.seq
+
+
+def wait(since, task_ids=None, timeout=None):
+    return _hub.wait(since, task_ids, timeout)
+
+
+
+def publish(task_ids):
+    """Изменение, записанное в этом процессе: ожидающие запросы просыпаются, не дожидаясь LISTEN/опроса."""
+    _hub.publish(task_ids)
@@ -0,0 +1,452 @@
+"""
+Фоновые задания: очередь в БД (BackgroundJob) и отдельный процесс-воркер (manage.py run_worker).
+
+HTTP-запрос только ставит задание и сразу возвращает job_id, фронтенд опрашивает
+/api/clients/jobs/{job_id}/. Воркер берёт из очереди готовое задание с наибольшим приоритетом
+(SELECT … FOR UPDATE SKIP LOCKED — два воркера не получат одно задание), выполняет его в потоке
+и раз в JOBS_HEARTBEAT сек отмечается в heartbeat_at. Задание, по которому отметок нет дольше
+JOBS_LEASE сек, считается потерянным (воркер упал или перезапущен) и ставится на повтор.
+
+Параметры типа задания задаются при регистрации:
+  priority     — приоритет по умолчанию (больше — раньше);
+  concurrency  — сколько заданий этого типа выполняется одновременно на всех воркерах (None — без лимита);
+  max_attempts — попыток при исключении или потере воркера, повтор — с растущей паузой;
+  timeout      — лимит времени выполнения, сек (по истечении — ошибка без повтора);
+  deadline     — мягкий лимит, сек: по истечении stop_reason() просит обработчик остановиться
+                 с частичным результатом (переопределяется в JOBS_DEADLINES), должен быть меньше timeout;
+  on_abort     — fn(job, error, cancelled=False), вызывается при окончательной ошибке не из результата
+                 обработчика (исключение, таймаут, потеря воркера) и при отмене задания из очереди —
+                 например, чтобы сбросить статус ScheduledTask.
+
+Остановка — кооперативная: cancel() у задания в очереди отменяет его сразу, у выполняемого ставит
+cancel_requested_at. Обработчик между пачками вызывает stop_reason() (отмена, мягкий лимит, потеря
+задания воркером), завершается сам и возвращает {'cancelled': причина, …} — статус «Остановлено».
+
+Повторный запуск с тем же dedup_key, пока задание активно, не создаёт второе задание —
+возвращается уже поставленное (уникальный индекс по dedup_key среди активных). Потерянное задание
+(без отметок дольше JOBS_LEASE) ключ не держит: active() / submit() завершают его ошибкой.
+
+Отметка heartbeat_at ставится только своей попытке (attempts): если задание уже вернули в очередь
+и его выполняет другой воркер, прежний узнаёт об этом через lease_lost(job) и должен остановиться.
+
+JOBS_EAGER=True — без воркера: задание выполняется в потоке процесса, который его поставил
+(для разработки).
+"""
+
+import os
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+# Сколько хранить завершённые задания
+KEEP_FINISHED = timedelta(days=1)
+# Пауза перед повтором: RETRY_DELAY · 2^(попытка−1) сек, не больше RETRY_DELAY_MAX
+RETRY_DELAY = 30
+RETRY_DELAY_MAX = 3600
+
+# Не чаще (сек) проверка флага отмены в БД из stop_reason()
+CANCEL_CHECK_INTERVAL = 2
+
+_handlers = {}
+_options = {}
+_local = threading.local()
+
+
+def register(kind, priority=0, concurrency=None, max_attempts=1, timeout=None, deadline=None, on_abort=None):
+    """Декоратор: регистрирует функцию-обработчик задания. Сигнатура: fn(job, **params) → result."""
+    def decorator(fn):
+        _handlers[kind] = fn
+        _options[kind] = {
+            'priority':     priority,
+            'concurrency':  concurrency,
+            'max_attempts': max_attempts,
+            'timeout':      timeout,
+            'deadline':     deadline,
+            'on_abort':     on_abort,
+        }
+        return fn
+    return decorator
+
+
+def registered_kinds():
+    return list(_handlers)
+
+
+def deadline(kind):
+    """Мягкий лимит времени типа задания, сек (JOBS_DEADLINES важнее значения при регистрации)."""
+    if kind in settings.JOBS_DEADLINES:
+        return settings.JOBS_DEADLINES[kind]
+    return _options.get(kind, {}).get('deadline')
+
+
+def submit(kind, params=None, dedup_key='', user=None, priority=None):
+    """
+    Ставит задание в очередь.
+    Возвращает (job, created). created=False — найдено активное задание с тем же dedup_key.
+    """
+    from .models import BackgroundJob
+
+    if kind not in _handlers:
+        raise ValueError(f'Неизвестный тип задания: {kind}')
+    options = _options[kind]
+
+    _cleanup()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                job = BackgroundJob.objects.create(
+                    kind=kind, dedup_key=dedup_key, params=params or {}, user=user,
+                    priority=options['priority'] if priority is None else priority,
+                    max_attempts=options['max_attempts'],
+                    timeout=options['timeout'],
+                )
+        except IntegrityError:
+            existing = active(dedup_key)
+            if existing is None:
+                continue  # задание завершилось или потеряно — ключ свободен
+            return existing, False
+
+        if settings.JOBS_EAGER:
+            transaction.on_commit(
+                lambda: threading.Thread(target=_execute_eager, args=(job.pk,), daemon=True).start()
+            )
+        return job, True
+
+    raise RuntimeError(f'Не удалось поставить задание {kind}')
+
+
+def active(dedup_key):
+    """
+    Активное задание с этим dedup_key или None. Потерянное (воркер не отмечается дольше JOBS_LEASE)
+    завершается ошибкой с вызовом on_abort и ключ не держит.
+    """
+    from .models import BackgroundJob
+    job = BackgroundJob.objects.filter(dedup_key=dedup_key, status__in=BackgroundJob.ACTIVE_STATUSES).first()
+    if job is not None and _is_lost(job):
+        _fail(job, 'Задание прервано (перезапуск сервера)', retry=False)
+        return None
+    return job
+
+
+def set_progress(job, progress, text=''):
+    from .models import BackgroundJob
+    BackgroundJob.objects.filter(pk=job.pk).update(progress=progress, progress_text=text[:500])
+
+
+# ── Выборка из очереди ──────────────────────────────────────────────────────
+
+def claim(worker_id, kinds=None):
+    """
+    Берёт из очереди готовое задание с наибольшим приоритетом и помечает выполняемым.
+    Типы, у которых занят лимит concurrency, пропускаются. None — брать нечего.
+    """
+    from .models import BackgroundJob
+
+    allowed = [k for k in (kinds or _handlers) if k in _handlers]
+    while allowed:
+        with transaction.atomic():
+            job = (
+                BackgroundJob.objects.select_for_update(skip_locked=True)
+                .filter(status=BackgroundJob.STATUS_QUEUED, kind__in=allowed, run_after__lte=timezone.now())
+                .order_by('-priority', 'run_after', 'created_at')
+                .first()
+            )
+            if job is None:
+                return None
+            limit = _options[job.kind]['concurrency']
+            if limit and not _has_slot(job.kind, limit):
+                allowed.remove(job.kind)
+                continue
+            if _lock(job, worker_id):
+                return job
+    return None
+
+
+def _has_slot(kind, limit):
+    """Есть ли свободное место под задание типа kind. Вызывается внутри транзакции claim()."""
+    from .models import BackgroundJob
+    if connection.vendor == 'postgresql':
+        # Пересчёт выполняемых под блокировкой по типу: два воркера не займут последнее место вдвоём
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'jobs:{kind}'])
+    return BackgroundJob.objects.filter(kind=kind, status=BackgroundJob.STATUS_RUNNING).count() < limit
+
+
+def _lock(job, worker_id):
+    """queued → running. False — задание уже взял кто-то другой."""
+    from .models import BackgroundJob
+    now = timezone.now()
+    updated = BackgroundJob.objects.filter(pk=job.pk, status=BackgroundJob.STATUS_QUEUED).update(
+        status=BackgroundJob.STATUS_RUNNING, attempts=job.attempts + 1,
+        started_at=now, heartbeat_at=now, locked_by=worker_id[:100],
+    )
+    if updated:
+        job.status = BackgroundJob.STATUS_RUNNING
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = now
+        job.locked_by = worker_id[:100]
+    return bool(updated)
+
+
+# ── Выполнение ──────────────────────────────────────────────────────────────
+
+class _Heartbeat:
+    """
+    Раз в JOBS_HEARTBEAT сек отмечает в heartbeat_at все задания, выполняемые в этом процессе.
+    Отметка ставится только своей попытке: задание, которое уже вернули в очередь или взял
+    другой воркер, попадает в lost и больше не отмечается.
+    """
+
+    def __init__(self):
+        self._jobs = {}         # pk → attempts
+        self.lost = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.pk] = job.attempts
+            self.lost.discard(job.pk)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='jobs-heartbeat', daemon=True)
+                self._thread.start()
+
+    def discard(self, job):
+        with self._lock:
+            self._jobs.pop(job.pk, None)
+            self.lost.discard(job.pk)
+
+    def _run(self):
+        from django.db.models import Q
+        from .models import BackgroundJob
+        while True:
+            time.sleep(settings.JOBS_HEARTBEAT)
+            with self._lock:
+                owned = dict(self._jobs)
+            if not owned:
+                continue
+            try:
+                match = Q()
+                for pk, attempts in owned.items():
+                    match |= Q(pk=pk, attempts=attempts)
+                alive = set(BackgroundJob.objects.filter(
+                    match, status=BackgroundJob.STATUS_RUNNING,
+                ).values_list('pk', flat=True))
+                if alive:
+                    BackgroundJob.objects.filter(pk__in=alive).update(heartbeat_at=timezone.now())
+                with self._lock:
+                    for pk in set(owned) - alive:
+                        if self._jobs.pop(pk, None) is not None:
+                            self.lost.add(pk)
+            except Exception:
+                connection.close()  # переподключимся на следующей отметке
+
+
+_heartbeat = _Heartbeat()
+
+
+def lease_lost(job):
+    """Эта попытка больше не владеет заданием (вернули в очередь / взял другой воркер / завершено)."""
+    return job.pk in _heartbeat.lost
+
+
+def current():
+    """Задание, обработчик которого выполняется в этом потоке, или None."""
+    return getattr(_local, 'job', None)
+
+
+def cancel(job, reason='Остановлено пользователем'):
+    """
+    Остановка задания. В очереди — отменяется сразу (с on_abort), возвращает 'cancelled';
+    выполняется — ставится флаг для stop_reason(), возвращает 'requested'; уже завершено — None.
+    """
+    from .models import BackgroundJob
+    now = timezone.now()
+    updated = BackgroundJob.objects.filter(pk=job.pk, status=BackgroundJob.STATUS_QUEUED).update(
+        status=BackgroundJob.STATUS_CANCELLED, finished_at=now, cancel_requested_at=now,
+        result={'cancelled': reason}, progress_text=reason[:500],
+    )
+    if updated:
+        on_abort = _options.get(job.kind, {}).get('on_abort')
+        if on_abort:
+            try:
+                on_abort(job, reason, cancelled=True)
+            except Exception:
+                pass
+        return 'cancelled'
+    updated = BackgroundJob.objects.filter(pk=job.pk, status=BackgroundJob.STATUS_RUNNING).update(
+        cancel_requested_at=now, progress_text=f'{reason}, ожидаем остановки...'[:500],
+    )
+    return 'requested' if updated else None
+
+
+def stop_reason(job=None):
+    """
+    Причина остановиться или None. Вызывается обработчиком между пачками (без job — задание
+    этого потока): отмена (флаг читается из БД не чаще раза в CANCEL_CHECK_INTERVAL сек),
+    мягкий лимит времени, потеря задания воркером. Первая причина запоминается.
+    """
+    from .models import BackgroundJob
+    job = job or current()
+    if job is None:
+        return None
+    reason = getattr(job, '_stop_reason', None)
+    if reason:
+        return reason
+    limit = deadline(job.kind)
+    if lease_lost(job):
+        reason = 'задание передано другому воркеру'
+    elif limit and job.started_at and (timezone.now() - job.started_at).total_seconds() > limit:
+        reason = f'превышен лимит времени ({limit} сек)'
+    elif time.monotonic() - getattr(job, '_cancel_checked', 0.0) >= CANCEL_CHECK_INTERVAL:
+        job._cancel_checked = time.monotonic()
+        if BackgroundJob.objects.filter(pk=job.pk, cancel_requested_at__isnull=False).exists():
+            reason = 'остановлено пользователем'
+    job._stop_reason = reason
+    return reason
+
+
+def run(job):
+    """
+    Выполняет взятое задание (status=running) и записывает результат.
+    Обработчик работает в отдельном потоке: по истечении timeout задание завершается ошибкой.
+    Сам поток прервать нельзя — он дорабатывает в фоне, но его результат уже не запишется.
+    """
+    from .models import BackgroundJob
+
+    outcome = {}
+
+    def _target():
+        _local.job = job
+        try:
+            outcome['result'] = _handlers[job.kind](job, **job.params)
+        except Exception as e:
+            outcome['error'] = str(e) or e.__class__.__name__
+            outcome['traceback'] = traceback.format_exc()[-500:]
+        finally:
+            _local.job = None
+            connection.close()
+
+    _heartbeat.add(job)
+    try:
+        thread = threading.Thread(target=_target, name=f'job-{job.kind}', daemon=True)
+        thread.start()
+        thread.join(job.timeout)
+        if thread.is_alive():
+            _fail(job, f'Превышено время выполнения ({job.timeout} сек)', retry=False)
+        elif 'error' in outcome:
+            _fail(job, outcome['error'], outcome['traceback'])
+        else:
+            result = outcome.get('result')
+            if isinstance(result, dict) and result.get('cancelled'):
+                status = BackgroundJob.STATUS_CANCELLED
+            elif isinstance(result, dict) and 'error' in result:
+                status = BackgroundJob.STATUS_ERROR
+            else:
+                status = BackgroundJob.STATUS_SUCCESS
+            _finish(job, status, result=result)
+    finally:
+        _heartbeat.discard(job)
+
+
+def _execute_eager(job_id):
+    """JOBS_EAGER: выполнение в потоке процесса, поставившего задание."""
+    from .models import BackgroundJob
+    try:
+        job = BackgroundJob.objects.get(pk=job_id)
+        if _lock(job, f'eager:{os.getpid()}'):
+            run(job)
+    finally:
+        connection.close()
+
+
+def _attempt_qs(job):
+    """Запись именно этой попытки: поздний результат брошенной попытки не перезапишет следующую."""
+    from .models import BackgroundJob
+    return BackgroundJob.objects.filter(
+        pk=job.pk, attempts=job.attempts, status__in=BackgroundJob.ACTIVE_STATUSES,
+    )
+
+
+def _finish(job, status, result=None):
+    _attempt_qs(job).update(
+        status=status, progress=100, result=result, finished_at=timezone.now(), locked_by='',
+    )
+
+
+def _fail(job, error, trace='', retry=True):
+    """Неудачная попытка: повтор с паузой, если попытки остались, иначе — ошибка и on_abort."""
+    from .models import BackgroundJob
+
+    now = timezone.now()
+    if retry and job.attempts < job.max_attempts:
+        delay = min(RETRY_DELAY * 2 ** max(job.attempts - 1, 0), RETRY_DELAY_MAX)
+        _attempt_qs(job).update(
+            status=BackgroundJob.STATUS_QUEUED, run_after=now + timedelta(seconds=delay),
+            locked_by='', heartbeat_at=None,
+            progress_text=f'Повтор через {delay} сек: {error}'[:500],
+        )
+        return
+
+    updated = _attempt_qs(job).update(
+        status=BackgroundJob.STATUS_ERROR, progress=100, finished_at=now, locked_by='',
+        result={'error': error, 'traceback': trace} if trace else {'error': error},
+    )
+    on_abort = _options.get(job.kind, {}).get('on_abort')
+    if updated and on_abort:
+        try:
+            on_abort(job, error)
+        except Exception:
+            pass
+
+
+def _is_lost(job):
+    """Активное задание, которое никто не выполняет."""
+    from .models import BackgroundJob
+    border = timezone.now() - timedelta(seconds=settings.JOBS_LEASE)
+    if job.status == BackgroundJob.STATUS_RUNNING:
+        return (job.heartbeat_at or job.started_at or job.created_at) < border
+    # Без воркера задание стартует сразу после коммита — долго в очереди значит, поток не запустился
+    return settings.JOBS_EAGER and job.created_at < border
+
+
+def reap():
+    """Выполняемые задания без отметки дольше JOBS_LEASE: повтор или ошибка. Возвращает их число."""
+    from .models import BackgroundJob
+    border = timezone.now() - timedelta(seconds=settings.JOBS_LEASE)
+    lost = list(BackgroundJob.objects.filter(status=BackgroundJob.STATUS_RUNNING, heartbeat_at__lt=border))
+    for job in lost:
+        _fail(job, 'Воркер остановился во время выполнения задания')
+    return len(lost)
+
+
+def _cleanup():
+    from .models import BackgroundJob
+    BackgroundJob.objects.filter(
+        finished_at__lt=timezone.now() - KEEP_FINISHED,
+    ).exclude(status__in=BackgroundJob.ACTIVE_STATUSES).delete()
+
+
+def job_payload(job):
+    """Представление задания для API."""
+    return {
+        'job_id':        str(job.pk),
+        'kind':          job.kind,
+        'status':        job.status,
+        'progress':      job.progress,
+        'progress_text': job.progress_text,
+        'result':        job.result,
+        'priority':      job.priority,
+        'attempts':      job.attempts,
+        'max_attempts':  job.max_attempts,
+        'deadline':      deadline(job.kind),
+        'cancel_requested': job.cancel_requested_at is not None,
+        'created_at':    job.created_at.isoformat() if job.created_at else None,
+        'started_at':    job.started_at.isoformat() if job.started_at else None,
+        'finished_at':   job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,121 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+def _queries():
+    """
+    Канонические запросы эндпоинтов: (эндпоинт, описание, QuerySet).
+    Те же фильтры и сортировки, что во вьюхах; новый «горячий» запрос — добавить сюда.
+    """
+    from datetime import timedelta
+    from apps.clients.models import Client, ClientActivity, ClientNote, DutySchedule, KktData
+    from apps.clients.views.utils import month_range, month_datetime_range
+
+    now = timezone.now()
+    today = timezone.localdate()
+    month_start, month_end = month_datetime_range(today.year, today.month)
+    day_start, day_end = month_range(today.year, today.month)
+    clients = Client.objects.filter(is_draft=False)
+    return [
+        ('GET /api/clients/', 'список клиентов', clients.order_by('-created_at')[:50]),
+        ('GET /api/clients/?status=', 'список по статусу',
+         clients.filter(status=Client.STATUS_ACTIVE).order_by('-created_at')[:50]),
+        ('GET /api/clients/', 'старые черновики',
+         Client.objects.filter(is_draft=True, created_at__lt=now - timedelta(days=1))),
+        ('GET /api/clients/dashboard/', 'новые за месяц',
+         clients.filter(created_at__gte=now - timedelta(days=30))),
+        ('GET /api/clients/dashboard/', 'ФН истёк', KktData.objects.filter(fn_end_date__lt=now)),
+        ('GET /api/clients/dashboard/', 'ФН в этом месяце',
+         KktData.objects.filter(fn_end_date__gte=month_start, fn_end_date__lt=month_end)),
+        ('GET /api/clients/dashboard/', 'ближайшие замены ФН',
+         KktData.objects.filter(fn_end_date__gte=now).order_by('fn_end_date')[:6]),
+        ('GET /api/clients/dashboard/', 'последняя активность',
+         ClientActivity.objects.order_by('-created_at')[:10]),
+        ('GET /api/clients/<id>/', 'история клиента',
+         ClientActivity.objects.filter(client_id=0).order_by('-created_at')),
+        ('GET /api/clients/<id>/notes/', 'заметки клиента', ClientNote.objects.filter(client_id=0)),
+        ('GET /api/clients/events/', 'график за месяц',
+         DutySchedule.objects.filter(date__gte=day_start, date__lt=day_end)),
+        ('GET /api/clients/kkt-list/?month=', 'ККТ по месяцу окончания ФН',
+         KktData.objects.filter(fn_end_date__gte=month_start, fn_end_date__lt=month_end)),
+        ('POST /api/clients/bulk-import/', 'проверка дубля по коду аптеки',
+         Client.objects.filter(pharmacy_code='0', is_draft=False)),
+    ]
+
+
+def _seq_scans(plan):
+    """Таблицы, которые план читает последовательным сканированием."""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN канонических запросов эндпоинтов: последовательные сканирования больших таблиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=10000,
+                            help='Seq Scan таблицы меньше этого числа строк (по статистике) не считается проблемой')
+        parser.add_argument('--strict', action='store_true',
+                            help='Проверка покрытия: enable_seqscan = off, Seq Scan основной таблицы запроса '
+                                 'при любом размере означает, что подходящего индекса нет')
+        parser.add_argument('--fail', action='store_true',
+                            help='Код возврата 1, если есть замечания (для CI)')
+        parser.add_argument('--verbose-plan', action='store_true', help='Печатать планы целиком')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f'Нужен PostgreSQL (сейчас {connection.vendor}) — проверка пропущена')
+            return
+
+        problems = 0
+        with transaction.atomic():
+            if options['strict']:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for endpoint, title, qs in _queries():
+                plan = json.loads(qs.explain(format='json'))[0]['Plan']
+                table = qs.model._meta.db_table
+                tables = _seq_scans(plan)
+                if options['strict']:
+                    flagged = [t for t in tables if t == table]
+                else:
+                    sizes = self._sizes(tables)
+                    flagged = [t for t in tables if sizes.get(t, 0) >= options['min_rows']]
+
+                if flagged:
+                    problems += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'SEQ  {endpoint} — {title}: ' + ', '.join(sorted(set(flagged)))
+                    ))
+                else:
+                    self.stdout.write(f'ok   {endpoint} — {title}')
+                if options['verbose_plan'] or flagged:
+                    self.stdout.write(f'     {qs.query}')
+                if options['verbose_plan']:
+                    self.stdout.write(qs.explain())
+
+        if problems:
+            message = f'Запросов с последовательным сканированием: {problems}'
+            if options['fail']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('Все запросы используют индексы'))
+
+    def _sizes(self, tables):
+        """Оценка числа строк из pg_class (обновляется ANALYZE / autovacuum)."""
+        if not tables:
+            return {}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT relname, reltuples FROM pg_class WHERE relname = ANY(%s) AND relkind = %s',
+                [list(set(tables)), 'r'],
+            )
+            return {name: rows for name, rows in cursor.fetchall()}
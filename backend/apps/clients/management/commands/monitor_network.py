@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from apps.clients.models import Client
+from apps.clients.availability import record, purge
+from apps.clients.views.reachability import probe_many, client_hosts
+
+
+class Command(BaseCommand):
+    help = 'Мониторинг доступности сети клиентов: обход всех адресов раз в интервал и запись истории'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=settings.NETWORK_MONITOR_INTERVAL,
+                            help='Секунд между обходами')
+        parser.add_argument('--once', action='store_true', help='Один обход и выход')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        last_purge = None
+
+        while True:
+            started = time.monotonic()
+            close_old_connections()
+            try:
+                total, down = self._sweep()
+                self.stdout.write(f'{timezone.localtime():%Y-%m-%d %H:%M} адресов: {total}, недоступно: {down}')
+                today = timezone.localdate()
+                if last_purge != today:
+                    deleted = purge(settings.NETWORK_HISTORY_DAYS)
+                    if deleted:
+                        self.stdout.write(f'Удалено строк истории: {deleted}')
+                    last_purge = today
+            except Exception as e:
+                self.stderr.write(f'Ошибка обхода: {e}')
+
+            if options['once']:
+                return
+            time.sleep(max(1.0, interval - (time.monotonic() - started)))
+
+    def _sweep(self):
+        keys = {}
+        for client in Client.objects.filter(is_draft=False, status=Client.STATUS_ACTIVE).only(
+            'id', 'external_ip', 'subnet',
+        ):
+            for host, ip in client_hosts(client).items():
+                if ip:
+                    keys[(client.id, host)] = ip
+
+        alive = probe_many(keys.values(), use_cache=False)
+        results = {key: (ip, alive.get(ip, False)) for key, ip in keys.items()}
+        record(results)
+        return len(results), sum(1 for _, ok in results.values() if not ok)
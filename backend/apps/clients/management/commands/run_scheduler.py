@@ -0,0 +1,18 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from apps.clients import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Планировщик регламентных заданий без воркера (обычно работает внутри run_worker)'
+
+    def handle(self, *args, **options):
+        import apps.clients.views  # noqa: F401 — регистрация обработчиков заданий
+
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+        self.stdout.write('Планировщик запущен')
+        scheduler.run(stop, self.stdout.write)
@@ -0,0 +1,100 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from apps.clients import jobs, scheduler
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди фоновых заданий (BackgroundJob)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOBS_WORKER_CONCURRENCY,
+                            help='Заданий одновременно в этом процессе')
+        parser.add_argument('--kinds', default='',
+                            help='Только эти типы заданий, через запятую (по умолчанию — все)')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задания и выйти')
+        parser.add_argument('--no-scheduler', action='store_true',
+                            help='Не запускать планировщик регламентных заданий в этом воркере')
+
+    def handle(self, *args, **options):
+        import apps.clients.views  # noqa: F401 — регистрация обработчиков заданий
+
+        kinds = [k.strip() for k in options['kinds'].split(',') if k.strip()] or None
+        unknown = set(kinds or ()) - set(jobs.registered_kinds())
+        if unknown:
+            self.stderr.write(f'Неизвестные типы заданий: {", ".join(sorted(unknown))}')
+            return
+
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        concurrency = max(1, options['concurrency'])
+        slots = threading.BoundedSemaphore(concurrency)
+        running = set()
+        stop = threading.Event()
+
+        def _stop(signum, frame):
+            self.stdout.write('Остановка: новые задания не берутся, ждём выполняемые')
+            stop.set()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+        self.stdout.write(f'Воркер {worker_id}: заданий одновременно — {concurrency}, '
+                          f'типы — {", ".join(kinds or jobs.registered_kinds())}')
+
+        # Планировщик — в каждом воркере, ставит задания только ведущий (advisory-блокировка)
+        if not options['once'] and not options['no_scheduler']:
+            threading.Thread(
+                target=scheduler.run, args=(stop, self.stdout.write), name='scheduler', daemon=True,
+            ).start()
+
+        last_reap = 0.0
+        while not stop.is_set():
+            try:
+                if time.monotonic() - last_reap >= settings.JOBS_LEASE / 2:
+                    reaped = jobs.reap()
+                    if reaped:
+                        self.stdout.write(f'Потерянных заданий возвращено в очередь: {reaped}')
+                    last_reap = time.monotonic()
+
+                if not slots.acquire(timeout=settings.JOBS_POLL_INTERVAL):
+                    continue
+                job = jobs.claim(worker_id, kinds)
+                if job is None:
+                    slots.release()
+                    if options['once'] and not running:
+                        break
+                    stop.wait(settings.JOBS_POLL_INTERVAL)
+                    continue
+
+                thread = threading.Thread(target=self._run, args=(job, slots, running), daemon=True)
+                running.add(thread)
+                thread.start()
+            except Exception as e:
+                self.stderr.write(f'Ошибка очереди: {e}')
+                connection.close()
+                stop.wait(settings.JOBS_POLL_INTERVAL)
+
+        for thread in list(running):
+            thread.join()
+        # SSH-сессии к Микротикам закрываем сами, а не обрывом при выходе процесса
+        from apps.clients.views.ssh_utils import close_pool
+        close_pool()
+
+    def _run(self, job, slots, running):
+        started = time.monotonic()
+        self.stdout.write(f'→ {job.kind} {job.pk} (попытка {job.attempts}/{job.max_attempts})')
+        try:
+            jobs.run(job)
+        except Exception as e:
+            self.stderr.write(f'Ошибка задания {job.pk}: {e}')
+        finally:
+            connection.close()
+            running.discard(threading.current_thread())
+            slots.release()
+        self.stdout.write(f'← {job.kind} {job.pk} за {time.monotonic() - started:.1f} сек')
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0034_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host', models.CharField(choices=[('external_ip', 'Внешний IP'), ('mikrotik_ip', 'Микротик'), ('server_ip', 'Сервер')], max_length=20, verbose_name='Адрес')),
+                ('ip', models.CharField(max_length=45, verbose_name='IP')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('probed_bits', models.BinaryField(verbose_name='Минуты с проверкой (zlib)')),
+                ('up_bits', models.BinaryField(verbose_name='Минуты доступности (zlib)')),
+                ('last_up', models.BooleanField(null=True, verbose_name='Доступен при последней проверке')),
+                ('last_probe_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя проверка')),
+                ('down_since', models.DateTimeField(blank=True, null=True, verbose_name='Недоступен с')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='clients.client')),
+            ],
+            options={
+                'verbose_name': 'Доступность адреса за сутки',
+                'verbose_name_plural': 'Доступность адресов',
+                'indexes': [models.Index(fields=['date', 'last_up'], name='clients_hos_date_e9d19d_idx')],
+                'unique_together': {('client', 'host', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0035_hostavailability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MikrotikState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mikrotik_ip', models.CharField(blank=True, max_length=45, verbose_name='IP Микротика')),
+                ('kassa_ips', models.JSONField(blank=True, default=dict, verbose_name='IP касс (kassa1…kassa6)')),
+                ('kassa_updated_at', models.DateTimeField(blank=True, null=True, verbose_name='IP касс получены')),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='mikrotik_state', to='clients.client')),
+            ],
+            options={
+                'verbose_name': 'Данные Микротика',
+                'verbose_name_plural': 'Данные Микротиков',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0036_mikrotikstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mikrotikstate',
+            name='collected_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Данные собраны'),
+        ),
+        migrations.AddField(
+            model_name='mikrotikstate',
+            name='facts',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Данные сборщика'),
+        ),
+    ]
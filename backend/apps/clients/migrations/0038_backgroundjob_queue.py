@@ -0,0 +1,53 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0037_mikrotikstate_facts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='attempts',
+            field=models.IntegerField(default=0, verbose_name='Попыток'),
+        ),
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Воркер жив'),
+        ),
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Воркер'),
+        ),
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='max_attempts',
+            field=models.IntegerField(default=1, verbose_name='Макс. попыток'),
+        ),
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='priority',
+            field=models.IntegerField(default=0, verbose_name='Приоритет'),
+        ),
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='run_after',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Не раньше'),
+        ),
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='timeout',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Лимит времени (сек)'),
+        ),
+        migrations.AddIndex(
+            model_name='backgroundjob',
+            index=models.Index(fields=['status', '-priority', 'run_after'], name='clients_bgjob_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+# Уведомление push-канала (apps/clients/events.py) об изменении состояния задания
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION clients_scheduledtask_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT'
+       OR NEW.status IS DISTINCT FROM OLD.status
+       OR NEW.progress IS DISTINCT FROM OLD.progress
+       OR NEW.progress_text IS DISTINCT FROM OLD.progress_text THEN
+        PERFORM pg_notify('scheduled_task', NEW.task_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS clients_scheduledtask_notify ON clients_scheduledtask;
+CREATE TRIGGER clients_scheduledtask_notify
+    AFTER INSERT OR UPDATE ON clients_scheduledtask
+    FOR EACH ROW EXECUTE FUNCTION clients_scheduledtask_notify();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS clients_scheduledtask_notify ON clients_scheduledtask;
+DROP FUNCTION IF EXISTS clients_scheduledtask_notify();
+"""
+
+
+def create_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0038_backgroundjob_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('clients', '0039_scheduledtask_notify'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledTaskRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=50, verbose_name='Задание')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Параметры')),
+                ('status', models.CharField(choices=[('running', 'Выполняется'), ('success', 'Успешно'), ('error', 'Ошибка')], default='running', max_length=20, verbose_name='Статус')),
+                ('message', models.CharField(blank=True, max_length=500, verbose_name='Итог')),
+                ('started_at', models.DateTimeField(verbose_name='Начало')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание')),
+                ('duration', models.FloatField(blank=True, null=True, verbose_name='Длительность (сек)')),
+                ('items_total', models.IntegerField(default=0, verbose_name='Объектов всего')),
+                ('items_done', models.IntegerField(default=0, verbose_name='Обработано')),
+                ('items_per_sec', models.FloatField(blank=True, null=True, verbose_name='Объектов в секунду')),
+                ('errors', models.IntegerField(default=0, verbose_name='Ошибок')),
+                ('ofd_calls', models.IntegerField(default=0, verbose_name='Запросов к ОФД')),
+                ('ssh_calls', models.IntegerField(default=0, verbose_name='SSH-подключений')),
+                ('timings', models.JSONField(blank=True, default=dict, verbose_name='Время по компаниям / хостам')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запуск регламентного задания',
+                'verbose_name_plural': 'Запуски регламентных заданий',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['task_id', '-started_at'], name='clients_taskrun_task_idx')],
+            },
+        ),
+    ]
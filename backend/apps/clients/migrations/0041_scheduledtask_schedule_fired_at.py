@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0040_scheduledtaskrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledtask',
+            name='schedule_fired_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний слот расписания'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0041_scheduledtask_schedule_fired_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backgroundjob',
+            name='cancel_requested_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Запрошена остановка'),
+        ),
+        migrations.AlterField(
+            model_name='backgroundjob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('success', 'Успешно'), ('error', 'Ошибка'), ('cancelled', 'Остановлено')], default='queued', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='scheduledtask',
+            name='status',
+            field=models.CharField(choices=[('idle', 'Ожидает'), ('running', 'Выполняется'), ('success', 'Успешно'), ('error', 'Ошибка'), ('cancelled', 'Остановлено')], default='idle', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='scheduledtaskrun',
+            name='status',
+            field=models.CharField(choices=[('running', 'Выполняется'), ('success', 'Успешно'), ('error', 'Ошибка'), ('cancelled', 'Остановлено')], default='running', max_length=20, verbose_name='Статус'),
+        ),
+    ]
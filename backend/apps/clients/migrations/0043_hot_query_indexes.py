@@ -0,0 +1,41 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0042_job_cancel'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['is_draft', 'status', '-created_at'], name='clients_client_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['pharmacy_code'], name='clients_client_pharm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientactivity',
+            index=models.Index(fields=['-created_at'], name='clients_activity_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientactivity',
+            index=models.Index(fields=['client', '-created_at'], name='clients_activity_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientnote',
+            index=models.Index(fields=['client', '-created_at'], name='clients_note_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dutyschedule',
+            index=models.Index(fields=['date'], name='clients_duty_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='kktdata',
+            index=models.Index(fields=['fn_end_date'], name='clients_kkt_fn_end_idx'),
+        ),
+    ]
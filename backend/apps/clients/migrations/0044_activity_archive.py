@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-19 18:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0043_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientActivityArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('data', models.BinaryField(verbose_name='Записи (JSON, zlib)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_archive', to='clients.client')),
+            ],
+            options={
+                'verbose_name': 'Архив активности',
+                'verbose_name_plural': 'Архив активности',
+                'ordering': ['-month'],
+                'indexes': [models.Index(fields=['month'], name='clients_actarch_month_idx')],
+                'unique_together': {('client', 'month')},
+            },
+        ),
+    ]
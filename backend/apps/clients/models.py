@@ -1,4 +1,6 @@
+import uuid
 from django.db import models
+from django.utils import timezone
 from apps.accounts.models import User
 
 
@@ -168,6 +170,11 @@ class Client(models.Model):
         verbose_name = 'Клиент'
         verbose_name_plural = 'Клиенты'
         ordering = ['-created_at']
+        indexes = [
+            # Списки, дашборд, мониторинг: is_draft=False [+ status] с сортировкой по дате
+            models.Index(fields=['is_draft', 'status', '-created_at'], name='clients_client_list_idx'),
+            models.Index(fields=['pharmacy_code'], name='clients_client_pharm_idx'),
+        ]
 
     def __str__(self):
         return self.ofd_company.name if self.ofd_company else (self.address or f'Клиент #{self.id}')
@@ -234,6 +241,7 @@ class ClientNote(models.Model):
         verbose_name = 'Заметка'
         verbose_name_plural = 'Заметки'
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['client', '-created_at'], name='clients_note_client_idx')]
 
 
 class ClientActivity(models.Model):
@@ -245,6 +253,32 @@ class ClientActivity(models.Model):
     class Meta:
         verbose_name = 'Активность'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='clients_activity_created_idx'),
+            models.Index(fields=['client', '-created_at'], name='clients_activity_client_idx'),
+        ]
+
+
+class ClientActivityArchive(models.Model):
+    """
+    Архив истории клиента за месяц (activity_archive.py): записи ClientActivity старше
+    ACTIVITY_HOT_DAYS переносятся сюда одной строкой на клиента и месяц — JSON-список, сжатый zlib.
+    """
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='activity_archive')
+    month = models.DateField('Месяц')  # первое число, по TIME_ZONE проекта
+    count = models.PositiveIntegerField('Записей', default=0)
+    data = models.BinaryField('Записи (JSON, zlib)')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Архив активности'
+        verbose_name_plural = 'Архив активности'
+        ordering = ['-month']
+        unique_together = [('client', 'month')]
+        indexes = [models.Index(fields=['month'], name='clients_actarch_month_idx')]
+
+    def __str__(self):
+        return f'{self.client_id} {self.month:%Y-%m}'
 
 
 def client_file_path(instance, filename):
@@ -337,6 +371,8 @@ class DutySchedule(models.Model):
     class Meta:
         unique_together = ('user', 'date')
         ordering = ['date', 'user']
+        # unique (user, date) не помогает выборке месяца по всем сотрудникам
+        indexes = [models.Index(fields=['date'], name='clients_duty_date_idx')]
         verbose_name = 'График дежурств'
         verbose_name_plural = 'График дежурств'
 
@@ -386,6 +422,7 @@ class KktData(models.Model):
         verbose_name = 'Данные ККТ'
         verbose_name_plural = 'Данные ККТ'
         ordering = ['kkt_reg_id']
+        indexes = [models.Index(fields=['fn_end_date'], name='clients_kkt_fn_end_idx')]
 
     def __str__(self):
         return f'ККТ {self.kkt_reg_id} — {self.client}'
@@ -397,10 +434,11 @@ class ScheduledTask(models.Model):
         ('update_rnm', 'Обновление данных по РНМ'),
     ]
     STATUS_CHOICES = [
-        ('idle',    'Ожидает'),
-        ('running', 'Выполняется'),
-        ('success', 'Успешно'),
-        ('error',   'Ошибка'),
+        ('idle',      'Ожидает'),
+        ('running',   'Выполняется'),
+        ('success',   'Успешно'),
+        ('error',     'Ошибка'),
+        ('cancelled', 'Остановлено'),
     ]
 
     task_id      = models.CharField('Идентификатор задания', max_length=50, unique=True)
@@ -411,6 +449,9 @@ class ScheduledTask(models.Model):
         'Дни недели (0=пн…6=вс, через запятую)', max_length=20, blank=True, default='0,1,2,3,4'
     )
     enabled      = models.BooleanField('Включено', default=False)
+    # Время (UTC) последнего слота расписания, по которому задание поставлено в очередь
+    # (или отменено — при сохранении расписания): слот не запускается дважды
+    schedule_fired_at = models.DateTimeField('Последний слот расписания', null=True, blank=True)
 
     status       = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='idle')
     last_run_at  = models.DateTimeField('Последний запуск', null=True, blank=True)
@@ -429,6 +470,43 @@ class ScheduledTask(models.Model):
         return self.name
 
 
+class ScheduledTaskRun(models.Model):
+    """Один запуск регламентного задания: длительность, счётчики, время по компаниям / хостам"""
+    STATUS_CHOICES = [
+        ('running',   'Выполняется'),
+        ('success',   'Успешно'),
+        ('error',     'Ошибка'),
+        ('cancelled', 'Остановлено'),
+    ]
+
+    # Строкой, а не FK: история переживает пересоздание ScheduledTask
+    task_id       = models.CharField('Задание', max_length=50)
+    user          = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True)
+    params        = models.JSONField('Параметры', default=dict, blank=True)
+    status        = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default='running')
+    message       = models.CharField('Итог', max_length=500, blank=True)
+    started_at    = models.DateTimeField('Начало')
+    finished_at   = models.DateTimeField('Окончание', null=True, blank=True)
+    duration      = models.FloatField('Длительность (сек)', null=True, blank=True)
+    items_total   = models.IntegerField('Объектов всего', default=0)
+    items_done    = models.IntegerField('Обработано', default=0)
+    items_per_sec = models.FloatField('Объектов в секунду', null=True, blank=True)
+    errors        = models.IntegerField('Ошибок', default=0)
+    ofd_calls     = models.IntegerField('Запросов к ОФД', default=0)
+    ssh_calls     = models.IntegerField('SSH-подключений', default=0)
+    # {группа: {ключ: сек}} — по компаниям; по хостам — самые медленные и перцентили
+    timings       = models.JSONField('Время по компаниям / хостам', default=dict, blank=True)
+
+    class Meta:
+        verbose_name = 'Запуск регламентного задания'
+        verbose_name_plural = 'Запуски регламентных заданий'
+        ordering = ['-started_at']
+        indexes = [models.Index(fields=['task_id', '-started_at'], name='clients_taskrun_task_idx')]
+
+    def __str__(self):
+        return f'{self.task_id} {self.started_at:%Y-%m-%d %H:%M}'
+
+
 class FaqCategory(models.Model):
     """Категория FAQ"""
     name       = models.CharField('Название', max_length=200)
@@ -512,3 +590,122 @@ class FaqArticleHistory(models.Model):
 
     def __str__(self):
         return f'{self.article.title} — {self.action}'
+
+
+class BackgroundJob(models.Model):
+    """
+    Задание очереди воркера (jobs.py, manage.py run_worker): запросы к ОФД и Микротикам из интерфейса,
+    регламентные задания вручную и по расписанию, бэкап и восстановление, мониторинг, прогрев кеша.
+    Воркер берёт готовое задание по приоритету, держит его отметками heartbeat_at (lease) и повторяет
+    при ошибке до max_attempts; активное задание с тем же dedup_key не дублируется, выполняемое
+    останавливается по cancel_requested_at.
+    """
+    STATUS_QUEUED  = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCESS = 'success'
+    STATUS_ERROR   = 'error'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED,  'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_SUCCESS, 'Успешно'),
+        (STATUS_ERROR,   'Ошибка'),
+        (STATUS_CANCELLED, 'Остановлено'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    id            = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind          = models.CharField('Тип задания', max_length=50)
+    # Одинаковый ключ у активных заданий запрещён — повторный запрос получает уже запущенное
+    dedup_key     = models.CharField('Ключ дедупликации', max_length=200, blank=True)
+    params        = models.JSONField('Параметры', default=dict, blank=True)
+    status        = models.CharField('Статус', max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress      = models.IntegerField('Прогресс (%)', default=0)
+    progress_text = models.CharField('Текст прогресса', max_length=500, blank=True)
+    result        = models.JSONField('Результат', null=True, blank=True)
+    # Без ограничения в БД: восстановление бэкапа очищает пользователей, но не очередь (backup._truncate)
+    user          = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True,
+                                      db_constraint=False)
+    created_at    = models.DateTimeField(auto_now_add=True)
+    started_at    = models.DateTimeField('Начало', null=True, blank=True)
+    finished_at   = models.DateTimeField('Окончание', null=True, blank=True)
+    # Очередь (jobs.py, manage.py run_worker)
+    priority      = models.IntegerField('Приоритет', default=0)  # больше — раньше
+    run_after     = models.DateTimeField('Не раньше', default=timezone.now)
+    attempts      = models.IntegerField('Попыток', default=0)
+    max_attempts  = models.IntegerField('Макс. попыток', default=1)
+    timeout       = models.IntegerField('Лимит времени (сек)', null=True, blank=True)
+    locked_by     = models.CharField('Воркер', max_length=100, blank=True)
+    # Воркер обновляет раз в JOBS_HEARTBEAT сек; давно не обновлялось — воркер умер
+    heartbeat_at  = models.DateTimeField('Воркер жив', null=True, blank=True)
+    # Запрошена остановка: обработчик проверяет jobs.stop_reason() между пачками и завершается сам
+    cancel_requested_at = models.DateTimeField('Запрошена остановка', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Фоновое задание'
+        verbose_name_plural = 'Фоновые задания'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='clients_bgjob_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=models.Q(status__in=['queued', 'running']) & ~models.Q(dedup_key=''),
+                name='clients_backgroundjob_active_dedup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} ({self.get_status_display()})'
+
+
+class MikrotikState(models.Model):
+    """Данные, полученные с Микротика клиента по SSH: IP касс из DHCP, внешний IP, ресурсы, интерфейсы"""
+    client           = models.OneToOneField(Client, on_delete=models.CASCADE, related_name='mikrotik_state')
+    # Для какого адреса Микротика получены данные — при смене подсети кеш не используется
+    mikrotik_ip      = models.CharField('IP Микротика', max_length=45, blank=True)
+    kassa_ips        = models.JSONField('IP касс (kassa1…kassa6)', default=dict, blank=True)
+    kassa_updated_at = models.DateTimeField('IP касс получены', null=True, blank=True)
+    # Результат сборщика (views/mikrotik.py): внешний IP, ресурсы, интерфейсы, ошибки секций
+    facts            = models.JSONField('Данные сборщика', default=dict, blank=True)
+    collected_at     = models.DateTimeField('Данные собраны', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Данные Микротика'
+        verbose_name_plural = 'Данные Микротиков'
+
+    def __str__(self):
+        return f'{self.client_id} ({self.mikrotik_ip})'
+
+
+class HostAvailability(models.Model):
+    """
+    История доступности одного адреса клиента за сутки.
+    Минута суток → бит: probed — была проверка, up — адрес ответил.
+    Битовые карты (1440 бит = 180 байт) хранятся сжатыми zlib — у стабильного хоста это десятки байт.
+    """
+    HOST_CHOICES = [
+        ('external_ip', 'Внешний IP'),
+        ('mikrotik_ip', 'Микротик'),
+        ('server_ip',   'Сервер'),
+    ]
+
+    client        = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='availability')
+    host          = models.CharField('Адрес', max_length=20, choices=HOST_CHOICES)
+    ip            = models.CharField('IP', max_length=45)
+    date          = models.DateField('Дата')
+    probed_bits   = models.BinaryField('Минуты с проверкой (zlib)')
+    up_bits       = models.BinaryField('Минуты доступности (zlib)')
+    last_up       = models.BooleanField('Доступен при последней проверке', null=True)
+    last_probe_at = models.DateTimeField('Последняя проверка', null=True, blank=True)
+    down_since    = models.DateTimeField('Недоступен с', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Доступность адреса за сутки'
+        verbose_name_plural = 'Доступность адресов'
+        unique_together = [('client', 'host', 'date')]
+        indexes = [models.Index(fields=['date', 'last_up'])]
+
+    def __str__(self):
+        return f'{self.client_id} {self.host} {self.date}'
@@ -0,0 +1,94 @@
+"""
+Прогресс регламентных заданий (ScheduledTask) с редкой записью в БД.
+
+Функции _run_* сообщают прогресс на каждую компанию или клиента — тысячи вызовов за запуск.
+ProgressReporter держит состояние в памяти и пишет в БД:
+  - сразу — при смене status, last_run_at, last_run_result (запуск и итог) и процента progress
+    (целое 0..100 — не больше сотни записей за запуск);
+  - текст прогресса — не чаще раза в TASK_PROGRESS_INTERVAL сек: промежуточные значения
+    не пишутся, последнее дописывает таймер, даже если новых вызовов не будет;
+  - значения, совпадающие с уже записанными, не пишутся вовсе.
+
+С run=RunRecorder(…) отчёт ведёт и историю запуска (task_runs.py): status='running' открывает
+запись ScheduledTaskRun, итоговый статус закрывает её с текстом прогресса в качестве итога.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+# Статусы, после которых запись идёт сразу и отчёт закрывается
+TERMINAL_STATUSES = ('success', 'error', 'cancelled', 'idle')
+# Поля, изменение которых пишется сразу
+_IMMEDIATE_FIELDS = ('status', 'last_run_at', 'last_run_result')
+
+_MISSING = object()
+
+
+class ProgressReporter:
+    """Вызов reporter.set(**поля ScheduledTask) заменяет ScheduledTask.objects.filter(…).update(…)."""
+
+    def __init__(self, task_id, interval=None, run=None):
+        self.task_id = task_id
+        self.run = run
+        self.interval = settings.TASK_PROGRESS_INTERVAL if interval is None else interval
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._state = {}
+        self._pending = {}
+        self._flushed = {}
+        self._last_flush = 0.0
+        self._timer = None
+
+    def set(self, **fields):
+        with self._lock:
+            self._state.update(fields)
+            self._pending.update(fields)
+            terminal = fields.get('status') in TERMINAL_STATUSES
+            now = time.monotonic()
+            immediate = any(f in fields for f in _IMMEDIATE_FIELDS) or (
+                'progress' in fields and fields['progress'] != self._flushed.get('progress', _MISSING)
+            )
+            if immediate or now - self._last_flush >= self.interval:
+                self._flush_locked(now)
+            elif self._timer is None:
+                # Последний текст допишется, даже если новых вызовов не будет
+                self._timer = threading.Timer(self.interval - (now - self._last_flush), self._flush_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if self.run is not None:
+            if fields.get('status') == 'running':
+                self.run.start()
+            elif terminal:
+                self.run.finish(fields['status'], message=self._state.get('progress_text', ''))
+
+    __call__ = set
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked(time.monotonic())
+
+    def _flush_timer(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()   # поток таймера — своё соединение
+
+    def _flush_locked(self, now):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        fields = {k: v for k, v in self._pending.items() if self._flushed.get(k, _MISSING) != v}
+        self._pending = {}
+        if not fields:
+            return
+        from .models import ScheduledTask
+        from . import events
+        ScheduledTask.objects.filter(task_id=self.task_id).update(**fields)
+        self.writes += 1
+        self._last_flush = now
+        self._flushed.update(fields)
+        events.publish([self.task_id])
@@ -0,0 +1,166 @@
+"""
+Планировщик регламентных заданий: читает ScheduledTask.schedule_time / schedule_days и ставит
+задания в очередь (jobs.py) — запуск по расписанию стоит одной записи в БД.
+
+Работает потоком в каждом воркере (manage.py run_worker), но ведущий один на все воркеры и серверы:
+им становится процесс, взявший advisory-блокировку PostgreSQL на своём соединении. Блокировка
+держится, пока живо соединение, — упал процесс или оборвалась связь, и её берёт другой воркер.
+
+Слот расписания (время UTC) запускается, если он наступил не раньше SCHEDULER_MISFIRE_GRACE назад
+и позже schedule_fired_at; отметка переставляется условным UPDATE, так что слот не запустится
+дважды, даже если ведущих окажется два (например, на СУБД без advisory-блокировок).
+"""
+
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+# Ключ advisory-блокировки ведущего (положительный, меньше 2**32 — в pg_locks это objid)
+LOCK_KEY = 7_340_001
+
+
+def parse_time(value):
+    """'ЧЧ:ММ' → (ч, м); ValueError при неверном формате."""
+    hh, mm = (int(part) for part in (value or '').strip().split(':'))
+    if not (0 <= hh <= 23 and 0 <= mm <= 59):
+        raise ValueError(value)
+    return hh, mm
+
+
+def parse_days(value):
+    """'0,1,2' или [0, 1, 2] → {0, 1, 2} (0=пн … 6=вс)."""
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = str(value or '').split(',')
+    return {int(d) for d in items if str(d).strip() != '' and 0 <= int(d) <= 6}
+
+
+def _slots(task, tz_offset, start, days):
+    """Слоты задания (UTC) по местным датам start, start±1 … в направлении days (±1)."""
+    try:
+        hh, mm = parse_time(task.schedule_time)
+        weekdays = parse_days(task.schedule_days)
+    except ValueError:
+        return
+    if not weekdays:
+        return
+    tz = dt_timezone(timedelta(hours=tz_offset))
+    local_date = start.astimezone(tz).date()
+    for i in range(9):
+        day = local_date + timedelta(days=i * days)
+        if day.weekday() in weekdays:
+            yield datetime.combine(day, dt_time(hh, mm), tzinfo=tz).astimezone(dt_timezone.utc)
+
+
+def last_slot(task, tz_offset, now):
+    """Последний слот расписания не позже now (UTC) или None."""
+    return next((s for s in _slots(task, tz_offset, now, -1) if s <= now), None)
+
+
+def next_slot(task, tz_offset, now):
+    """Ближайший слот расписания позже now (UTC) или None."""
+    return next((s for s in _slots(task, tz_offset, now, 1) if s > now), None)
+
+
+def due_tasks(now=None):
+    """[(задание, слот)] — включённые задания, слот которых наступил и ещё не запускался."""
+    from .models import ScheduledTask, SystemSettings
+    now = now or timezone.now()
+    tz_offset = SystemSettings.get().timezone_offset
+    grace = timedelta(seconds=settings.SCHEDULER_MISFIRE_GRACE)
+    due = []
+    for task in ScheduledTask.objects.filter(enabled=True).exclude(schedule_time=''):
+        slot = last_slot(task, tz_offset, now)
+        if slot is None or now - slot > grace:
+            continue
+        if task.schedule_fired_at and task.schedule_fired_at >= slot:
+            continue
+        due.append((task, slot))
+    return due
+
+
+def tick(log=print):
+    """Ставит в очередь наступившие задания. Возвращает число поставленных."""
+    from .models import ScheduledTask
+    from .views.scheduler_views import start_task
+
+    fired = 0
+    for task, slot in due_tasks():
+        # Отметка слота — условным UPDATE: второй планировщик на том же слоте ничего не изменит
+        claimed = ScheduledTask.objects.filter(pk=task.pk, schedule_fired_at=task.schedule_fired_at).update(
+            schedule_fired_at=slot,
+        )
+        if not claimed:
+            continue
+        try:
+            job, message = start_task(task.task_id, None, scheduled=True)
+        except Exception as e:
+            log(f'Расписание: {task.task_id} — ошибка постановки в очередь: {e}')
+            continue
+        if job is None:
+            log(f'Расписание: {task.task_id} — пропуск, задание уже выполняется')
+            continue
+        log(f'Расписание: {task.task_id} — {message}, задание {job.pk}')
+        fired += 1
+    return fired
+
+
+def mark_schedule_changed(task_ids=None):
+    """
+    Расписание или часовой пояс изменились: уже прошедшие слоты считаются отработанными,
+    иначе слот в пределах SCHEDULER_MISFIRE_GRACE запустился бы сразу после сохранения.
+    """
+    from .models import ScheduledTask
+    qs = ScheduledTask.objects.all()
+    if task_ids is not None:
+        qs = qs.filter(task_id__in=task_ids)
+    qs.update(schedule_fired_at=timezone.now())
+
+
+def _try_lock():
+    if connection.vendor != 'postgresql':
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [LOCK_KEY])
+        return cursor.fetchone()[0]
+
+
+def leader_active():
+    """Есть ли ведущий планировщик (на PostgreSQL — по pg_locks; иначе неизвестно → None)."""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND granted "
+            "AND classid = 0 AND objid = %s AND objsubid = 1)",
+            [LOCK_KEY],
+        )
+        return cursor.fetchone()[0]
+
+
+def run(stop, log=print):
+    """
+    Цикл планировщика до stop.set(). Вызывается в отдельном потоке: блокировка ведущего живёт
+    на соединении этого потока и снимается при его закрытии.
+    """
+    leader = False
+    try:
+        while not stop.is_set():
+            try:
+                if not leader:
+                    leader = _try_lock()
+                    if leader:
+                        log('Планировщик: этот процесс — ведущий')
+                if leader:
+                    tick(log)
+            except Exception as e:
+                # Соединение потеряно — вместе с ним и блокировка; берём её заново
+                log(f'Планировщик: ошибка — {e}')
+                leader = False
+                connection.close()
+            stop.wait(settings.SCHEDULER_INTERVAL)
+    finally:
+        connection.close()
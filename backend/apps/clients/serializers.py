@@ -119,6 +119,7 @@ class ClientDetailSerializer(serializers.ModelSerializer):
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     notes = ClientNoteSerializer(many=True, read_only=True)
     activities = ClientActivitySerializer(many=True, read_only=True)
+    activities_archived = serializers.SerializerMethodField()
     provider_data = ProviderSerializer(source='provider', read_only=True)
     provider2_data = ProviderSerializer(source='provider2', read_only=True)
     ofd_company_data = OfdCompanySerializer(source='ofd_company', read_only=True)
@@ -128,6 +129,10 @@ class ClientDetailSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['created_by', 'created_at', 'updated_at']
 
+    def get_activities_archived(self, obj):
+        from .activity_archive import count
+        return count(obj.pk)
+
 
 class ClientWriteSerializer(serializers.ModelSerializer):
     class Meta:
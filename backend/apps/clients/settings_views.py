@@ -94,8 +94,13 @@ class SystemSettingsView(APIView):
                 'has_smtp_password': bool(s.smtp_password_encrypted),
             })
         elif section == 'general':
+            old_offset = s.timezone_offset
             s.timezone_offset = int(request.data.get('timezone_offset', s.timezone_offset) or 0)
             s.save()
+            if s.timezone_offset != old_offset:
+                # Слоты расписания сдвинулись — уже прошедшие по новому поясу не запускаем
+                from .scheduler import mark_schedule_changed
+                mark_schedule_changed()
             return Response({'timezone_offset': s.timezone_offset})
         else:
             s.ssh_user = request.data.get('ssh_user', s.ssh_user)
@@ -179,3 +184,31 @@ class TestEmailView(APIView):
             return Response({'error': f'Не удалось подключиться к {s.smtp_host}:{s.smtp_port}'}, status=400)
         except Exception as e:
             return Response({'error': f'Ошибка отправки: {str(e)}'}, status=400)
+
+
+class SshHostKeysView(APIView):
+    """
+    GET    /api/clients/system-settings/ssh-host-keys/?search=10.1. — сохранённые SSH-ключи Микротиков
+    DELETE /api/clients/system-settings/ssh-host-keys/{host}/     — отозвать ключ (после замены Микротика)
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        from .views.host_keys import get_store, fingerprint
+        search = (request.query_params.get('search') or '').strip()
+        result = []
+        for host, by_type in sorted(get_store().all().items()):
+            if search and search not in host:
+                continue
+            for keytype, key in sorted(by_type.items()):
+                result.append({'host': host, 'key_type': keytype, 'fingerprint': fingerprint(key)})
+        return Response(result)
+
+    def delete(self, request, host):
+        from .views.host_keys import get_store
+        from .views.ssh_utils import get_pool
+        if not get_store().revoke(host):
+            return Response({'error': 'Ключ для хоста не найден'}, status=404)
+        # Сессии, открытые с отозванным ключом, не переиспользуются (в воркере — по проверке ключа при выдаче)
+        get_pool().evict(host)
+        return Response({'ok': True})
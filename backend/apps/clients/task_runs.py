@@ -0,0 +1,134 @@
+"""
+История запусков регламентных заданий (ScheduledTaskRun) для графиков производительности.
+
+RunRecorder собирает метрики запуска в памяти (счётчики, время по компаниям / хостам)
+и пишет их одной записью в конце. Запись о запуске создаётся при старте, чтобы выполняемый
+запуск был виден в истории; зависший запуск (воркер упал) закрывается при следующем старте.
+
+Время по ключам хранится целиком, если ключей не больше TIMINGS_TOP; иначе — TIMINGS_TOP самых
+медленных и сводка (количество, сумма, p50, p95, максимум): у fetch_external_ip ключ — каждый хост.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+TIMINGS_TOP = 50
+COUNTERS = ('items_total', 'items_done', 'errors', 'ofd_calls', 'ssh_calls')
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def compact_timings(group):
+    """{ключ: сек} → как есть, либо {'top': {…}, 'count', 'total', 'p50', 'p95', 'max'}."""
+    if len(group) <= TIMINGS_TOP:
+        return {k: round(v, 3) for k, v in group.items()}
+    values = sorted(group.values())
+    slowest = sorted(group.items(), key=lambda kv: kv[1], reverse=True)[:TIMINGS_TOP]
+    return {
+        'top':   {k: round(v, 3) for k, v in slowest},
+        'count': len(values),
+        'total': round(sum(values), 3),
+        'p50':   round(_percentile(values, 0.5), 3),
+        'p95':   round(_percentile(values, 0.95), 3),
+        'max':   round(values[-1], 3),
+    }
+
+
+def timings_items(group):
+    """Пары (ключ, сек) группы в любом из форматов compact_timings."""
+    if 'top' in group and isinstance(group.get('top'), dict):
+        return group['top'].items()
+    return group.items()
+
+
+class RunRecorder:
+    """Метрики одного запуска. add/timing потокобезопасны — вызываются из потоков fan_out."""
+
+    def __init__(self, task_id, user_id=None, params=None):
+        self.task_id = task_id
+        self.user_id = user_id
+        self.params = params or {}
+        self.run_id = None
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._timings = {}
+        self._started = None
+        self._started_at = None
+
+    def start(self):
+        from .models import ScheduledTaskRun
+        now = timezone.now()
+        self._started, self._started_at = time.monotonic(), now
+        ScheduledTaskRun.objects.filter(task_id=self.task_id, status='running').update(
+            status='error', message='Прервано (перезапуск)', finished_at=now,
+        )
+        run = ScheduledTaskRun.objects.create(
+            task_id=self.task_id, user_id=self.user_id, params=self.params, started_at=now,
+        )
+        self.run_id = run.pk
+
+    def add(self, counter, n=1):
+        with self._lock:
+            self._counters[counter] += n
+
+    def update(self, **counters):
+        """Итоговые значения счётчиков (вместо add по каждому объекту)."""
+        with self._lock:
+            self._counters.update(counters)
+
+    def timing(self, group, key, seconds):
+        with self._lock:
+            bucket = self._timings.setdefault(group, {})
+            bucket[key] = bucket.get(key, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, group, key):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timing(group, key, time.monotonic() - started)
+
+    def finish(self, status, message=''):
+        from .models import ScheduledTaskRun
+        if self._started is None:
+            return
+        duration = time.monotonic() - self._started
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {group: compact_timings(values) for group, values in self._timings.items()}
+        fields = dict(
+            status=status, message=(message or '')[:500],
+            finished_at=timezone.now(), duration=round(duration, 3),
+            items_per_sec=round(counters['items_done'] / duration, 3) if duration > 0 else None,
+            timings=timings, **counters,
+        )
+        # Восстановление из бэкапа очищает таблицу — тогда запись создаётся заново
+        # (без пользователя: его может не быть в восстановленной базе)
+        if not ScheduledTaskRun.objects.filter(pk=self.run_id).update(**fields):
+            ScheduledTaskRun.objects.create(
+                task_id=self.task_id, params=self.params,
+                started_at=self._started_at, **fields,
+            )
+        self._started = None
+        purge(self.task_id)
+
+
+def purge(task_id):
+    """Оставляет историю задания за TASK_RUN_HISTORY_DAYS, но не больше TASK_RUN_HISTORY_MAX запусков."""
+    from .models import ScheduledTaskRun
+    qs = ScheduledTaskRun.objects.filter(task_id=task_id)
+    qs.filter(started_at__lt=timezone.now() - timedelta(days=settings.TASK_RUN_HISTORY_DAYS)).delete()
+    keep = settings.TASK_RUN_HISTORY_MAX
+    border = list(qs.order_by('-started_at').values_list('started_at', flat=True)[keep:keep + 1])
+    if border:
+        qs.filter(started_at__lte=border[0]).delete()
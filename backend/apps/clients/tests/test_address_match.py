@@ -0,0 +1,68 @@
+import json
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.clients.models import Client, KktData, OfdCompany, ScheduledTask
+from apps.clients.views.address_match import AddressIndex, house_number
+
+
+class HouseNumberTests(SimpleTestCase):
+    def test_plain(self):
+        self.assertEqual(house_number('644000, г. Омск, ул. 8 Марта, д. 12'), '12')
+
+    def test_letter(self):
+        self.assertEqual(house_number('г. Омск, ул. Ленина, д. 12А'), '12а')
+
+    def test_fraction(self):
+        self.assertEqual(house_number('ул. Мира, д.5/1'), '5/1')
+
+    def test_none(self):
+        self.assertIsNone(house_number('ул. Мира'))
+
+    def test_candidates_match_letter_and_fraction(self):
+        clients = [
+            SimpleNamespace(id=1, address='ул. Ленина, д. 12а'),
+            SimpleNamespace(id=2, address='ул. Ленина, д. 12'),
+            SimpleNamespace(id=3, address='ул. Мира, 5/1'),
+        ]
+        index = AddressIndex(clients)
+        best = index.candidates('г. Омск, ул. Ленина, дом 12А')[0]
+        self.assertEqual(best[1].id, 1)
+        self.assertEqual(best[0], 1.0)
+        self.assertEqual(index.candidates('ул. Мира, д. 5/1')[0][0], 1.0)
+
+
+class RnmSyncApplyLinksTests(TestCase):
+    url = '/api/clients/rnm-sync/apply/'
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_superuser(email='admin@example.com', password='x'))
+        company = OfdCompany.objects.create(name='Аптеки', inn='5500000000')
+        self.client_obj = Client.objects.create(address='ул. Мира, 5/1', ofd_company=company)
+        ScheduledTask.objects.create(task_id='rnm_sync', name='Сверка РНМ с ОФД', last_run_result=json.dumps({
+            'missing_in_us': [{'rnm': '1' * 16, 'company_id': company.pk, 'address': 'ул. Мира, 5/1',
+                               'model': '', 'fn': '', 'candidates': []}],
+        }))
+
+    def test_bad_items(self):
+        for links, index in (
+            (['1111111111111111'], 0),
+            ([{'rnm': '1' * 16, 'client_id': self.client_obj.pk}, {'rnm': '1' * 16, 'client_id': 'abc'}], 1),
+            ([{'rnm': '1' * 16}], 0),
+            ([{'rnm': '1' * 16, 'client_id': True}], 0),
+        ):
+            r = self.api.post(self.url, {'links': links}, format='json')
+            self.assertEqual(r.status_code, 400, links)
+            self.assertTrue(r.json()['error'].startswith(f'links[{index}]'), r.json())
+        self.assertFalse(KktData.objects.exists())
+
+    def test_numeric_string_client_id(self):
+        r = self.api.post(self.url, {'links': [{'rnm': '1' * 16, 'client_id': str(self.client_obj.pk)}]},
+                          format='json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([a['rnm'] for a in r.json()['applied']], ['1' * 16])
+        self.assertTrue(KktData.objects.filter(client=self.client_obj, kkt_reg_id='1' * 16).exists())
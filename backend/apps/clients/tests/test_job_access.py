@@ -0,0 +1,28 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.clients.models import BackgroundJob
+
+
+class BackgroundJobAccessTests(TestCase):
+    """Статус задания видит только поставивший его пользователь и администратор."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='x')
+        self.owner = User.objects.create_user(email='owner@example.com', password='x')
+        self.other = User.objects.create_user(email='other@example.com', password='x')
+        self.job = BackgroundJob.objects.create(kind='ofd_kkt_fetch', user=self.owner, result={'success': True})
+        self.backup = BackgroundJob.objects.create(kind='task.backup_system', user=self.admin,
+                                                   result={'path': '/backups/x.tar.gz'})
+
+    def _get(self, user, job):
+        api = APIClient()
+        api.force_authenticate(user)
+        return api.get(f'/api/clients/jobs/{job.pk}/')
+
+    def test_access(self):
+        self.assertEqual(self._get(self.owner, self.job).status_code, 200)
+        self.assertEqual(self._get(self.admin, self.job).status_code, 200)
+        self.assertEqual(self._get(self.other, self.job).status_code, 404)
+        self.assertEqual(self._get(self.owner, self.backup).status_code, 404)
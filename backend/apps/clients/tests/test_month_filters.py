@@ -0,0 +1,35 @@
+import datetime
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.clients.models import DutySchedule
+
+
+class MonthFilterTests(TestCase):
+    """Несуществующий месяц в параметрах — пустой результат или 400, а не 500."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(email='admin@example.com', password='x')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        DutySchedule.objects.create(user=self.user, date=datetime.date(2026, 12, 31), duty_type='day')
+
+    def test_valid_month(self):
+        r = self.api.get('/api/clients/events/', {'year': 2026, 'month': 12})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.json()), 1)
+
+    def test_bad_month_is_empty(self):
+        for params in ({'year': 2026, 'month': 13}, {'year': 'abc', 'month': 1}, {'year': 9999, 'month': 12}):
+            for url in ('/api/clients/events/', '/api/clients/events/holidays/', '/api/clients/kkt-list/'):
+                r = self.api.get(url, params)
+                self.assertEqual(r.status_code, 200, (url, params))
+            self.assertEqual(self.api.get('/api/clients/events/', params).json(), [])
+            self.assertEqual(self.api.get('/api/clients/events/report/', params).status_code, 200)
+
+    def test_clear_month_bad_month(self):
+        r = self.api.post('/api/clients/events/clear_month/', {'year': 2026, 'month': 13}, format='json')
+        self.assertEqual(r.status_code, 400)
+        self.assertTrue(DutySchedule.objects.exists())
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+
+from apps.accounts.models import User
+from apps.clients import backup
+from apps.clients.backup_archive import ArchiveWriter, extract
+from apps.clients.models import BackgroundJob, Client
+
+
+@skipUnless(connection.vendor == 'postgresql' and shutil.which('pg_dump') and shutil.which('pg_restore'),
+            'нужны PostgreSQL и pg_dump / pg_restore')
+class RestoreKeepsQueueTests(TransactionTestCase):
+    """Восстановление заменяет данные, но очередь заданий (в ней идёт само восстановление) остаётся."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def _backup(self, fmt):
+        path = os.path.join(self.tmp, f'backup_{fmt}.tar.gz')
+        with override_settings(BACKUP_DB_FORMAT=fmt):
+            archive = ArchiveWriter(path, 'backup', codec='gzip')
+            dump = backup.dump_database(archive, tmp_root=self.tmp)
+            archive.close()
+        self.assertEqual(dump['fallback'], '')
+        dest = os.path.join(self.tmp, fmt)
+        extract(path, dest)
+        return backup.find_dump(os.path.join(dest, 'backup'))
+
+    def _check(self, fmt):
+        kept = User.objects.create_user(email='kept@example.com', password='x')
+        Client.objects.create(address='из бэкапа')
+        dump_fmt, dump_path = self._backup(fmt)
+
+        # После бэкапа: новые данные, пользователь, которого в бэкапе нет, и задания в очереди
+        Client.objects.create(address='после бэкапа')
+        gone = User.objects.create_user(email='gone@example.com', password='x')
+        restore_job = BackgroundJob.objects.create(kind='restore_backup', status=BackgroundJob.STATUS_RUNNING,
+                                                   user=kept)
+        queued = BackgroundJob.objects.create(kind='task.update_rnm', user=gone)
+
+        backup.restore_database(dump_fmt, dump_path)
+
+        self.assertEqual(list(Client.objects.values_list('address', flat=True)), ['из бэкапа'])
+        self.assertFalse(User.objects.filter(email='gone@example.com').exists())
+        restore_job.refresh_from_db()
+        queued.refresh_from_db()
+        self.assertEqual(restore_job.status, BackgroundJob.STATUS_RUNNING)
+        # db.json не хранит pk пользователей — автор задания находится по email
+        self.assertEqual(restore_job.user.email, kept.email)
+        self.assertIsNone(queued.user_id)
+
+    def test_pg_dump(self):
+        self._check('custom')
+
+    def test_json(self):
+        self._check('json')
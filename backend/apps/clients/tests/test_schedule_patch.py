@@ -0,0 +1,31 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.clients.models import ScheduledTask
+
+
+class ScheduledTaskPatchTests(TestCase):
+    """PATCH scheduled-tasks/ проверяет расписание и не запускает уже прошедший слот."""
+
+    url = '/api/clients/scheduled-tasks/'
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_superuser(email='admin@example.com', password='x'))
+
+    def test_enable_marks_past_slots(self):
+        r = self.api.patch(self.url, {'task_id': 'update_rnm', 'enabled': True, 'schedule_time': '03:00',
+                                      'schedule_days': [0, 1, 2, 3, 4, 5, 6]}, format='json')
+        self.assertEqual(r.status_code, 200)
+        t = ScheduledTask.objects.get(task_id='update_rnm')
+        self.assertTrue(t.enabled)
+        self.assertEqual(t.schedule_days, '0,1,2,3,4,5,6')
+        self.assertIsNotNone(t.schedule_fired_at)
+
+    def test_bad_schedule(self):
+        for data in ({'schedule_time': '25:00'}, {'schedule_time': 'утром'}, {'schedule_days': 'пн'},
+                     {'enabled': True, 'schedule_time': ''}):
+            r = self.api.patch(self.url, {'task_id': 'update_rnm', **data}, format='json')
+            self.assertEqual(r.status_code, 400, data)
+        self.assertFalse(ScheduledTask.objects.get(task_id='update_rnm').enabled)
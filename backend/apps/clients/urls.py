@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ClientViewSet, CustomFieldDefinitionViewSet, ProviderViewSet, FetchExternalIPView, KassaIpsView, DashboardStatsView, DutyScheduleViewSet, OfdCompanyViewSet, OfdKktView, KktListView, KktExportView, BulkImportClientsView, ScheduledTaskListView, ScheduledTaskRunView, ScheduledTaskProgressView, ScheduledTaskCronView, GlobalSearchView, RnmSyncView, BackupListView, BackupRestoreView, FaqCategoryViewSet, FaqArticleViewSet, FaqFileView, FaqFileDeleteView, FaqImageUploadView, FaqImportView, FaqExportView, FaqHistoryView
-from .settings_views import SystemSettingsView, TestEmailView, CheckPackagesView
+from .views import ClientViewSet, CustomFieldDefinitionViewSet, ProviderViewSet, FetchExternalIPView, KassaIpsView, MikrotikFactsView, DashboardStatsView, DutyScheduleViewSet, OfdCompanyViewSet, OfdKktView, KktListView, KktExportView, BulkImportClientsView, ScheduledTaskListView, ScheduledTaskRunView, ScheduledTaskProgressView, ScheduledTaskEventsView, ScheduledTaskCronView, ScheduledTaskCancelView, ScheduledTaskRunListView, ScheduledTaskRunDetailView, ScheduledTaskTrendView, GlobalSearchView, RnmSyncView, RnmSyncApplyView, BackupListView, BackupRestoreView, BackupVerifyView, FaqCategoryViewSet, FaqArticleViewSet, FaqFileView, FaqFileDeleteView, FaqImageUploadView, FaqImportView, FaqExportView, FaqHistoryView, BackgroundJobView, NetworkStatusView, NetworkDownView, ClientUptimeView, NetworkSummaryView
+from .settings_views import SystemSettingsView, TestEmailView, CheckPackagesView, SshHostKeysView
 
 router = DefaultRouter()
 router.register('faq-categories', FaqCategoryViewSet, basename='faq-categories')
@@ -14,11 +14,19 @@ router.register('', ClientViewSet, basename='client')
 
 urlpatterns = [
     path('rnm-sync/', RnmSyncView.as_view(), name='rnm-sync'),
+    path('rnm-sync/apply/', RnmSyncApplyView.as_view(), name='rnm-sync-apply'),
     path('search/', GlobalSearchView.as_view(), name='global-search'),
+    path('jobs/<uuid:job_id>/', BackgroundJobView.as_view(), name='background-job'),
+    path('network/status/', NetworkStatusView.as_view(), name='network-status'),
+    path('network/down/', NetworkDownView.as_view(), name='network-down'),
+    path('network/summary/', NetworkSummaryView.as_view(), name='network-summary'),
+    path('network/uptime/<int:pk>/', ClientUptimeView.as_view(), name='network-uptime'),
     path('dashboard/', DashboardStatsView.as_view(), name='dashboard'),
     path('system-settings/', SystemSettingsView.as_view(), name='system-settings'),
     path('system-settings/test-email/', TestEmailView.as_view(), name='test-email'),
     path('system-settings/check-packages/', CheckPackagesView.as_view(), name='check-packages'),
+    path('system-settings/ssh-host-keys/', SshHostKeysView.as_view(), name='ssh-host-keys'),
+    path('system-settings/ssh-host-keys/<str:host>/', SshHostKeysView.as_view(), name='ssh-host-key-revoke'),
     path('fetch_external_ip/', FetchExternalIPView.as_view(), name='fetch-external-ip'),
     path('kkt-list/', KktListView.as_view(), name='kkt-list'),
     path('kkt-export/', KktExportView.as_view(), name='kkt-export'),
@@ -26,9 +34,15 @@ urlpatterns = [
     path('scheduled-tasks/', ScheduledTaskListView.as_view(), name='scheduled-tasks'),
     path('scheduled-tasks/run/', ScheduledTaskRunView.as_view(), name='scheduled-tasks-run'),
     path('scheduled-tasks/cron/', ScheduledTaskCronView.as_view(), name='scheduled-tasks-cron'),
+    path('scheduled-tasks/events/', ScheduledTaskEventsView.as_view(), name='scheduled-tasks-events'),
+    path('scheduled-tasks/runs/<int:run_id>/', ScheduledTaskRunDetailView.as_view(), name='scheduled-tasks-run-detail'),
     path('scheduled-tasks/<str:task_id>/progress/', ScheduledTaskProgressView.as_view(), name='scheduled-tasks-progress'),
+    path('scheduled-tasks/<str:task_id>/cancel/', ScheduledTaskCancelView.as_view(), name='scheduled-tasks-cancel'),
+    path('scheduled-tasks/<str:task_id>/runs/', ScheduledTaskRunListView.as_view(), name='scheduled-tasks-runs'),
+    path('scheduled-tasks/<str:task_id>/trend/', ScheduledTaskTrendView.as_view(), name='scheduled-tasks-trend'),
     path('backups/', BackupListView.as_view(), name='backup-list'),
     path('backups/restore/', BackupRestoreView.as_view(), name='backup-restore'),
+    path('backups/verify/', BackupVerifyView.as_view(), name='backup-verify'),
     path('faq-articles/<int:article_id>/files/', FaqFileView.as_view(), name='faq-files'),
     path('faq-articles/<int:article_id>/images/', FaqImageUploadView.as_view(), name='faq-image-upload'),
     path('faq-articles/<int:article_id>/import/', FaqImportView.as_view(), name='faq-import'),
@@ -36,6 +50,7 @@ urlpatterns = [
     path('faq-articles/<int:article_id>/history/', FaqHistoryView.as_view(), name='faq-history'),
     path('faq-files/<int:file_id>/', FaqFileDeleteView.as_view(), name='faq-file-delete'),
     path('<int:pk>/kassa-ips/', KassaIpsView.as_view(), name='kassa-ips'),
+    path('<int:pk>/mikrotik/', MikrotikFactsView.as_view(), name='mikrotik-facts'),
     path('<int:pk>/ofd_kkt/', OfdKktView.as_view(), name='ofd-kkt'),
     path('<int:pk>/ofd_kkt/<int:kkt_id>/', OfdKktView.as_view(), name='ofd-kkt-detail'),
     path('', include(router.urls)),
@@ -9,6 +9,7 @@ from .client_views import (
 from .misc_views import (
     FetchExternalIPView,
     KassaIpsView,
+    MikrotikFactsView,
     OfdCompanyViewSet,
     ProviderViewSet,
     DashboardStatsView,
@@ -32,12 +33,22 @@ from .scheduler_views import (
     ScheduledTaskListView,
     ScheduledTaskRunView,
     ScheduledTaskProgressView,
+    ScheduledTaskEventsView,
     ScheduledTaskCronView,
+    ScheduledTaskCancelView,
     RnmSyncView,
+    RnmSyncApplyView,
     BackupListView,
     BackupRestoreView,
+    BackupVerifyView,
 )
 
+from .task_run_views import ScheduledTaskRunListView, ScheduledTaskRunDetailView, ScheduledTaskTrendView
+
 from .search_views import GlobalSearchView
 
+from .job_views import BackgroundJobView
+
+from .network_views import NetworkStatusView, NetworkDownView, ClientUptimeView, NetworkSummaryView
+
 from .faq_views import FaqCategoryViewSet, FaqArticleViewSet, FaqFileView, FaqFileDeleteView, FaqImageUploadView, FaqImportView, FaqExportView, FaqHistoryView
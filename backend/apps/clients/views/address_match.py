@@ -0,0 +1,97 @@
+"""
+Сопоставление адресов ККТ из ОФД с адресами аптек.
+
+Используется сверкой РНМ: для каждой кассы, которая есть в ОФД, но отсутствует у нас,
+подбираются клиенты той же компании с наиболее похожим адресом.
+
+Индекс строится один раз на компанию: токен адреса → множество клиентов.
+Вес токена — IDF по адресам клиентов компании, поэтому название города,
+которое встречается у всех аптек, почти не влияет на оценку,
+а название улицы и номер дома — решают.
+"""
+
+import math
+import re
+
+# Служебные слова адреса — не несут информации для сопоставления
+STOP_WORDS = {
+    'ул', 'пр', 'пом', 'д', 'кв', 'г', 'р-н', 'ул.', 'пр.', 'д.', 'пом.',
+    'г.', 'пр-кт', 'пр-кт.', 'проспект', 'улица', 'переулок', 'помещ',
+    'помещение', 'область', 'край', 'республика', 'город',
+    'обл', 'пер', 'корп', 'стр', 'мкр', 'р', 'н', 'зд', 'вн', 'тер', 'рф',
+    'россия', 'российская', 'федерация',
+}
+
+_TOKEN_RE = re.compile(r'[0-9a-zа-я]+')
+# Номер дома с литерой и дробью: 12, 12а, 5/1, 5/1б
+_NUMBER_RE = re.compile(r'(?<![\w/])(\d+[а-яa-z]?(?:/\d+[а-яa-z]?)?)(?![\w/])')
+
+# Штраф если номер дома клиента не найден в адресе ОФД
+HOUSE_MISMATCH_FACTOR = 0.5
+
+
+def _normalize(address):
+    return (address or '').lower().replace('ё', 'е')
+
+
+def address_tokens(address):
+    """Нормализованные значимые токены адреса."""
+    text = _normalize(address)
+    return {
+        t for t in _TOKEN_RE.findall(text)
+        if t not in STOP_WORDS and (len(t) > 1 or t.isdigit())
+    }
+
+
+def house_number(address):
+    """Последний номер в адресе (с литерой / дробью, в нижнем регистре) — как правило, номер дома."""
+    numbers = _NUMBER_RE.findall(_normalize(address))
+    return numbers[-1] if numbers else None
+
+
+class AddressIndex:
+    """Инвертированный индекс адресов клиентов одной компании."""
+
+    def __init__(self, clients):
+        self._clients = {}   # client_id → (client, tokens, house)
+        self._index = {}     # token → {client_id}
+        for c in clients:
+            tokens = address_tokens(c.address)
+            if not tokens:
+                continue
+            self._clients[c.id] = (c, tokens, house_number(c.address))
+            for t in tokens:
+                self._index.setdefault(t, set()).add(c.id)
+
+        total = len(self._clients) or 1
+        self._idf = {
+            t: math.log(1 + total / len(ids))
+            for t, ids in self._index.items()
+        }
+
+    def candidates(self, address, limit=3):
+        """
+        Клиенты с похожим адресом, по убыванию оценки.
+        Оценка 0..1 — доля веса токенов адреса клиента, найденных в адресе ОФД.
+        """
+        tokens = address_tokens(address)
+        if not tokens:
+            return []
+
+        ids = set()
+        for t in tokens:
+            ids |= self._index.get(t, set())
+
+        fiscal_numbers = set(_NUMBER_RE.findall(_normalize(address)))
+        scored = []
+        for cid in ids:
+            client, client_tokens, house = self._clients[cid]
+            total = sum(self._idf[t] for t in client_tokens)
+            matched = sum(self._idf[t] for t in client_tokens & tokens)
+            score = matched / total if total else 0.0
+            if house and house not in fiscal_numbers:
+                score *= HOUSE_MISMATCH_FACTOR
+            scored.append((score, client))
+
+        scored.sort(key=lambda x: (-x[0], x[1].id))
+        return scored[:limit]
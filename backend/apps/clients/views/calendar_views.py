@@ -16,7 +16,7 @@ from ..serializers import (
     DutyScheduleSerializer, CustomHolidaySerializer, OfdCompanySerializer, OfdCompanyWriteSerializer,
 )
 from apps.accounts.permissions import CanEditClient, CanManageCustomFields, IsAdmin
-from .utils import ping_ip, build_change_log, FIELD_LABELS, STATUS_LABELS
+from .utils import ping_ip, build_change_log, month_range, FIELD_LABELS, STATUS_LABELS
 
 
 class DutyScheduleViewSet(viewsets.ModelViewSet):
@@ -29,7 +29,11 @@ class DutyScheduleViewSet(viewsets.ModelViewSet):
         year = self.request.query_params.get('year')
         month = self.request.query_params.get('month')
         if year and month:
-            qs = qs.filter(date__year=year, date__month=month)
+            try:
+                start, end = month_range(year, month)
+            except ValueError:
+                return qs.none()   # несуществующий месяц — пустой график, как и раньше
+            qs = qs.filter(date__gte=start, date__lt=end)
         return qs
 
     @action(detail=False, methods=['post'])
@@ -40,7 +44,11 @@ class DutyScheduleViewSet(viewsets.ModelViewSet):
         month = request.data.get('month')
         if not year or not month:
             return Response({'error': 'year и month обязательны'}, status=400)
-        deleted, _ = DutySchedule.objects.filter(date__year=year, date__month=month).delete()
+        try:
+            start, end = month_range(year, month)
+        except ValueError:
+            return Response({'error': 'Некорректные year / month'}, status=400)
+        deleted, _ = DutySchedule.objects.filter(date__gte=start, date__lt=end).delete()
         return Response({'deleted': deleted})
 
     @action(detail=False, methods=['get'])
@@ -49,7 +57,11 @@ class DutyScheduleViewSet(viewsets.ModelViewSet):
         month = request.query_params.get('month')
         qs = CustomHoliday.objects.all()
         if year and month:
-            qs = qs.filter(date__year=year, date__month=month)
+            try:
+                start, end = month_range(year, month)
+            except ValueError:
+                return Response([])
+            qs = qs.filter(date__gte=start, date__lt=end)
         return Response(CustomHolidaySerializer(qs, many=True).data)
 
     @action(detail=False, methods=['post'])
@@ -137,7 +149,12 @@ class DutyScheduleViewSet(viewsets.ModelViewSet):
         month = request.query_params.get('month')
         qs = DutySchedule.objects.select_related('user')
         if year and month:
-            qs = qs.filter(date__year=year, date__month=month)
+            try:
+                start, end = month_range(year, month)
+            except ValueError:
+                qs = qs.none()
+            else:
+                qs = qs.filter(date__gte=start, date__lt=end)
 
         from apps.accounts.models import User
 
@@ -16,7 +16,7 @@ from ..serializers import (
     DutyScheduleSerializer, CustomHolidaySerializer, OfdCompanySerializer, OfdCompanyWriteSerializer,
 )
 from apps.accounts.permissions import CanEditClient, CanManageCustomFields, IsAdmin
-from .utils import ping_ip, build_change_log, FIELD_LABELS, STATUS_LABELS
+from .utils import build_change_log, FIELD_LABELS, STATUS_LABELS
 from .search_utils import fuzzy_filter_clients, build_exact_q
 
 
@@ -39,6 +39,9 @@ class ClientViewSet(viewsets.ModelViewSet):
     ordering_fields = ['address', 'phone', 'email', 'status', 'created_at', 'provider__name', 'ofd_company__name', 'ofd_company__inn']
     ordering = ['-created_at']
 
+    # Общий дедлайн проверки доступности в ping (сек) — все адреса проверяются одновременно
+    PING_DEADLINE = 3
+
     def get_queryset(self):
         # Удаляем черновики старше 2 часов (пользователь ушёл не сохранив)
         from django.utils import timezone
@@ -157,6 +160,26 @@ class ClientViewSet(viewsets.ModelViewSet):
         ClientActivity.objects.create(client=client, user=request.user, action='Добавлена заметка')
         return Response(ClientNoteSerializer(note).data, status=status.HTTP_201_CREATED)
 
+    @action(detail=True, methods=['get'], url_path='activity_archive')
+    def activity_archive(self, request, pk=None):
+        """
+        История клиента из архива (записи старше ACTIVITY_HOT_DAYS), новые первые.
+        ?q= — подстрока действия или пользователя (как в глобальном поиске; search занят фильтром списка),
+        ?date_from= / ?date_to= — ГГГГ-ММ-ДД.
+        """
+        from datetime import date
+        from .. import activity_archive
+        client = self.get_object()
+        dates = {}
+        for param in ('date_from', 'date_to'):
+            value = request.query_params.get(param)
+            try:
+                dates[param] = date.fromisoformat(value) if value else None
+            except ValueError:
+                return Response({'error': f'{param}: дата в формате ГГГГ-ММ-ДД'}, status=400)
+        q = request.query_params.get('q', '').strip()
+        return Response(activity_archive.entries(client.pk, search=q, **dates))
+
     @action(detail=False, methods=['get', 'post'], url_path='export_excel')
     def export_excel(self, request):
         import openpyxl
@@ -522,13 +545,40 @@ class ClientViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'], url_path='ping')
     def ping(self, request, pk=None):
+        """
+        Доступность external_ip, mikrotik_ip и server_ip — все три проверяются одновременно,
+        ответ не дольше PING_DEADLINE. Свежие результаты (≤ REACHABILITY_CACHE_TTL) берутся из кеша.
+        ?fresh=1  — без кеша;
+        ?stream=1 — NDJSON: строка {"field", "ip", "alive"} по мере готовности каждого адреса.
+        """
+        from django.http import StreamingHttpResponse
+        from .reachability import probe_iter, probe_many, client_hosts
+
         client = self.get_object_including_draft()
-        external_ip = client.external_ip or ''
-        mikrotik_ip = client.mikrotik_ip or ''
-        server_ip = client.server_ip or ''
+        hosts = client_hosts(client)
+        ips = [ip for ip in hosts.values() if ip]
+        use_cache = request.query_params.get('fresh') not in ('1', 'true')
+
+        if request.query_params.get('stream') in ('1', 'true'):
+            def _lines():
+                fields_by_ip = {}
+                for field, ip in hosts.items():
+                    if ip:
+                        fields_by_ip.setdefault(ip, []).append(field)
+                    else:
+                        yield json.dumps({'field': field, 'ip': '', 'alive': None}) + '\n'
+                for ip, alive in probe_iter(ips, timeout=self.PING_DEADLINE, use_cache=use_cache):
+                    for field in fields_by_ip.get(ip, []):
+                        yield json.dumps({'field': field, 'ip': ip, 'alive': alive}) + '\n'
+
+            response = StreamingHttpResponse(_lines(), content_type='application/x-ndjson')
+            response['X-Accel-Buffering'] = 'no'   # nginx отдаёт строки сразу
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+        alive = probe_many(ips, timeout=self.PING_DEADLINE, use_cache=use_cache)
         results = {
-            'external_ip': {'ip': external_ip, 'alive': ping_ip(external_ip) if external_ip else None},
-            'mikrotik_ip': {'ip': mikrotik_ip, 'alive': ping_ip(mikrotik_ip) if mikrotik_ip else None},
-            'server_ip': {'ip': server_ip, 'alive': ping_ip(server_ip) if server_ip else None},
+            field: {'ip': ip, 'alive': alive.get(ip) if ip else None}
+            for field, ip in hosts.items()
         }
         return Response(results)
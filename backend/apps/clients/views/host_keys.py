@@ -0,0 +1,209 @@
+"""
+Хранилище SSH host key Микротиков.
+
+Файл known_hosts читается один раз при первом обращении и дальше живёт в памяти
+(словарь host → {тип ключа → ключ}, поиск O(1)). Новые ключи (доверие первому
+подключению) и отзывы копятся и сбрасываются на диск пачкой, не чаще раза в
+FLUSH_DELAY секунд.
+
+Запись на диск — под fcntl-блокировкой общей для всех воркеров gunicorn:
+перечитываем файл, применяем к нему только свои накопленные изменения, пишем во
+временный файл и атомарно заменяем (os.replace). Чужие изменения подхватываются
+при сбросе и по изменению mtime файла (проверка не чаще RELOAD_CHECK секунд).
+"""
+
+import atexit
+import fcntl
+import os
+import threading
+import time
+
+KNOWN_HOSTS_FILE = '/opt/support-portal/known_hosts'
+
+FLUSH_DELAY = 2     # сек — пачка новых ключей перед записью на диск
+RELOAD_CHECK = 5    # сек — как часто проверять mtime файла
+
+
+def _read_file(path):
+    """Читает known_hosts → {host: {keytype: PKey}}. Битые строки пропускаются."""
+    from paramiko.hostkeys import HostKeyEntry
+    keys = {}
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    entry = HostKeyEntry.from_line(line)
+                except Exception:
+                    entry = None
+                if entry is None:
+                    continue
+                for host in entry.hostnames:
+                    keys.setdefault(host, {})[entry.key.get_name()] = entry.key
+    except FileNotFoundError:
+        pass
+    return keys
+
+
+def _write_file(path, keys):
+    """Атомарная запись: временный файл в той же папке + os.replace."""
+    tmp = f'{path}.tmp.{os.getpid()}'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for host in sorted(keys):
+            for keytype, key in sorted(keys[host].items()):
+                f.write(f'{host} {keytype} {key.get_base64()}\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class HostKeyStore:
+    """Потокобезопасное хранилище host key с отложенной записью на диск."""
+
+    def __init__(self, path=KNOWN_HOSTS_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._keys = None          # host → {keytype: PKey}, None — ещё не загружено
+        self._pending_add = {}     # host → {keytype: PKey} — ещё не записано
+        self._pending_remove = set()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._flush_timer = None
+
+    # ── Чтение ──────────────────────────────────────────────────────────────
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_locked(self):
+        keys = _read_file(self.path)
+        for host in self._pending_remove:
+            keys.pop(host, None)
+        for host, by_type in self._pending_add.items():
+            keys.setdefault(host, {}).update(by_type)
+        self._keys = keys
+        self._mtime = self._file_mtime()
+        self._checked_at = time.monotonic()
+
+    def _ensure_loaded_locked(self):
+        if self._keys is None:
+            self._load_locked()
+        elif time.monotonic() - self._checked_at >= RELOAD_CHECK:
+            self._checked_at = time.monotonic()
+            if self._file_mtime() != self._mtime:
+                self._load_locked()
+
+    def get(self, host):
+        """{keytype: PKey} для хоста (пустой dict если ключ не сохранён)."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            return dict(self._keys.get(host, {}))
+
+    def all(self):
+        with self._lock:
+            self._ensure_loaded_locked()
+            return {host: dict(by_type) for host, by_type in self._keys.items()}
+
+    # ── Изменение ───────────────────────────────────────────────────────────
+
+    def add(self, host, key):
+        """Запоминает ключ хоста; запись на диск — отложенная."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            self._keys.setdefault(host, {})[key.get_name()] = key
+            self._pending_add.setdefault(host, {})[key.get_name()] = key
+            self._pending_remove.discard(host)
+            self._schedule_flush_locked()
+
+    def revoke(self, host):
+        """Удаляет все ключи хоста. Записывается на диск сразу. Возвращает False если ключа не было."""
+        with self._lock:
+            self._ensure_loaded_locked()
+            existed = self._keys.pop(host, None) is not None
+            self._pending_add.pop(host, None)
+            self._pending_remove.add(host)
+            self.flush()
+            return existed
+
+    def _schedule_flush_locked(self):
+        if self._flush_timer is not None:
+            return
+        self._flush_timer = threading.Timer(FLUSH_DELAY, self.flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+    def flush(self):
+        """Применяет накопленные изменения к файлу на диске (под межпроцессной блокировкой)."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._pending_add and not self._pending_remove:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(f'{self.path}.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    keys = _read_file(self.path)
+                    for host in self._pending_remove:
+                        keys.pop(host, None)
+                    for host, by_type in self._pending_add.items():
+                        keys.setdefault(host, {}).update(by_type)
+                    _write_file(self.path, keys)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            self._pending_add.clear()
+            self._pending_remove.clear()
+            self._keys = keys
+            self._mtime = self._file_mtime()
+            self._checked_at = time.monotonic()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HostKeyStore()
+            atexit.register(_store.flush)
+        return _store
+
+
+def fingerprint(key):
+    """SHA256-отпечаток ключа в формате OpenSSH."""
+    import base64
+    import hashlib
+    digest = hashlib.sha256(key.asbytes()).digest()
+    return 'SHA256:' + base64.b64encode(digest).decode().rstrip('=')
+
+
+def make_policy():
+    """
+    Политика paramiko на базе хранилища: новый хост — доверяем первому подключению
+    и запоминаем ключ, известный хост — ключ того же типа обязан совпасть.
+    """
+    import paramiko
+
+    class StorePolicy(paramiko.MissingHostKeyPolicy):
+        def missing_host_key(self, client, hostname, key):
+            store = get_store()
+            known = store.get(hostname)
+            if not known:
+                store.add(hostname, key)
+                return
+            expected = known.get(key.get_name())
+            if expected is None:
+                # Известный хост прислал ключ другого типа — как RejectPolicy раньше
+                raise paramiko.SSHException(f'Server {hostname!r} not found in known_hosts')
+            if expected != key:
+                raise paramiko.BadHostKeyException(hostname, key, expected)
+
+    return StorePolicy()
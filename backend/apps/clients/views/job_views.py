@@ -0,0 +1,24 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from ..models import BackgroundJob
+from ..jobs import job_payload
+from apps.accounts.permissions import IsAdmin
+
+
+class BackgroundJobView(APIView):
+    """
+    GET /api/clients/jobs/{job_id}/ — статус и результат фонового задания.
+    Видно тому, кто его поставил, и администраторам (в очереди и служебные задания: бэкап,
+    восстановление, сверка РНМ) — остальным 404.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        try:
+            job = BackgroundJob.objects.get(pk=job_id)
+        except BackgroundJob.DoesNotExist:
+            return Response({'error': 'Задание не найдено'}, status=404)
+        if job.user_id != request.user.pk and not IsAdmin().has_permission(request, self):
+            return Response({'error': 'Задание не найдено'}, status=404)
+        return Response(job_payload(job))
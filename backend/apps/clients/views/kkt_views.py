@@ -1,6 +1,7 @@
 import subprocess
 import json
 import os
+import threading
 from datetime import datetime
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
@@ -17,6 +18,7 @@ from ..serializers import (
 )
 from apps.accounts.permissions import CanEditClient, CanManageCustomFields, IsAdmin
 from .utils import ping_ip, build_change_log, FIELD_LABELS, STATUS_LABELS
+from .. import jobs
 
 
 def parse_datetime(value):
@@ -29,6 +31,16 @@ def parse_datetime(value):
         return None
 
 
+# Предел одного вызова ofd_fetch.sh (полный поиск по компании с сотнями ККТ идёт минутами)
+OFD_SCRIPT_TIMEOUT = 900
+# Пределы запроса всех ККТ компании (обновление сохранённых) и запроса по одному РНМ
+OFD_COMPANY_TIMEOUT = 60
+OFD_RNM_TIMEOUT = 15
+# Запас лимита задания сверх вызовов скрипта — на запись в БД: по таймауту скрипта задание
+# завершается его собственной ошибкой, а не общим «Превышено время выполнения»
+OFD_JOB_MARGIN = 120
+
+
 def ofd_request(inn, token, search=''):
     """
     Один вызов скрипта — получает все ККТ по ИНН, фильтрует по адресу,
@@ -37,7 +49,7 @@ def ofd_request(inn, token, search=''):
     script = '/usr/local/bin/ofd_fetch.sh'
     try:
         args = [script, inn, token, search]
-        result = subprocess.run(args, capture_output=True, text=True, timeout=900)
+        result = subprocess.run(args, capture_output=True, text=True, timeout=OFD_SCRIPT_TIMEOUT)
         if not result.stdout.strip():
             stderr = result.stderr.strip()
             raise Exception(f'Пустой ответ от скрипта. stderr: {stderr}')
@@ -45,7 +57,7 @@ def ofd_request(inn, token, search=''):
     except json.JSONDecodeError:
         raise Exception(f'Некорректный JSON: {result.stdout[:300]}')
     except subprocess.TimeoutExpired:
-        raise Exception('Превышено время ожидания (300 сек)')
+        raise Exception(f'Превышено время ожидания ({OFD_SCRIPT_TIMEOUT} сек)')
     except FileNotFoundError:
         raise Exception(f'Скрипт {script} не найден в контейнере')
 
@@ -80,11 +92,374 @@ def ofd_get_all_rnm(inn, token, timeout=30):
     return data.get("Data", [])
 
 
+_company_calls = {}
+_company_calls_lock = threading.Lock()
+
+
+def ofd_fetch_company(inn, token, timeout=60):
+    """
+    Все ККТ компании по ИНН через ofd_fetch.sh (без фильтра по адресу).
+    Одновременные запросы по одному ИНН внутри процесса выполняются одним вызовом скрипта.
+    """
+    with _company_calls_lock:
+        call = _company_calls.get(inn)
+        owner = call is None
+        if owner:
+            call = _company_calls[inn] = {'event': threading.Event(), 'data': None, 'error': None}
+
+    if not owner:
+        if not call['event'].wait(timeout + 5) or call['data'] is None:
+            raise call['error'] or Exception(f'Превышено время ожидания ответа от ОФД ({timeout} сек)')
+        return call['data']
+
+    try:
+        try:
+            result = subprocess.run(
+                ['/usr/local/bin/ofd_fetch.sh', inn, token],
+                capture_output=True, text=True, timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise Exception(f'Превышено время ожидания ответа от ОФД ({timeout} сек)')
+        if not result.stdout.strip():
+            raise Exception(f'Пустой ответ от ОФД. stderr: {result.stderr[:200]}')
+        try:
+            call['data'] = json.loads(result.stdout)
+        except json.JSONDecodeError:
+            raise Exception(f'Некорректный JSON: {result.stdout[:300]}')
+        return call['data']
+    except Exception as e:
+        call['error'] = e
+        raise
+    finally:
+        with _company_calls_lock:
+            _company_calls.pop(inn, None)
+        call['event'].set()
+
+
+def _apply_ofd_item(kkt_obj, item):
+    """Переносит данные ККТ из ответа ОФД в модель (без сохранения)."""
+    kkt_obj.serial_number = item.get('SerialNumber', '')
+    kkt_obj.fn_number = item.get('FnNumber', '')
+    kkt_obj.kkt_model = item.get('KktModel', '')
+    kkt_obj.create_date = parse_datetime(item.get('CreateDate'))
+    kkt_obj.contract_end_date = parse_datetime(item.get('ContractEndDate'))
+    kkt_obj.fn_end_date = parse_datetime(item.get('FnEndDate'))
+    kkt_obj.fiscal_address = item.get('FiscalAddress', '')
+    kkt_obj.raw_data = item
+
+
+KKT_OFD_FIELDS = [
+    'serial_number', 'fn_number', 'kkt_model', 'create_date', 'contract_end_date',
+    'fn_end_date', 'fiscal_address', 'raw_data', 'fetched_at',
+]
+
+
+def _save_kkt_batch(to_create, to_update, activities):
+    """Пакетная запись ККТ и истории — одна транзакция вместо save() на каждую кассу."""
+    from django.db import transaction
+    from django.utils import timezone
+    now = timezone.now()
+    for k in to_update:
+        k.fetched_at = now  # bulk_update не вызывает auto_now
+    with transaction.atomic():
+        KktData.objects.bulk_create(to_create, batch_size=500)
+        KktData.objects.bulk_update(to_update, KKT_OFD_FIELDS, batch_size=500)
+        ClientActivity.objects.bulk_create(activities, batch_size=500)
+
+
+def _ofd_credentials(client, need_address=False):
+    """Проверяет что у клиента заполнены компания/ИНН/токен. Возвращает (inn, token, error)."""
+    if not client.ofd_company:
+        return None, None, 'У клиента не выбрана компания. Укажите компанию в карточке клиента.'
+    if need_address and not (client.address or '').strip():
+        return None, None, 'У клиента не заполнен адрес'
+    inn = client.ofd_company.inn.strip()
+    token = client.ofd_company.ofd_token.strip()
+    if not inn:
+        return None, None, f'У компании «{client.ofd_company.name}» не заполнен ИНН'
+    if not token:
+        return None, None, f'У компании «{client.ofd_company.name}» не задан токен ОФД. Откройте раздел «Компании» и добавьте токен.'
+    return inn, token, None
+
+
+def _ofd_full_fetch(client, user, inn, token, progress=None):
+    """Полный поиск по ИНН + адресу клиента. Возвращает (payload, http_status)."""
+    import time
+    address = client.address.strip()
+    if progress:
+        progress(10, 'Запрос к ОФД...')
+    try:
+        t_start = time.time()
+        result_data = ofd_request(inn, token, address)
+        elapsed = round(time.time() - t_start, 1)
+    except Exception as e:
+        return {'error': f'Ошибка запроса к ОФД: {str(e)}'}, 502
+
+    if result_data.get('Status') != 'Success':
+        return {'error': f'ОФД вернул ошибку: {result_data}'}, 502
+
+    all_items = result_data.get('Data', [])
+    if not all_items:
+        return {'error': f'ККТ по адресу «{address}» не найдены в ОФД. Проверьте адрес клиента — он должен совпадать с адресом установки кассы в ОФД.'}, 404
+
+    if progress:
+        progress(80, f'Сохранение ККТ: {len(all_items)}')
+    rnms = [item.get('KktRegId', '') for item in all_items]
+    existing = {k.kkt_reg_id: k for k in client.kkt_data.filter(kkt_reg_id__in=rnms)}
+
+    fetched = []
+    errors = []
+    to_create, to_update, activities = [], [], []
+    for item in all_items:
+        kkt_reg_id = item.get('KktRegId', '')
+        kkt_obj = existing.get(kkt_reg_id)
+        created = kkt_obj is None
+        if created:
+            kkt_obj = existing[kkt_reg_id] = KktData(client=client, kkt_reg_id=kkt_reg_id)
+            to_create.append(kkt_obj)
+        elif kkt_obj not in to_update:
+            to_update.append(kkt_obj)
+        old_fn = kkt_obj.fn_number  # запоминаем до изменения
+        _apply_ofd_item(kkt_obj, item)
+        fetched.append(kkt_reg_id)
+        if created:
+            activities.append(ClientActivity(
+                client=client, user=user,
+                action=f'Добавлена ККТ\nРНМ: {kkt_reg_id}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: {kkt_obj.fn_number or "—"}'
+            ))
+        elif old_fn and old_fn != kkt_obj.fn_number:
+            activities.append(ClientActivity(
+                client=client, user=user,
+                action=f'Изменён номер ФН\nРНМ: {kkt_reg_id}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: «{old_fn}» → «{kkt_obj.fn_number}»'
+            ))
+    _save_kkt_batch(to_create, to_update, activities)
+
+    return {
+        'success': True,
+        'fetched': fetched,
+        'errors': errors,
+        'elapsed': elapsed,
+        'message': f'Получено ККТ: {len(fetched)}, время: {elapsed} сек' + (f', ошибок: {len(errors)}' if errors else ''),
+    }, 200
+
+
+def _ofd_refresh_saved(client, user, inn, token, progress=None):
+    """Обновление сохранённых ККТ клиента — один запрос к ОФД по ИНН. Возвращает (payload, http_status)."""
+    import time
+    kkts = list(client.kkt_data.filter(kkt_reg_id__isnull=False).exclude(kkt_reg_id=''))
+    if not kkts:
+        return {'error': 'Нет сохранённых ККТ. Сначала нажмите «Получить данные с ОФД»'}, 404
+
+    t_start = time.time()
+    fetched = []
+    errors = []
+
+    if progress:
+        progress(10, 'Запрос к ОФД...')
+    # Один запрос к ОФД — получаем все ККТ компании по ИНН
+    try:
+        all_data = ofd_fetch_company(inn, token, timeout=OFD_COMPANY_TIMEOUT)
+    except Exception as e:
+        return {'error': str(e)}, 502
+
+    if all_data.get('Status') != 'Success':
+        return {'error': f'ОФД вернул ошибку: {all_data.get("Message") or all_data}'}, 502
+
+    # Строим словарь РНМ → данные из ОФД для быстрого поиска
+    ofd_by_rnm = {
+        item.get('KktRegId', ''): item
+        for item in all_data.get('Data', [])
+        if item.get('KktRegId')
+    }
+
+    if progress:
+        progress(80, f'Сохранение ККТ: {len(kkts)}')
+    # Обновляем только те ККТ, которые есть в БД у клиента
+    to_update, activities = [], []
+    for kkt_obj in kkts:
+        rnm = kkt_obj.kkt_reg_id
+        item = ofd_by_rnm.get(rnm)
+        if not item:
+            errors.append(f'РНМ {rnm}: не найден в ОФД (касса не зарегистрирована или РНМ изменился)')
+            continue
+        old_fn = kkt_obj.fn_number
+        old_serial = kkt_obj.serial_number
+        was_empty = not old_serial and not old_fn
+        _apply_ofd_item(kkt_obj, item)
+        to_update.append(kkt_obj)
+        fetched.append(rnm)
+        if was_empty and (kkt_obj.serial_number or kkt_obj.fn_number):
+            activities.append(ClientActivity(
+                client=client, user=user,
+                action=f'Обновлена ККТ по РНМ\nРНМ: {rnm}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: {kkt_obj.fn_number or "—"}\nМодель: {kkt_obj.kkt_model or "—"}'
+            ))
+        elif old_fn and old_fn != kkt_obj.fn_number:
+            activities.append(ClientActivity(
+                client=client, user=user,
+                action=f'Изменён номер ФН\nРНМ: {rnm}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: «{old_fn}» → «{kkt_obj.fn_number}»'
+            ))
+    _save_kkt_batch([], to_update, activities)
+
+    elapsed = round(time.time() - t_start, 1)
+    return {
+        'success': True,
+        'fetched': fetched,
+        'errors': errors,
+        'elapsed': elapsed,
+        'message': f'Обновлено ККТ: {len(fetched)}, время: {elapsed} сек' + (f', ошибок: {len(errors)}' if errors else ''),
+    }, 200
+
+
+def _ofd_fetch_rnm(client, user, inn, token, rnm, progress=None):
+    """Данные по одному РНМ (режим создания клиента) с проверкой адреса. Возвращает (payload, http_status)."""
+    import time
+    t_start = time.time()
+    if progress:
+        progress(10, f'Запрос к ОФД по РНМ {rnm}...')
+    script = '/usr/local/bin/ofd_fetch.sh'
+    try:
+        result = subprocess.run(
+            [script, inn, token, rnm],
+            capture_output=True, text=True, timeout=OFD_RNM_TIMEOUT
+        )
+        if not result.stdout.strip():
+            return {'error': f'Пустой ответ от скрипта для РНМ {rnm}. stderr: {result.stderr[:200]}'}, 502
+        detail_data = json.loads(result.stdout)
+    except Exception as e:
+        return {'error': f'Ошибка запроса для РНМ {rnm}: {str(e)}'}, 502
+
+    if detail_data.get('Status') != 'Success':
+        return {'error': f'ОФД вернул ошибку для РНМ {rnm}'}, 502
+
+    items = detail_data.get('Data', [])
+    if not items:
+        return {'error': f'ОФД не вернул данных для РНМ {rnm}'}, 404
+
+    # Проверяем что адрес ККТ совпадает с адресом клиента
+    client_address = (client.address or '').strip()
+    if client_address:
+        import re as _re
+        stop_words = {'ул', 'пр', 'пом', 'д', 'кв', 'г', 'р-н', 'ул.', 'пр.', 'д.', 'пом.',
+                      'г.', 'пр-кт', 'пр-кт.', 'проспект', 'улица', 'переулок', 'помещ',
+                      'помещение', 'область', 'край', 'республика', 'город'}
+        words = [w.strip('.,()-').lower() for w in _re.split(r'[\s,]+', client_address)]
+        words = [w for w in words if w and len(w) > 1 and w not in stop_words]
+        house_numbers = _re.findall(r'\b(\d+)\b', client_address)
+        house_num = house_numbers[-1] if house_numbers else None
+
+        fiscal_addr = (items[0].get('FiscalAddress') or '').lower()
+        addr_numbers = _re.findall(r'\b(\d+)\b', items[0].get('FiscalAddress', ''))
+
+        word_match = all(w in fiscal_addr for w in words)
+        house_match = (not house_num) or (house_num in addr_numbers)
+
+        if not (word_match and house_match):
+            return {
+                'success': False,
+                'fetched': [],
+                'errors': [
+                    f'РНМ {rnm}: адрес ККТ в ОФД («{items[0].get("FiscalAddress", "")}») '
+                    f'не совпадает с адресом клиента («{client_address}»)'
+                ],
+                'elapsed': round(time.time() - t_start, 1),
+                'message': f'РНМ {rnm} не добавлен: адрес не совпадает',
+            }, 200  # 200 чтобы фронт показал предупреждение, не ошибку
+
+    for item in items:
+        kkt_obj, created = KktData.objects.get_or_create(
+            client=client,
+            kkt_reg_id=item.get('KktRegId', rnm),
+        )
+        old_fn = kkt_obj.fn_number
+        _apply_ofd_item(kkt_obj, item)
+        kkt_obj.save()
+        if created:
+            ClientActivity.objects.create(
+                client=client, user=user,
+                action=f'Добавлена ККТ\nРНМ: {rnm}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: {kkt_obj.fn_number or "—"}'
+            )
+        elif old_fn and old_fn != kkt_obj.fn_number:
+            ClientActivity.objects.create(
+                client=client, user=user,
+                action=f'Изменён номер ФН\nРНМ: {rnm}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: «{old_fn}» → «{kkt_obj.fn_number}»'
+            )
+
+    elapsed = round(time.time() - t_start, 1)
+    return {
+        'success': True,
+        'fetched': [rnm],
+        'errors': [],
+        'elapsed': elapsed,
+        'message': f'Получены данные по РНМ {rnm}, время: {elapsed} сек',
+    }, 200
+
+
+def _run_ofd_job(job, client_id, user_id, mode, rnm=None):
+    from django.contrib.auth import get_user_model
+    try:
+        client = Client.objects.select_related('ofd_company').get(pk=client_id)
+    except Client.DoesNotExist:
+        return {'error': 'Клиент не найден'}
+    user = get_user_model().objects.filter(pk=user_id).first()
+    inn, token, error = _ofd_credentials(client, need_address=mode == 'fetch')
+    if error:
+        return {'error': error}
+
+    def progress(pct, text):
+        jobs.set_progress(job, pct, text)
+
+    if mode == 'rnm':
+        payload, _ = _ofd_fetch_rnm(client, user, inn, token, rnm, progress=progress)
+    else:
+        fn = _ofd_full_fetch if mode == 'fetch' else _ofd_refresh_saved
+        payload, _ = fn(client, user, inn, token, progress=progress)
+    return payload
+
+
+@jobs.register('ofd_kkt_fetch', priority=10, max_attempts=2, timeout=OFD_SCRIPT_TIMEOUT + OFD_JOB_MARGIN)
+def _job_ofd_kkt_fetch(job, client_id, user_id):
+    return _run_ofd_job(job, client_id, user_id, 'fetch')
+
+
+# ofd_fetch_company у неосновного вызова ждёт чужой ответ timeout + 5 сек
+@jobs.register('ofd_kkt_refresh', priority=10, max_attempts=2, timeout=OFD_COMPANY_TIMEOUT + 5 + OFD_JOB_MARGIN)
+def _job_ofd_kkt_refresh(job, client_id, user_id):
+    return _run_ofd_job(job, client_id, user_id, 'refresh')
+
+
+@jobs.register('ofd_kkt_rnm', priority=10, max_attempts=2, timeout=OFD_RNM_TIMEOUT + OFD_JOB_MARGIN)
+def _job_ofd_kkt_rnm(job, client_id, user_id, rnm):
+    return _run_ofd_job(job, client_id, user_id, 'rnm', rnm=rnm)
+
+
+def _submit_ofd_job(request, client, kind, rnm=None):
+    """
+    Ставит запрос к ОФД в фон и сразу отвечает 202 с job_id. Один активный запрос каждого типа
+    на клиента и пользователя (по РНМ — ещё и на РНМ) — повторные получают его job_id; полный поиск
+    и обновление сохранённых ККТ друг друга не подменяют. Пользователь в ключе — потому что
+    задание видно только поставившему его.
+    """
+    params = {'client_id': client.pk, 'user_id': request.user.pk}
+    dedup_key = f'ofd_kkt:{kind}:{client.pk}:{request.user.pk}'
+    if rnm:
+        params['rnm'] = rnm
+        dedup_key = f'{dedup_key}:{rnm}'
+    job, created = jobs.submit(kind, params=params, dedup_key=dedup_key, user=request.user)
+    return Response({
+        'job_id': str(job.pk),
+        'status': job.status,
+        'deduplicated': not created,
+        'progress_url': f'/api/clients/jobs/{job.pk}/',
+    }, status=202)
+
+
 class OfdKktView(APIView):
     """
     GET   /api/clients/{id}/ofd_kkt/  — получить сохранённые ККТ из БД
     POST  /api/clients/{id}/ofd_kkt/  — запросить данные с ОФД (полный поиск по ИНН+адресу)
     PATCH /api/clients/{id}/ofd_kkt/  — быстрое обновление по сохранённым РНМ
+    POST и PATCH с запросом к ОФД выполняются фоновым заданием: ответ 202 с job_id,
+    результат — GET /api/clients/jobs/{job_id}/
     """
     permission_classes = [IsAuthenticated]
 
@@ -120,74 +495,12 @@ class OfdKktView(APIView):
         except Client.DoesNotExist:
             return Response({'error': 'Клиент не найден'}, status=404)
 
-        if not client.ofd_company:
-            return Response({'error': 'У клиента не выбрана компания. Укажите компанию в карточке клиента.'}, status=400)
-
-        address = (client.address or '').strip()
-        if not address:
-            return Response({'error': 'У клиента не заполнен адрес'}, status=400)
-
-        inn = client.ofd_company.inn.strip()
-        token = client.ofd_company.ofd_token.strip()
-
-        if not inn:
-            return Response({'error': f'У компании «{client.ofd_company.name}» не заполнен ИНН'}, status=400)
-        if not token:
-            return Response({'error': f'У компании «{client.ofd_company.name}» не задан токен ОФД. Откройте раздел «Компании» и добавьте токен.'}, status=400)
+        inn, token, error = _ofd_credentials(client, need_address=True)
+        if error:
+            return Response({'error': error}, status=400)
 
         # Один вызов скрипта — он сам фильтрует по адресу и получает детали
-        try:
-            import time
-            t_start = time.time()
-            result_data = ofd_request(inn, token, address)
-            elapsed = round(time.time() - t_start, 1)
-        except Exception as e:
-            return Response({'error': f'Ошибка запроса к ОФД: {str(e)}'}, status=502)
-
-        if result_data.get('Status') != 'Success':
-            return Response({'error': f'ОФД вернул ошибку: {result_data}'}, status=502)
-
-        all_items = result_data.get('Data', [])
-        if not all_items:
-            return Response({'error': f'ККТ по адресу «{address}» не найдены в ОФД. Проверьте адрес клиента — он должен совпадать с адресом установки кассы в ОФД.'}, status=404)
-
-        fetched = []
-        errors = []
-        for item in all_items:
-            kkt_reg_id = item.get('KktRegId', '')
-            kkt_obj, created = KktData.objects.get_or_create(
-                client=client,
-                kkt_reg_id=kkt_reg_id,
-            )
-            old_fn = kkt_obj.fn_number  # запоминаем до изменения
-            kkt_obj.serial_number = item.get('SerialNumber', '')
-            kkt_obj.fn_number = item.get('FnNumber', '')
-            kkt_obj.kkt_model = item.get('KktModel', '')
-            kkt_obj.create_date = parse_datetime(item.get('CreateDate'))
-            kkt_obj.contract_end_date = parse_datetime(item.get('ContractEndDate'))
-            kkt_obj.fn_end_date = parse_datetime(item.get('FnEndDate'))
-            kkt_obj.fiscal_address = item.get('FiscalAddress', '')
-            kkt_obj.raw_data = item
-            kkt_obj.save()
-            fetched.append(kkt_reg_id)
-            if created:
-                ClientActivity.objects.create(
-                    client=client, user=request.user,
-                    action=f'Добавлена ККТ\nРНМ: {kkt_reg_id}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: {kkt_obj.fn_number or "—"}'
-                )
-            elif old_fn and old_fn != kkt_obj.fn_number:
-                ClientActivity.objects.create(
-                    client=client, user=request.user,
-                    action=f'Изменён номер ФН\nРНМ: {kkt_reg_id}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: «{old_fn}» → «{kkt_obj.fn_number}»'
-                )
-
-        return Response({
-            'success': True,
-            'fetched': fetched,
-            'errors': errors,
-            'elapsed': elapsed,
-            'message': f'Получено ККТ: {len(fetched)}, время: {elapsed} сек' + (f', ошибок: {len(errors)}' if errors else ''),
-        })
+        return _submit_ofd_job(request, client, 'ofd_kkt_fetch')
 
     def delete(self, request, pk=None, kkt_id=None):
         """DELETE /api/clients/{id}/ofd_kkt/{kkt_id}/ — удалить одну ККТ"""
@@ -271,166 +584,10 @@ class OfdKktView(APIView):
             import re
             if not re.match(r'^\d{16}$', rnm_override):
                 return Response({'error': f'Некорректный РНМ: «{rnm_override}». Должно быть 16 цифр.'}, status=400)
-            import time
-            t_start = time.time()
-            script = '/usr/local/bin/ofd_fetch.sh'
-            try:
-                result = subprocess.run(
-                    [script, inn, token, rnm_override],
-                    capture_output=True, text=True, timeout=15
-                )
-                if not result.stdout.strip():
-                    return Response({'error': f'Пустой ответ от скрипта для РНМ {rnm_override}. stderr: {result.stderr[:200]}'}, status=502)
-                detail_data = json.loads(result.stdout)
-            except Exception as e:
-                return Response({'error': f'Ошибка запроса для РНМ {rnm_override}: {str(e)}'}, status=502)
-
-            if detail_data.get('Status') != 'Success':
-                return Response({'error': f'ОФД вернул ошибку для РНМ {rnm_override}'}, status=502)
-
-            items = detail_data.get('Data', [])
-            if not items:
-                return Response({'error': f'ОФД не вернул данных для РНМ {rnm_override}'}, status=404)
-
-            # Проверяем что адрес ККТ совпадает с адресом клиента
-            client_address = (client.address or '').strip()
-            if client_address:
-                import re as _re
-                stop_words = {'ул', 'пр', 'пом', 'д', 'кв', 'г', 'р-н', 'ул.', 'пр.', 'д.', 'пом.',
-                                'г.', 'пр-кт', 'пр-кт.', 'проспект', 'улица', 'переулок', 'помещ',
-                                'помещение', 'область', 'край', 'республика', 'город'}
-                words = [w.strip('.,()-').lower() for w in _re.split(r'[\s,]+', client_address)]
-                words = [w for w in words if w and len(w) > 1 and w not in stop_words]
-                house_numbers = _re.findall(r'\b(\d+)\b', client_address)
-                house_num = house_numbers[-1] if house_numbers else None
-
-                fiscal_addr = (items[0].get('FiscalAddress') or '').lower()
-                addr_numbers = _re.findall(r'\b(\d+)\b', items[0].get('FiscalAddress', ''))
-
-                word_match = all(w in fiscal_addr for w in words)
-                house_match = (not house_num) or (house_num in addr_numbers)
-
-                if not (word_match and house_match):
-                    return Response({
-                        'success': False,
-                        'fetched': [],
-                        'errors': [
-                            f'РНМ {rnm_override}: адрес ККТ в ОФД («{items[0].get("FiscalAddress", "")}») '
-                            f'не совпадает с адресом клиента («{client_address}»)'
-                        ],
-                        'elapsed': round(time.time() - t_start, 1),
-                        'message': f'РНМ {rnm_override} не добавлен: адрес не совпадает',
-                    }, status=200)  # 200 чтобы фронт показал предупреждение, не ошибку
-
-            for item in items:
-                kkt_obj, created = KktData.objects.get_or_create(
-                    client=client,
-                    kkt_reg_id=item.get('KktRegId', rnm_override),
-                )
-                old_fn = kkt_obj.fn_number
-                kkt_obj.serial_number = item.get('SerialNumber', '')
-                kkt_obj.fn_number = item.get('FnNumber', '')
-                kkt_obj.kkt_model = item.get('KktModel', '')
-                kkt_obj.create_date = parse_datetime(item.get('CreateDate'))
-                kkt_obj.contract_end_date = parse_datetime(item.get('ContractEndDate'))
-                kkt_obj.fn_end_date = parse_datetime(item.get('FnEndDate'))
-                kkt_obj.fiscal_address = item.get('FiscalAddress', '')
-                kkt_obj.raw_data = item
-                kkt_obj.save()
-                if created:
-                    ClientActivity.objects.create(
-                        client=client, user=request.user,
-                        action=f'Добавлена ККТ\nРНМ: {rnm_override}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: {kkt_obj.fn_number or "—"}'
-                    )
-                elif old_fn and old_fn != kkt_obj.fn_number:
-                    ClientActivity.objects.create(
-                        client=client, user=request.user,
-                        action=f'Изменён номер ФН\nРНМ: {rnm_override}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: «{old_fn}» → «{kkt_obj.fn_number}»'
-                    )
-
-            elapsed = round(time.time() - t_start, 1)
-            return Response({
-                'success': True,
-                'fetched': [rnm_override],
-                'errors': [],
-                'elapsed': elapsed,
-                'message': f'Получены данные по РНМ {rnm_override}, время: {elapsed} сек',
-            })
+            return _submit_ofd_job(request, client, 'ofd_kkt_rnm', rnm=rnm_override)
 
         # Стандартный режим — один запрос к ОФД по ИНН, фильтрация по РНМ из БД
-        kkts = list(client.kkt_data.filter(kkt_reg_id__isnull=False).exclude(kkt_reg_id=''))
-        if not kkts:
-            return Response({'error': 'Нет сохранённых ККТ. Сначала нажмите «Получить данные с ОФД»'}, status=404)
-
-        import time
-        t_start = time.time()
-        script = '/usr/local/bin/ofd_fetch.sh'
-        fetched = []
-        errors = []
-
-        # Один запрос к ОФД — получаем все ККТ компании по ИНН
-        try:
-            result = subprocess.run(
-                [script, inn, token],
-                capture_output=True, text=True, timeout=60
-            )
-            if not result.stdout.strip():
-                return Response({'error': f'Пустой ответ от ОФД. stderr: {result.stderr[:200]}'}, status=502)
-            all_data = json.loads(result.stdout)
-        except subprocess.TimeoutExpired:
-            return Response({'error': 'Превышено время ожидания ответа от ОФД (60 сек)'}, status=502)
-        except Exception as e:
-            return Response({'error': f'Ошибка запроса к ОФД: {str(e)}'}, status=502)
-
-        if all_data.get('Status') != 'Success':
-            return Response({'error': f'ОФД вернул ошибку: {all_data.get("Message") or all_data}'}, status=502)
-
-        # Строим словарь РНМ → данные из ОФД для быстрого поиска
-        ofd_by_rnm = {
-            item.get('KktRegId', ''): item
-            for item in all_data.get('Data', [])
-            if item.get('KktRegId')
-        }
-
-        # Обновляем только те ККТ, которые есть в БД у клиента
-        for kkt_obj in kkts:
-            rnm = kkt_obj.kkt_reg_id
-            item = ofd_by_rnm.get(rnm)
-            if not item:
-                errors.append(f'РНМ {rnm}: не найден в ОФД (касса не зарегистрирована или РНМ изменился)')
-                continue
-            old_fn = kkt_obj.fn_number
-            old_serial = kkt_obj.serial_number
-            was_empty = not old_serial and not old_fn
-            kkt_obj.serial_number = item.get('SerialNumber', '')
-            kkt_obj.fn_number = item.get('FnNumber', '')
-            kkt_obj.kkt_model = item.get('KktModel', '')
-            kkt_obj.create_date = parse_datetime(item.get('CreateDate'))
-            kkt_obj.contract_end_date = parse_datetime(item.get('ContractEndDate'))
-            kkt_obj.fn_end_date = parse_datetime(item.get('FnEndDate'))
-            kkt_obj.fiscal_address = item.get('FiscalAddress', '')
-            kkt_obj.raw_data = item
-            kkt_obj.save()
-            fetched.append(rnm)
-            if was_empty and (kkt_obj.serial_number or kkt_obj.fn_number):
-                ClientActivity.objects.create(
-                    client=client, user=request.user,
-                    action=f'Обновлена ККТ по РНМ\nРНМ: {rnm}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: {kkt_obj.fn_number or "—"}\nМодель: {kkt_obj.kkt_model or "—"}'
-                )
-            elif old_fn and old_fn != kkt_obj.fn_number:
-                ClientActivity.objects.create(
-                    client=client, user=request.user,
-                    action=f'Изменён номер ФН\nРНМ: {rnm}\nСерийный номер: {kkt_obj.serial_number or "—"}\nНомер ФН: «{old_fn}» → «{kkt_obj.fn_number}»'
-                )
-
-        elapsed = round(time.time() - t_start, 1)
-        return Response({
-            'success': True,
-            'fetched': fetched,
-            'errors': errors,
-            'elapsed': elapsed,
-            'message': f'Обновлено ККТ: {len(fetched)}, время: {elapsed} сек' + (f', ошибок: {len(errors)}' if errors else ''),
-        })
+        return _submit_ofd_job(request, client, 'ofd_kkt_refresh')
 
 
 def _kkt_queryset(params):
@@ -454,7 +611,12 @@ def _kkt_queryset(params):
     month = params.get('month')
     year  = params.get('year')
     if month and year:
-        qs = qs.filter(fn_end_date__year=int(year), fn_end_date__month=int(month))
+        from .utils import month_datetime_range
+        try:
+            start, end = month_datetime_range(year, month)
+        except ValueError:
+            return qs.none()   # несуществующий месяц — пустой список, как и раньше
+        qs = qs.filter(fn_end_date__gte=start, fn_end_date__lt=end)
 
     allowed_orderings = {
         'client__address', '-client__address',
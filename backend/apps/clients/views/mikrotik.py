@@ -0,0 +1,287 @@
+"""
+Данные с Микротика клиента: IP касс из DHCP-сервера, внешний IP, ресурсы, интерфейсы.
+
+Сборщик (collect) выполняет набор секций — команд RouterOS — одним скриптом в одной
+SSH-сессии: каждая секция печатает маркер и выполняется в :do {} on-error={},
+так что ошибка одной секции не обрывает остальные. Вывод разбирается по маркерам
+в структуру {секция: результат} и сохраняется в MikrotikState одной записью.
+
+IP касс кешируются в MikrotikState (общий для всех воркеров):
+  - моложе KASSA_CACHE_TTL — отдаётся как есть;
+  - старше, но моложе KASSA_CACHE_MAX_STALE — отдаётся сразу, а обновление
+    ставится фоновым заданием (stale-while-revalidate);
+  - иначе — запрос к Микротику по SSH в рамках HTTP-запроса.
+"""
+
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .. import jobs
+from .ssh_utils import mikrotik_exec, ssh_error_text, host_deadline, EXTERNAL_IP_CMD
+
+KASSA_NAMES = [f'kassa{i}' for i in range(1, 7)]
+
+# Таймауты сборщика (сек): подключение и выполнение скрипта всех секций
+COLLECT_CONNECT_TIMEOUT = 10
+COLLECT_EXEC_TIMEOUT = 40
+
+KASSA_CMD = (
+    ':foreach i in={"kassa1";"kassa2";"kassa3";"kassa4";"kassa5";"kassa6"} do={'
+    ':local l [/ip dhcp-server lease find where host-name=$i]; '
+    ':if ($l!="") do={:put "$i -> $[/ip dhcp-server lease get $l address]"} '
+    'else={:put "$i -> not found"}}'
+)
+
+
+def parse_kassa_output(output):
+    """Вывод вида "kassa1 -> 10.1.64.10" / "kassa1 -> not found" → {kassa1: ip|None, …}."""
+    result = {}
+    for line in output.splitlines():
+        m = re.match(r'^(kassa\d+)\s*->\s*(.+)$', line.strip())
+        if m:
+            name, value = m.group(1), m.group(2).strip()
+            result[name] = None if value == 'not found' else value
+    # Заполняем отсутствующие кассы None
+    for name in KASSA_NAMES:
+        result.setdefault(name, None)
+    return result
+
+
+def fetch_kassa_ips(mikrotik_ip, ssh_user, ssh_password):
+    """IP касс с Микротика по SSH. Исключения SSH пробрасываются."""
+    return parse_kassa_output(mikrotik_exec(mikrotik_ip, ssh_user, ssh_password, KASSA_CMD))
+
+
+# ── Сборщик ─────────────────────────────────────────────────────────────────
+
+SECTION_MARK = '##section:'
+SECTION_ERROR = '##error'
+
+RESOURCE_CMD = (
+    ':put ("uptime=" . [/system resource get uptime]); '
+    ':put ("version=" . [/system resource get version]); '
+    ':put ("board=" . [/system resource get board-name]); '
+    ':put ("cpu_load=" . [/system resource get cpu-load]); '
+    ':put ("free_memory=" . [/system resource get free-memory]); '
+    ':put ("total_memory=" . [/system resource get total-memory])'
+)
+
+INTERFACES_CMD = (
+    ':foreach i in=[/interface find] do={'
+    ':put ([/interface get $i name] . "|" . [/interface get $i type] . "|" . '
+    '[/interface get $i running] . "|" . [/interface get $i disabled] . "|" . '
+    '[/interface get $i rx-byte] . "|" . [/interface get $i tx-byte])}'
+)
+
+_IP_RE = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
+_UPTIME_RE = re.compile(r'^(?:(\d+)w)?(?:(\d+)d)?(\d+):(\d+):(\d+)$')
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_uptime(value):
+    """RouterOS uptime "1w2d03:04:05" → секунды."""
+    m = _UPTIME_RE.match((value or '').strip())
+    if not m:
+        return None
+    w, d, h, mi, se = (int(x or 0) for x in m.groups())
+    return (((w * 7 + d) * 24 + h) * 60 + mi) * 60 + se
+
+
+def _parse_external_ip(output):
+    ip = output.strip()
+    if not ip:
+        raise ValueError('пустой ответ')
+    # Проверяем что получили валидный IP, а не строку ошибки от Микротика
+    if not _IP_RE.match(ip):
+        raise ValueError(f'неверный ответ от Микротика: {ip[:50]}')
+    return ip
+
+
+def _parse_resource(output):
+    result = {}
+    for line in output.splitlines():
+        key, sep, value = line.strip().partition('=')
+        if sep:
+            result[key] = value
+    for key in ('cpu_load', 'free_memory', 'total_memory'):
+        if key in result:
+            result[key] = _int_or_none(result[key])
+    if 'uptime' in result:
+        result['uptime_seconds'] = parse_uptime(result['uptime'])
+    return result
+
+
+def _parse_interfaces(output):
+    result = []
+    for line in output.splitlines():
+        parts = line.strip().split('|')
+        if len(parts) != 6:
+            continue
+        name, kind, running, disabled, rx, tx = parts
+        result.append({
+            'name': name, 'type': kind,
+            'running': running == 'true', 'disabled': disabled == 'true',
+            'rx_bytes': _int_or_none(rx), 'tx_bytes': _int_or_none(tx),
+        })
+    return result
+
+
+# Секция → (скрипт RouterOS, разбор вывода)
+SECTIONS = {
+    'external_ip': (EXTERNAL_IP_CMD, _parse_external_ip),
+    'kassa_ips':   (KASSA_CMD, parse_kassa_output),
+    'resource':    (RESOURCE_CMD, _parse_resource),
+    'interfaces':  (INTERFACES_CMD, _parse_interfaces),
+}
+
+
+def default_sections():
+    """Секции из настройки MIKROTIK_COLLECT_SECTIONS (неизвестные пропускаются)."""
+    names = [n.strip() for n in settings.MIKROTIK_COLLECT_SECTIONS.split(',')]
+    return [n for n in names if n in SECTIONS]
+
+
+def build_script(sections):
+    parts = []
+    for name in sections:
+        cmd, _ = SECTIONS[name]
+        parts.append(f':put "{SECTION_MARK}{name}"; :do {{ {cmd} }} on-error={{ :put "{SECTION_ERROR}" }}')
+    return '; '.join(parts)
+
+
+def parse_collection(output, sections):
+    """
+    Вывод скрипта → {секция: результат}. Ошибки секций — в {'errors': {секция: текст}}.
+    Секция, которой нет в выводе, тоже считается ошибкой.
+    """
+    chunks = {}
+    current = None
+    for line in output.splitlines():
+        if line.startswith(SECTION_MARK):
+            current = line[len(SECTION_MARK):].strip()
+            chunks[current] = []
+        elif current is not None:
+            chunks[current].append(line)
+
+    result, errors = {}, {}
+    for name in sections:
+        lines = chunks.get(name)
+        if lines is None:
+            errors[name] = 'нет ответа'
+            continue
+        if lines and lines[-1].strip() == SECTION_ERROR:
+            errors[name] = 'ошибка выполнения на Микротике'
+            continue
+        try:
+            result[name] = SECTIONS[name][1]('\n'.join(lines))
+        except Exception as e:
+            errors[name] = str(e)[:200]
+    if errors:
+        result['errors'] = errors
+    return result
+
+
+def collect(mikrotik_ip, ssh_user, ssh_password, sections=None):
+    """Все секции одной командой в одной SSH-сессии. Исключения SSH пробрасываются."""
+    sections = sections or default_sections()
+    output = mikrotik_exec(mikrotik_ip, ssh_user, ssh_password, build_script(sections),
+                           connect_timeout=COLLECT_CONNECT_TIMEOUT, exec_timeout=COLLECT_EXEC_TIMEOUT)
+    return parse_collection(output, sections)
+
+
+def collect_deadline():
+    """Предел fan_out на один Микротик для collect(): не меньше его таймаутов SSH."""
+    return host_deadline(COLLECT_CONNECT_TIMEOUT, COLLECT_EXEC_TIMEOUT)
+
+
+def collection_state(client, mikrotik_ip, result, sections, now):
+    """
+    MikrotikState по результату сборщика и список полей для записи.
+    IP касс обновляются только если секция kassa_ips отработала — иначе остаётся прежний кеш.
+    facts перезаписываются, только если собирались секции кроме kassa_ips.
+    """
+    from ..models import MikrotikState
+    state = MikrotikState(client=client, mikrotik_ip=mikrotik_ip)
+    fields = ['mikrotik_ip']
+    if 'kassa_ips' in result:
+        state.kassa_ips = result['kassa_ips']
+        state.kassa_updated_at = now
+        fields += ['kassa_ips', 'kassa_updated_at']
+    if any(name != 'kassa_ips' for name in sections):
+        facts = {k: v for k, v in result.items() if k != 'kassa_ips'}
+        state.facts = facts
+        state.collected_at = now
+        fields += ['facts', 'collected_at']
+    return state, tuple(fields)
+
+
+def save_states(states):
+    """Пакетная запись [(MikrotikState, fields)] — upsert по клиенту, группами с одинаковым набором полей."""
+    from ..models import MikrotikState
+    groups = {}
+    for state, fields in states:
+        groups.setdefault(fields, []).append(state)
+    for fields, objs in groups.items():
+        MikrotikState.objects.bulk_create(
+            objs, batch_size=500, update_conflicts=True, unique_fields=['client'],
+            update_fields=list(fields),
+        )
+
+
+def save_kassa_ips(client_id, mikrotik_ip, kassa_ips, now=None):
+    from ..models import MikrotikState
+    now = now or timezone.now()
+    MikrotikState.objects.update_or_create(
+        client_id=client_id,
+        defaults={'mikrotik_ip': mikrotik_ip, 'kassa_ips': kassa_ips, 'kassa_updated_at': now},
+    )
+    return now
+
+
+def cached_kassa_ips(client, mikrotik_ip):
+    """(kassa_ips, updated_at, fresh) из кеша или None, если кеш не годится."""
+    from ..models import MikrotikState
+    state = MikrotikState.objects.filter(client=client).first()
+    if not state or not state.kassa_updated_at or state.mikrotik_ip != mikrotik_ip:
+        return None
+    age = timezone.now() - state.kassa_updated_at
+    if age >= timedelta(seconds=settings.KASSA_CACHE_MAX_STALE):
+        return None
+    return state.kassa_ips, state.kassa_updated_at, age < timedelta(seconds=settings.KASSA_CACHE_TTL)
+
+
+def submit_kassa_refresh(client_id, user=None):
+    """Фоновое обновление IP касс клиента (одно на клиента одновременно)."""
+    job, _ = jobs.submit(
+        'kassa_ips_refresh', {'client_id': client_id},
+        dedup_key=f'kassa_ips:{client_id}', user=user,
+    )
+    return job
+
+
+@jobs.register('kassa_ips_refresh', priority=5, concurrency=8, max_attempts=2, timeout=120)
+def _kassa_refresh_job(job, client_id):
+    from ..models import Client, SystemSettings
+    try:
+        client = Client.objects.get(pk=client_id)
+    except Client.DoesNotExist:
+        return {'error': 'Клиент не найден'}
+    mikrotik_ip = (client.mikrotik_ip or '').strip()
+    settings_obj = SystemSettings.get()
+    if not mikrotik_ip or not settings_obj.ssh_user or not settings_obj.ssh_password_encrypted:
+        return {'error': 'Микротик IP или SSH не настроены'}
+    try:
+        kassa_ips = fetch_kassa_ips(mikrotik_ip, settings_obj.ssh_user, settings_obj.ssh_password)
+    except Exception as e:
+        return {'error': ssh_error_text(e)}
+    save_kassa_ips(client.pk, mikrotik_ip, kassa_ips)
+    return kassa_ips
@@ -6,41 +6,8 @@ from ..models import Client, KktData, Provider, OfdCompany, ClientActivity, Syst
 from ..serializers import ProviderSerializer, OfdCompanySerializer, OfdCompanyWriteSerializer
 from apps.accounts.permissions import CanEditClient
 from .utils import ping_ip
-
-KNOWN_HOSTS_FILE = '/opt/support-portal/known_hosts'
-
-
-def _make_ssh_client(host):
-    """
-    Создаёт SSHClient с проверкой host key через known_hosts.
-    При первом подключении — запоминает ключ (как ssh-keyscan).
-    При повторных — проверяет что ключ не изменился (защита от MITM).
-    """
-    import paramiko, os
-    ssh = paramiko.SSHClient()
-
-    # Загружаем known_hosts если файл существует
-    if os.path.exists(KNOWN_HOSTS_FILE):
-        ssh.load_host_keys(KNOWN_HOSTS_FILE)
-
-    # При первом подключении к хосту — запоминаем ключ
-    # При повторном — RejectPolicy отклонит если ключ изменился
-    known_hosts = ssh.get_host_keys()
-    if host not in known_hosts:
-        # Хост новый — доверяем первому подключению и сохраняем ключ
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    else:
-        # Хост уже знаком — отклоняем если ключ изменился
-        ssh.set_missing_host_key_policy(paramiko.RejectPolicy())
-
-    return ssh
-
-
-def _save_known_hosts(ssh):
-    """Сохраняет known_hosts после подключения."""
-    import os
-    os.makedirs(os.path.dirname(KNOWN_HOSTS_FILE), exist_ok=True)
-    ssh.save_host_keys(KNOWN_HOSTS_FILE)
+from .ssh_utils import mikrotik_exec, host_key_changed, EXTERNAL_IP_CMD
+from .mikrotik import cached_kassa_ips, fetch_kassa_ips, save_kassa_ips, submit_kassa_refresh, collect, collection_state, save_states, default_sections
 
 
 class FetchExternalIPView(APIView):
@@ -64,18 +31,7 @@ class FetchExternalIPView(APIView):
             return Response({'error': f'Микротик {mikrotik_ip} недоступен'}, status=400)
 
         try:
-            ssh = _make_ssh_client(mikrotik_ip)
-            ssh.connect(
-                mikrotik_ip,
-                username=settings_obj.ssh_user,
-                password=settings_obj.ssh_password,
-                timeout=10, port=22
-            )
-            _save_known_hosts(ssh)
-            cmd = ':put ([/tool fetch url="https://api.ipify.org" http-method=get output=user as-value]->"data")'
-            stdin, stdout, stderr = ssh.exec_command(cmd, timeout=15)
-            new_ip = stdout.read().decode().strip()
-            ssh.close()
+            new_ip = mikrotik_exec(mikrotik_ip, settings_obj.ssh_user, settings_obj.ssh_password, EXTERNAL_IP_CMD)
 
             if not new_ip:
                 return Response({'error': 'Не удалось получить внешний IP с Микротика'}, status=400)
@@ -93,10 +49,10 @@ class FetchExternalIPView(APIView):
             return Response({'error': f'Ошибка аутентификации SSH на {mikrotik_ip}'}, status=400)
         except paramiko.SSHException as e:
             err_str = str(e)
-            if 'not found in known_hosts' in err_str or 'changed' in err_str.lower():
+            if host_key_changed(e):
                 return Response({'error': (
                     f'SSH ключ Микротика {mikrotik_ip} изменился — возможно Микротик был заменён. '
-                    f'Удалите старую запись из /opt/support-portal/known_hosts и повторите попытку.'
+                    f'Удалите сохранённый ключ в списке SSH-ключей и повторите попытку.'
                 )}, status=400)
             return Response({'error': f'SSH ошибка {mikrotik_ip}: {err_str}'}, status=400)
         except Exception as e:
@@ -106,12 +62,14 @@ class FetchExternalIPView(APIView):
 class KassaIpsView(APIView):
     """
     Получает IP-адреса касс 1-6 из DHCP-сервера Микротика по SSH.
-    Данные не сохраняются в БД и не логируются в историю изменений.
+    Ответ кешируется (MikrotikState): свежий — отдаётся сразу, устаревший — тоже сразу,
+    а обновление уходит в фон. ?refresh=1 — принудительно запросить Микротик.
+    В историю изменений не логируется.
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
-        import paramiko, re
+        import paramiko
 
         try:
             client = Client.objects.get(pk=pk)
@@ -122,57 +80,82 @@ class KassaIpsView(APIView):
         if not mikrotik_ip:
             return Response({'error': 'Микротик IP не задан у клиента'}, status=400)
 
+        if request.query_params.get('refresh') not in ('1', 'true'):
+            cached = cached_kassa_ips(client, mikrotik_ip)
+            if cached:
+                kassa_ips, updated_at, fresh = cached
+                result = {**kassa_ips, 'cached': True, 'stale': not fresh, 'updated_at': updated_at.isoformat()}
+                if not fresh:
+                    result['refresh_job_id'] = str(submit_kassa_refresh(client.pk, user=request.user).pk)
+                return Response(result)
+
         settings_obj = SystemSettings.get()
         if not settings_obj.ssh_user:
             return Response({'error': 'SSH пользователь не задан в настройках системы'}, status=400)
         if not settings_obj.ssh_password_encrypted:
             return Response({'error': 'SSH пароль не задан в настройках системы'}, status=400)
 
-        cmd = (
-            ':foreach i in={"kassa1";"kassa2";"kassa3";"kassa4";"kassa5";"kassa6"} do={'
-            ':local l [/ip dhcp-server lease find where host-name=$i]; '
-            ':if ($l!="") do={:put "$i -> $[/ip dhcp-server lease get $l address]"} '
-            'else={:put "$i -> not found"}}'
-        )
-
         try:
-            ssh = _make_ssh_client(mikrotik_ip)
-            ssh.connect(
-                mikrotik_ip,
-                username=settings_obj.ssh_user,
-                password=settings_obj.ssh_password,
-                timeout=10, port=22,
-            )
-            _save_known_hosts(ssh)
-            stdin, stdout, stderr = ssh.exec_command(cmd, timeout=15)
-            output = stdout.read().decode('utf-8', errors='replace').strip()
-            ssh.close()
+            result = fetch_kassa_ips(mikrotik_ip, settings_obj.ssh_user, settings_obj.ssh_password)
         except paramiko.AuthenticationException:
             return Response({'error': f'Ошибка аутентификации SSH на {mikrotik_ip}'}, status=400)
         except paramiko.SSHException as e:
             err_str = str(e)
-            if 'not found in known_hosts' in err_str or 'changed' in err_str.lower():
+            if host_key_changed(e):
                 return Response({'error': (
                     f'SSH ключ Микротика {mikrotik_ip} изменился. '
-                    f'Удалите старую запись из known_hosts и повторите попытку.'
+                    f'Удалите сохранённый ключ в списке SSH-ключей и повторите попытку.'
                 )}, status=400)
             return Response({'error': f'SSH ошибка {mikrotik_ip}: {err_str}'}, status=400)
         except Exception as e:
             return Response({'error': f'Ошибка подключения к {mikrotik_ip}: {str(e)}'}, status=400)
 
-        # Парсим вывод: "kassa1 -> 10.1.64.10" или "kassa1 -> not found"
-        result = {}
-        for line in output.splitlines():
-            m = re.match(r'^(kassa\d+)\s*->\s*(.+)$', line.strip())
-            if m:
-                name, value = m.group(1), m.group(2).strip()
-                result[name] = None if value == 'not found' else value
+        updated_at = save_kassa_ips(client.pk, mikrotik_ip, result)
+        return Response({**result, 'cached': False, 'stale': False, 'updated_at': updated_at.isoformat()})
 
-        # Заполняем отсутствующие кассы None
-        for i in range(1, 7):
-            result.setdefault(f'kassa{i}', None)
 
-        return Response(result)
+class MikrotikFactsView(APIView):
+    """
+    GET /api/clients/{id}/mikrotik/ — данные Микротика клиента из последнего сбора
+    (внешний IP, IP касс, ресурсы, интерфейсы). ?refresh=1 — собрать сейчас (одна SSH-сессия).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        from django.utils import timezone
+        from ..models import MikrotikState
+
+        try:
+            client = Client.objects.get(pk=pk)
+        except Client.DoesNotExist:
+            return Response({'error': 'Клиент не найден'}, status=404)
+
+        mikrotik_ip = (client.mikrotik_ip or '').strip()
+        if not mikrotik_ip:
+            return Response({'error': 'Микротик IP не задан у клиента'}, status=400)
+
+        if request.query_params.get('refresh') in ('1', 'true'):
+            settings_obj = SystemSettings.get()
+            if not settings_obj.ssh_user or not settings_obj.ssh_password_encrypted:
+                return Response({'error': 'SSH пользователь или пароль не заданы в настройках системы'}, status=400)
+            sections = default_sections()
+            try:
+                result = collect(mikrotik_ip, settings_obj.ssh_user, settings_obj.ssh_password, sections)
+            except Exception as e:
+                from .ssh_utils import ssh_error_text
+                return Response({'error': f'Ошибка подключения к {mikrotik_ip}: {ssh_error_text(e)}'}, status=400)
+            save_states([collection_state(client, mikrotik_ip, result, sections, timezone.now())])
+
+        state = MikrotikState.objects.filter(client=client, mikrotik_ip=mikrotik_ip).first()
+        if not state:
+            return Response({'mikrotik_ip': mikrotik_ip, 'collected_at': None})
+        return Response({
+            'mikrotik_ip':      mikrotik_ip,
+            'collected_at':     state.collected_at.isoformat() if state.collected_at else None,
+            **state.facts,
+            'kassa_ips':        state.kassa_ips,
+            'kassa_updated_at': state.kassa_updated_at.isoformat() if state.kassa_updated_at else None,
+        })
 
 
 class OfdCompanyViewSet(viewsets.ModelViewSet):
@@ -206,7 +189,7 @@ class DashboardStatsView(APIView):
     def get(self, request):
         from django.db.models import Count
         from django.utils import timezone
-        from datetime import timedelta, date
+        from datetime import timedelta
         import os
 
         clients = Client.objects.filter(is_draft=False)
@@ -233,7 +216,6 @@ class DashboardStatsView(APIView):
         # ── ФН статистика ──────────────────────────────────────
         from ..models import KktData
         from django.db.models import Q
-        import calendar as cal_mod
 
         fn_expired = KktData.objects.filter(
             client__is_draft=False,
@@ -241,26 +223,19 @@ class DashboardStatsView(APIView):
             fn_end_date__lt=now,
         ).count()
 
-        this_month_start = today.replace(day=1)
-        this_month_end = today.replace(day=cal_mod.monthrange(today.year, today.month)[1])
+        from .utils import month_datetime_range
+        this_month_start, this_month_end = month_datetime_range(today.year, today.month)
         fn_this_month = KktData.objects.filter(
             client__is_draft=False,
-            fn_end_date__date__gte=this_month_start,
-            fn_end_date__date__lte=this_month_end,
+            fn_end_date__gte=this_month_start,
+            fn_end_date__lt=this_month_end,
         ).count()
 
-        if today.month == 12:
-            next_month_start = date(today.year + 1, 1, 1)
-            next_month_end = date(today.year + 1, 1, 31)
-        else:
-            next_month_start = date(today.year, today.month + 1, 1)
-            next_month_end = date(today.year, today.month + 1,
-                                  cal_mod.monthrange(today.year, today.month + 1)[1])
-
+        next_month_start, next_month_end = month_datetime_range(this_month_end.year, this_month_end.month)
         fn_next_month = KktData.objects.filter(
             client__is_draft=False,
-            fn_end_date__date__gte=next_month_start,
-            fn_end_date__date__lte=next_month_end,
+            fn_end_date__gte=next_month_start,
+            fn_end_date__lt=next_month_end,
         ).count()
 
         # Ближайшие замены ФН
@@ -294,18 +269,14 @@ class DashboardStatsView(APIView):
         BACKUP_DIR = '/opt/support-portal/backups'
         backup_info = {'last_backup': None, 'size_str': None, 'count': 0}
         if os.path.exists(BACKUP_DIR):
-            files = sorted([
-                f for f in os.listdir(BACKUP_DIR)
-                if f.startswith('backup_') and f.endswith('.tar.gz')
-            ], reverse=True)
-            backup_info['count'] = len(files)
-            if files:
-                fpath = os.path.join(BACKUP_DIR, files[0])
-                import stat as stat_mod
-                mtime = os.stat(fpath).st_mtime
+            # Индекс бэкапов (backup_index) — одно чтение вместо stat каждого архива
+            from ..backup_index import archive_size, backups as backup_entries
+            entries = backup_entries(BACKUP_DIR)
+            backup_info['count'] = len(entries)
+            if entries:
                 from datetime import datetime
-                backup_info['last_backup'] = datetime.fromtimestamp(mtime).strftime('%d.%m.%Y %H:%M')
-                size = os.path.getsize(fpath)
+                backup_info['last_backup'] = datetime.fromtimestamp(entries[0]['created_at']).strftime('%d.%m.%Y %H:%M')
+                size = archive_size(entries[0])
                 if size >= 1024 ** 2:
                     backup_info['size_str'] = f'{size / 1024 ** 2:.1f} МБ'
                 elif size >= 1024:
@@ -0,0 +1,205 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from django.utils import timezone
+from ..models import Client
+from .reachability import probe_many, client_hosts, get_method
+
+
+class NetworkStatusView(APIView):
+    """
+    GET /api/clients/network/status/ — доступность external_ip / mikrotik_ip / server_ip всех активных клиентов.
+    Параметры: only_down=1 — только клиенты, у которых недоступен хотя бы один адрес;
+               fresh=1 — не использовать кеш результатов.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        only_down = request.query_params.get('only_down') in ('1', 'true')
+        use_cache = request.query_params.get('fresh') not in ('1', 'true')
+
+        clients = list(
+            Client.objects.filter(is_draft=False, status=Client.STATUS_ACTIVE)
+            .only('id', 'address', 'pharmacy_code', 'external_ip', 'subnet')
+            .order_by('address')
+        )
+        hosts = {c.id: client_hosts(c) for c in clients}
+        ips = [ip for h in hosts.values() for ip in h.values() if ip]
+        alive = probe_many(ips, use_cache=use_cache)
+
+        items = []
+        down_hosts = 0
+        for c in clients:
+            row = {'id': c.id, 'address': c.address, 'pharmacy_code': c.pharmacy_code}
+            has_down = False
+            for field, ip in hosts[c.id].items():
+                state = alive.get(ip) if ip else None
+                row[field] = {'ip': ip, 'alive': state}
+                if state is False:
+                    has_down = True
+                    down_hosts += 1
+            if has_down or not only_down:
+                items.append(row)
+
+        return Response({
+            'checked_at':  timezone.now().isoformat(),
+            'method':      get_method(),
+            'total_hosts': len(set(ips)),
+            'down_hosts':  down_hosts,
+            'clients':     items,
+        })
+
+
+def _days_param(request, default=7, maximum=90):
+    try:
+        days = int(request.query_params.get('days', default))
+    except (TypeError, ValueError):
+        days = default
+    return max(1, min(days, maximum))
+
+
+class NetworkDownView(APIView):
+    """
+    GET /api/clients/network/down/ — адреса, недоступные при последней проверке монитора
+    (monitor_network), с момента начала простоя. Проверки старше трёх интервалов не учитываются.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        from datetime import timedelta
+        from django.conf import settings
+        from ..models import HostAvailability
+
+        now = timezone.now()
+        fresh_after = now - timedelta(seconds=settings.NETWORK_MONITOR_INTERVAL * 3)
+        rows = (
+            HostAvailability.objects
+            .filter(date=timezone.localdate(), last_up=False, last_probe_at__gte=fresh_after)
+            .select_related('client')
+            .order_by('down_since')
+        )
+        items = []
+        for r in rows:
+            items.append({
+                'client_id':     r.client_id,
+                'address':       r.client.address,
+                'pharmacy_code': r.client.pharmacy_code,
+                'host':          r.host,
+                'ip':            r.ip,
+                'down_since':    r.down_since.isoformat() if r.down_since else None,
+                'down_minutes':  int((now - r.down_since).total_seconds() // 60) if r.down_since else None,
+                'last_probe_at': r.last_probe_at.isoformat() if r.last_probe_at else None,
+            })
+        return Response({'count': len(items), 'items': items})
+
+
+class ClientUptimeView(APIView):
+    """
+    GET /api/clients/network/uptime/{client_id}/?days=7 — доступность адресов клиента:
+    процент по каждому адресу, по дням и список простоев.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        from datetime import timedelta
+        from ..models import HostAvailability
+        from ..availability import day_stats, outages, percent
+
+        if not Client.objects.filter(pk=pk).exists():
+            return Response({'error': 'Клиент не найден'}, status=404)
+
+        days = _days_param(request)
+        since = timezone.localdate() - timedelta(days=days - 1)
+        rows = HostAvailability.objects.filter(client_id=pk, date__gte=since).order_by('date')
+
+        hosts = {}
+        for r in rows:
+            h = hosts.setdefault(r.host, {'ip': r.ip, 'probes': 0, 'up': 0, 'days': [], 'outages': []})
+            probed, up = day_stats(r)
+            h['ip'] = r.ip
+            h['probes'] += probed
+            h['up'] += up
+            h['days'].append({'date': r.date.isoformat(), 'uptime': percent(up, probed), 'probes': probed})
+            for start, end in outages(r):
+                last = h['outages'][-1] if h['outages'] else None
+                # Простой через полночь — одна запись
+                if last and last['end'] == start:
+                    last['end'] = end
+                else:
+                    h['outages'].append({'start': start, 'end': end})
+            h['last_up'] = r.last_up
+
+        result = {}
+        for host, h in hosts.items():
+            result[host] = {
+                'ip':      h['ip'],
+                'uptime':  percent(h['up'], h['probes']),
+                'probes':  h['probes'],
+                'last_up': h['last_up'],
+                'days':    h['days'],
+                'outages': [{
+                    'start':   o['start'].isoformat(),
+                    'end':     o['end'].isoformat(),
+                    'minutes': int((o['end'] - o['start']).total_seconds() // 60),
+                } for o in h['outages']],
+            }
+        return Response({'client_id': pk, 'days': days, 'hosts': result})
+
+
+class NetworkSummaryView(APIView):
+    """
+    GET /api/clients/network/summary/?days=7 — доступность сети по всем клиентам:
+    по типу адреса, по дням и адреса ниже SLA.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        from datetime import timedelta
+        from ..models import HostAvailability
+        from ..availability import day_stats, percent, SLA_PERCENT
+
+        days = _days_param(request)
+        since = timezone.localdate() - timedelta(days=days - 1)
+        rows = (
+            HostAvailability.objects.filter(date__gte=since)
+            .only('client_id', 'host', 'ip', 'date', 'probed_bits', 'up_bits', 'last_up')
+        )
+
+        by_type = {}   # host → [probes, up]
+        by_day = {}    # date → [probes, up]
+        by_host = {}   # (client_id, host) → [probes, up, ip]
+        down_now = 0
+        today = timezone.localdate()
+        for r in rows.iterator(chunk_size=2000):
+            probed, up = day_stats(r)
+            for bucket in (by_type.setdefault(r.host, [0, 0]), by_day.setdefault(r.date, [0, 0])):
+                bucket[0] += probed
+                bucket[1] += up
+            h = by_host.setdefault((r.client_id, r.host), [0, 0, r.ip])
+            h[0] += probed
+            h[1] += up
+            h[2] = r.ip
+            if r.date == today and r.last_up is False:
+                down_now += 1
+
+        below_sla = []
+        for (client_id, host), (probed, up, ip) in by_host.items():
+            p = percent(up, probed)
+            if p is not None and p < SLA_PERCENT:
+                below_sla.append({'client_id': client_id, 'host': host, 'ip': ip, 'uptime': p})
+        below_sla.sort(key=lambda x: x['uptime'])
+
+        total_probes = sum(b[0] for b in by_type.values())
+        total_up = sum(b[1] for b in by_type.values())
+        return Response({
+            'days':        days,
+            'hosts':       len(by_host),
+            'down_now':    down_now,
+            'uptime':      percent(total_up, total_probes),
+            'by_type':     {host: {'uptime': percent(up, probed), 'probes': probed}
+                            for host, (probed, up) in by_type.items()},
+            'by_day':      [{'date': d.isoformat(), 'uptime': percent(up, probed)}
+                            for d, (probed, up) in sorted(by_day.items())],
+            'sla_percent': SLA_PERCENT,
+            'below_sla':   below_sla,
+        })
@@ -0,0 +1,297 @@
+"""
+Проверка доступности хостов — много адресов параллельно, без отдельного процесса ping на каждый.
+
+Способы (выбирается один раз на процесс, REACHABILITY_METHOD=auto):
+  1. ICMP echo через непривилегированный ICMP-сокет (SOCK_DGRAM, net.ipv4.ping_group_range);
+  2. ICMP echo через raw-сокет (нужен CAP_NET_RAW — у контейнера backend cap_add: NET_RAW);
+  3. TCP-connect на REACHABILITY_TCP_PORTS (asyncio) — если ICMP недоступен.
+     Хост считается доступным, если хоть один порт принял соединение или ответил RST.
+
+ICMP-обход идёт одним сокетом: запросы отправляются скользящим окном
+(не больше REACHABILITY_PARALLEL без ответа), ответы сопоставляются по seq и адресу.
+
+Результаты кешируются в памяти процесса на REACHABILITY_CACHE_TTL секунд —
+кеш общий для всех функций, проверяющих доступность.
+"""
+
+import asyncio
+import ipaddress
+import queue
+import random
+import select
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+METHOD_ICMP_DGRAM = 'icmp'
+METHOD_ICMP_RAW = 'icmp-raw'
+METHOD_TCP = 'tcp'
+
+_ICMP_ECHO_REQUEST = 8
+_ICMP_ECHO_REPLY = 0
+
+# Структура: { ip: (alive: bool, checked_at: float) }
+_cache = {}
+_cache_lock = threading.Lock()
+
+_method = None
+_method_lock = threading.Lock()
+
+
+# ── Кеш ─────────────────────────────────────────────────────────────────────
+
+def _cache_get(ips, ttl):
+    now = time.monotonic()
+    found = {}
+    with _cache_lock:
+        for ip in ips:
+            rec = _cache.get(ip)
+            if rec and now - rec[1] < ttl:
+                found[ip] = rec[0]
+    return found
+
+
+def _cache_put(results):
+    now = time.monotonic()
+    with _cache_lock:
+        for ip, alive in results.items():
+            _cache[ip] = (alive, now)
+        # Не даём кешу расти бесконечно
+        if len(_cache) > 50000:
+            ttl = settings.REACHABILITY_CACHE_TTL
+            for ip in [ip for ip, (_, t) in _cache.items() if now - t >= ttl]:
+                del _cache[ip]
+
+
+# ── ICMP ────────────────────────────────────────────────────────────────────
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _echo_packet(ident, seq):
+    payload = b'support-portal'
+    header = struct.pack('!BBHHH', _ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _checksum(header + payload)
+    return struct.pack('!BBHHH', _ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+def _open_icmp_socket(method):
+    kind = socket.SOCK_DGRAM if method == METHOD_ICMP_DGRAM else socket.SOCK_RAW
+    sock = socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+    sock.setblocking(False)
+    # Ответы на скользящее окно из сотен запросов приходят почти одновременно
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    return sock
+
+
+def _icmp_iter(sock, ips, raw, timeout, parallel):
+    """ICMP echo ко всем ips через открытый сокет. Отдаёт (ip, bool) по мере готовности."""
+    ident = random.randint(1, 0xFFFF)  # для DGRAM ядро подставит свой id
+    to_send = list(reversed(ips))
+    pending = OrderedDict()   # seq → (ip, deadline); порядок отправки = порядок дедлайнов
+    done = set()
+    seq = 0
+
+    try:
+        while to_send or pending:
+            while to_send and len(pending) < parallel:
+                ip = to_send.pop()
+                seq = (seq + 1) & 0xFFFF
+                try:
+                    sock.sendto(_echo_packet(ident, seq), (ip, 0))
+                except (BlockingIOError, InterruptedError):
+                    to_send.append(ip)
+                    break
+                except OSError:
+                    if ip not in done:   # нет маршрута и т.п.
+                        done.add(ip)
+                        yield ip, False
+                    continue
+                pending[seq] = (ip, time.monotonic() + timeout)
+
+            if not pending:
+                select.select([], [sock], [], 0.05)   # буфер отправки переполнен
+                continue
+            first_deadline = next(iter(pending.values()))[1]
+            wait = max(0.0, first_deadline - time.monotonic())
+            readable, _, _ = select.select([sock], [], [], min(wait, 0.05) if to_send else wait)
+
+            if readable:
+                while True:
+                    try:
+                        packet, (src, _) = sock.recvfrom(1024)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    if raw:
+                        packet = packet[(packet[0] & 0x0F) * 4:]   # отрезаем IP-заголовок
+                    if len(packet) < 8:
+                        continue
+                    icmp_type, _, _, reply_ident, reply_seq = struct.unpack('!BBHHH', packet[:8])
+                    if icmp_type != _ICMP_ECHO_REPLY or (raw and reply_ident != ident):
+                        continue
+                    rec = pending.get(reply_seq)
+                    if rec and rec[0] == src:
+                        del pending[reply_seq]
+                        if src not in done:
+                            done.add(src)
+                            yield src, True
+
+            now = time.monotonic()
+            while pending:
+                s, (ip, deadline) = next(iter(pending.items()))
+                if deadline > now:
+                    break
+                del pending[s]
+                if ip not in done:
+                    done.add(ip)
+                    yield ip, False
+    finally:
+        sock.close()
+
+
+# ── TCP ─────────────────────────────────────────────────────────────────────
+
+async def _tcp_probe(ip, ports, timeout, sem):
+    async def _one(port):
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+            writer.close()
+            return True
+        except ConnectionRefusedError:
+            return True   # RST — хост отвечает
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+    async with sem:
+        tasks = [asyncio.ensure_future(_one(p)) for p in ports]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                if await fut:
+                    return ip, True
+            return ip, False
+        finally:
+            for t in tasks:
+                t.cancel()
+
+
+async def _tcp_sweep_async(ips, ports, timeout, parallel, put):
+    sem = asyncio.Semaphore(parallel)
+    for fut in asyncio.as_completed([_tcp_probe(ip, ports, timeout, sem) for ip in ips]):
+        put(await fut)
+
+
+def _tcp_iter(ips, timeout, parallel):
+    """TCP-проверка в отдельном потоке со своим event loop. Отдаёт (ip, bool) по мере готовности."""
+    ports = [int(p) for p in settings.REACHABILITY_TCP_PORTS.split(',') if p.strip()]
+    results = queue.Queue()
+
+    def _run():
+        try:
+            asyncio.run(_tcp_sweep_async(ips, ports, timeout, parallel, results.put))
+        finally:
+            results.put(None)
+
+    threading.Thread(target=_run, name='reachability-tcp', daemon=True).start()
+    while True:
+        item = results.get()
+        if item is None:
+            return
+        yield item
+
+
+# ── Выбор способа ───────────────────────────────────────────────────────────
+
+def get_method():
+    """Способ проверки для этого процесса (определяется один раз)."""
+    global _method
+    with _method_lock:
+        if _method is not None:
+            return _method
+        forced = settings.REACHABILITY_METHOD
+        candidates = [forced] if forced != 'auto' else [METHOD_ICMP_DGRAM, METHOD_ICMP_RAW]
+        for method in candidates:
+            if method == METHOD_TCP:
+                break
+            try:
+                _open_icmp_socket(method).close()
+                _method = method
+                return _method
+            except (PermissionError, OSError):
+                continue
+        _method = METHOD_TCP
+        return _method
+
+
+def _sweep_iter(ips, timeout, parallel):
+    method = get_method()
+    if method != METHOD_TCP:
+        try:
+            sock = _open_icmp_socket(method)
+        except (PermissionError, OSError):
+            sock = None
+        if sock is not None:
+            return _icmp_iter(sock, ips, method == METHOD_ICMP_RAW, timeout, parallel)
+    return _tcp_iter(ips, timeout, parallel)
+
+
+# ── Публичный API ───────────────────────────────────────────────────────────
+
+def probe_iter(ips, timeout=None, use_cache=True):
+    """
+    Проверяет доступность адресов, отдаёт (ip, bool) по мере готовности —
+    сначала результаты из кеша и неверные адреса, затем ответы в порядке прихода.
+    Все адреса проверяются одновременно: общее время — не больше timeout.
+    Пустые и неверные адреса (не IPv4) — False без проверки.
+    """
+    timeout = timeout or settings.REACHABILITY_TIMEOUT
+    parallel = settings.REACHABILITY_PARALLEL
+    to_check = []
+    for ip in dict.fromkeys(ips):
+        try:
+            ipaddress.IPv4Address(ip)
+            to_check.append(ip)
+        except ValueError:
+            yield ip, False
+
+    if use_cache:
+        cached = _cache_get(to_check, settings.REACHABILITY_CACHE_TTL)
+        yield from cached.items()
+        to_check = [ip for ip in to_check if ip not in cached]
+
+    if not to_check:
+        return
+    fresh = {}
+    try:
+        for ip, alive in _sweep_iter(to_check, timeout, parallel):
+            fresh[ip] = alive
+            yield ip, alive
+    finally:
+        _cache_put(fresh)
+
+
+def probe_many(ips, timeout=None, use_cache=True):
+    """Проверяет доступность адресов. Возвращает {ip: bool}."""
+    return dict(probe_iter(ips, timeout=timeout, use_cache=use_cache))
+
+
+def is_alive(ip, timeout=None, use_cache=True):
+    return probe_many([ip], timeout=timeout, use_cache=use_cache).get(ip, False)
+
+
+def client_hosts(client):
+    """Адреса клиента, которые проверяются на доступность."""
+    return {
+        'external_ip': client.external_ip or '',
+        'mikrotik_ip': client.mikrotik_ip or '',
+        'server_ip':   client.server_ip or '',
+    }
@@ -7,6 +7,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from ..models import Client, ClientNote, CustomFieldDefinition, ClientActivity, Provider, ClientFile, SystemSettings, DutySchedule, CustomHoliday, KktData, OfdCompany
@@ -18,6 +19,10 @@ from ..serializers import (
 from apps.accounts.permissions import CanEditClient, CanManageCustomFields, IsAdmin
 from .utils import ping_ip, build_change_log, FIELD_LABELS, STATUS_LABELS
 from .kkt_views import parse_datetime, ofd_request, ofd_get_all_rnm
+from .address_match import AddressIndex
+from .. import jobs
+from ..progress import ProgressReporter
+from ..task_runs import RunRecorder
 
 
 def _safe_log(value):
@@ -33,6 +38,8 @@ def _get_or_create_task(task_id):
         'update_rnm':        'Обновление данных по РНМ',
         'fetch_external_ip': 'Получение внешнего IP',
         'backup_system':     'Резервное копирование',
+        'warm_kassa_ips':    'Обновление кеша IP касс',
+        'archive_activity':  'Архивация истории клиентов',
     }
     obj, _ = ScheduledTask.objects.get_or_create(
         task_id=task_id,
@@ -49,6 +56,8 @@ class ScheduledTaskListView(APIView):
         _get_or_create_task('update_rnm')
         _get_or_create_task('fetch_external_ip')
         _get_or_create_task('backup_system')
+        _get_or_create_task('warm_kassa_ips')
+        _get_or_create_task('archive_activity')
         tasks = ScheduledTask.objects.all().order_by('task_id')
         result = []
         for t in tasks:
@@ -68,7 +77,7 @@ class ScheduledTaskListView(APIView):
 
     def patch(self, request):
         """Сохранить настройки расписания"""
-        from ..models import ScheduledTask
+        from .. import scheduler
         task_id = request.data.get('task_id')
         if not task_id:
             return Response({'error': 'task_id обязателен'}, status=400)
@@ -77,87 +86,315 @@ class ScheduledTaskListView(APIView):
             t.enabled = bool(request.data['enabled'])
         if 'schedule_time' in request.data:
             t.schedule_time = (request.data['schedule_time'] or '').strip()
+            if t.schedule_time:
+                try:
+                    scheduler.parse_time(t.schedule_time)
+                except ValueError:
+                    return Response({'error': 'Некорректное время'}, status=400)
         if 'schedule_days' in request.data:
             days = request.data['schedule_days']
+            try:
+                scheduler.parse_days(days)
+            except (TypeError, ValueError):
+                return Response({'error': 'Некорректные дни недели'}, status=400)
             if isinstance(days, list):
                 days = ','.join(str(d) for d in days)
             t.schedule_days = days
+        if t.enabled:
+            if not t.schedule_time:
+                return Response({'error': 'Укажите время в формате ЧЧ:ММ'}, status=400)
+            if not scheduler.parse_days(t.schedule_days):
+                return Response({'error': 'Выберите хотя бы один день недели'}, status=400)
         t.save()
+        if {'enabled', 'schedule_time', 'schedule_days'} & set(request.data):
+            scheduler.mark_schedule_changed([task_id])
         return Response({'ok': True})
 
 
 class ScheduledTaskRunView(APIView):
-    """Ручной запуск задания — стартует поток, возвращает сразу.
-    Параметр scheduled=true (от cron) включает режим only_expiring (только ФН ≤30 дней).
-    Ручной запуск через интерфейс — всегда все ККТ.
+    """Ручной запуск задания — ставит в очередь, возвращает сразу.
+    Параметр scheduled=true включает режим only_expiring (только ФН ≤30 дней), как при запуске
+    по расписанию. Ручной запуск через интерфейс — всегда все ККТ.
     """
     permission_classes = [IsAuthenticated, IsAdmin]
 
-    # Разрешённые task_id — защита от запуска произвольных задач
-    ALLOWED_TASKS = {'update_rnm', 'fetch_external_ip', 'backup_system'}
-
     def post(self, request):
-        import threading
-        from ..models import ScheduledTask
         task_id      = request.data.get('task_id', 'update_rnm')
         company_id   = request.data.get('company_id')
-        only_expiring = str(request.data.get('scheduled', '')).lower() == 'true'
+        scheduled    = str(request.data.get('scheduled', '')).lower() == 'true'
 
         # Проверяем что task_id из разрешённого списка
-        if task_id not in self.ALLOWED_TASKS:
-            return Response({'error': f'Недопустимый task_id. Разрешены: {", ".join(self.ALLOWED_TASKS)}'}, status=400)
+        if task_id not in SCHEDULED_TASKS:
+            return Response({'error': f'Недопустимый task_id. Разрешены: {", ".join(SCHEDULED_TASKS)}'}, status=400)
 
-        t = _get_or_create_task(task_id)
-        if t.status == 'running':
-            return Response({'error': 'Задание уже выполняется'}, status=400)
-
-        # Стартуем в фоне
-        if task_id == 'fetch_external_ip':
-            thread = threading.Thread(
-                target=_run_fetch_external_ip,
-                args=(task_id, request.user.id),
-                daemon=True,
-            )
-            thread.start()
-            return Response({'ok': True, 'message': 'Задание запущено (внешний IP)'})
-        elif task_id == 'backup_system':
-            thread = threading.Thread(
-                target=_run_backup_system,
-                args=(task_id, request.user.id),
-                daemon=True,
-            )
-            thread.start()
-            return Response({'ok': True, 'message': 'Задание запущено (резервное копирование)'})
-        else:
-            thread = threading.Thread(
-                target=_run_update_rnm,
-                args=(task_id, company_id, request.user.id),
-                kwargs={'only_expiring': only_expiring},
-                daemon=True,
-            )
-            thread.start()
-            mode = 'истекающие ФН (≤30 дней)' if only_expiring else 'все ККТ'
-            return Response({'ok': True, 'message': f'Задание запущено ({mode})'})
+        job, message = start_task(task_id, request.user, company_id=company_id, scheduled=scheduled)
+        if job is None:
+            return Response({'error': message}, status=400)
+        return Response({'ok': True, 'message': message, 'job_id': str(job.pk)})
+
+
+# Разрешённые task_id — защита от запуска произвольных задач
+SCHEDULED_TASKS = ('update_rnm', 'fetch_external_ip', 'backup_system', 'warm_kassa_ips', 'archive_activity')
+
+
+def start_task(task_id, user, company_id=None, scheduled=False):
+    """
+    Ставит регламентное задание в очередь — из ScheduledTaskRunView и из планировщика (scheduler.py,
+    user=None, scheduled=True). Возвращает (job, сообщение); job=None — задание уже выполняется.
+    """
+    # Ставим в очередь — выполнит воркер (manage.py run_worker)
+    if task_id == 'fetch_external_ip':
+        job = _enqueue_task('task.fetch_external_ip', task_id, user)
+        message = 'Задание запущено (внешний IP)'
+    elif task_id == 'backup_system':
+        job = _enqueue_task('task.backup_system', task_id, user, conflicts=('restore_backup',))
+        message = 'Задание запущено (резервное копирование)'
+    elif task_id == 'warm_kassa_ips':
+        job = _enqueue_task('task.warm_kassa_ips', task_id, user)
+        message = 'Задание запущено (кеш IP касс)'
+    elif task_id == 'archive_activity':
+        job = _enqueue_task('task.archive_activity', task_id, user, conflicts=('restore_backup',))
+        message = 'Задание запущено (архивация истории)'
+    else:
+        job = _enqueue_task('task.update_rnm', task_id, user,
+                            company_id=company_id, only_expiring=scheduled)
+        mode = 'истекающие ФН (≤30 дней)' if scheduled else 'все ККТ'
+        message = f'Задание запущено ({mode})'
+    if job is None:
+        return None, 'Задание уже выполняется'
+    return job, message
+
+
+def _enqueue_task(kind, task_id, user, conflicts=(), **params):
+    """
+    Ставит регламентное задание в очередь; в ScheduledTask оно сразу видно как запущенное.
+    None — задание (или задание из conflicts) уже поставлено или выполняется.
+    """
+    from django.db import transaction
+    # Поток JOBS_EAGER стартует после коммита — не затрёт его прогресс текстом «в очереди»
+    with transaction.atomic():
+        if not _claim_task(task_id, conflicts):
+            return None
+        job, created = jobs.submit(
+            kind, params={'task_id': task_id, 'user_id': user.pk if user else None, **params},
+            dedup_key=f'task:{task_id}', user=user,
+        )
+    return job if created else None
+
+
+def _claim_task(task_id, conflicts=()):
+    """
+    Атомарный захват задания: строка ScheduledTask блокируется (SELECT … FOR UPDATE), и два
+    одновременных запуска (расписание и кнопка, два воркера gunicorn) проверяют её по очереди.
+
+    Задание занято, пока его держит живое задание очереди (dedup_key task:<task_id>): воркер
+    отмечается раз в JOBS_HEARTBEAT, и без отметок дольше JOBS_LEASE захват освобождается сам —
+    status='running' упавшего запуска запуск не блокирует.
+    """
+    from ..models import ScheduledTask
+    _get_or_create_task(task_id)
+    ScheduledTask.objects.select_for_update().get(task_id=task_id)
+    if any(jobs.active(f'task:{t}') for t in (task_id, *conflicts)):
+        return False
+    ScheduledTask.objects.filter(task_id=task_id).update(
+        status='running', progress=0, progress_text='В очереди, ожидает воркер...',
+    )
+    return True
+
+
+def _task_result(task_id):
+    """Результат задания очереди по итоговому состоянию ScheduledTask."""
+    from ..models import ScheduledTask
+    t = ScheduledTask.objects.filter(task_id=task_id).first()
+    if t is None:
+        return None
+    if t.status == 'error':
+        return {'error': t.progress_text or t.last_run_result[:500]}
+    if t.status == 'cancelled':
+        return {'cancelled': t.progress_text or 'Остановлено', 'status': t.status}
+    return {'status': t.status, 'message': t.progress_text}
+
+
+def _abort_task(job, error, cancelled=False):
+    """on_abort для заданий очереди: воркер потерян, истёк лимит времени или задание отменено в очереди."""
+    from ..models import ScheduledTask
+    if cancelled:
+        fields = dict(status='cancelled', progress=0, progress_text=f'Остановлено до начала: {error}'[:500])
+    else:
+        fields = dict(status='error', progress=0, progress_text=f'Прервано: {error}'[:500],
+                      last_run_result=f'Задание прервано: {error}')
+    ScheduledTask.objects.filter(task_id=job.params.get('task_id'), status='running').update(**fields)
+
+
+def _final_status(stopped, errors):
+    """Итоговый статус запуска: остановлен (jobs.stop_reason) / с ошибками / успешно."""
+    if stopped:
+        return 'cancelled'
+    return 'success' if not errors else 'error'
+
+
+def _task_version(t):
+    """Отпечаток состояния задания: меняется вместе со status / progress / progress_text."""
+    import zlib
+    return format(zlib.crc32(f'{t.status}|{t.progress}|{t.progress_text}'.encode()), '08x')
+
+
+def _task_state(t):
+    return {
+        'task_id':        t.task_id,
+        'status':         t.status,
+        'progress':       t.progress,
+        'progress_text':  t.progress_text,
+        'last_run_at':    t.last_run_at.isoformat() if t.last_run_at else None,
+        'last_run_result': t.last_run_result,
+        'version':        _task_version(t),
+    }
+
+
+# Задания, прогресс которых видят не только администраторы (RnmSyncView доступен всем)
+PUBLIC_EVENT_TASKS = {'rnm_sync'}
 
 
 class ScheduledTaskProgressView(APIView):
-    """Polling прогресса — фронтенд опрашивает каждые 2 сек"""
-    permission_classes = [IsAuthenticated, IsAdmin]
+    """
+    Прогресс задания.
+    ?since=<version>&wait=25 — long-poll: ответ приходит, когда состояние изменится
+    (или через wait сек, не больше LONGPOLL_MAX).
+    Не администраторам — только PUBLIC_EVENT_TASKS.
+    """
+    permission_classes = [IsAuthenticated]
+    LONGPOLL_MAX = 25   # сек — меньше proxy_read_timeout nginx
 
     def get(self, request, task_id):
+        from django.db import connection
         from ..models import ScheduledTask
+        from .. import events
+        if task_id not in PUBLIC_EVENT_TASKS and not IsAdmin().has_permission(request, self):
+            return Response({'error': 'Недостаточно прав'}, status=403)
         try:
-            t = ScheduledTask.objects.get(task_id=task_id)
-        except ScheduledTask.DoesNotExist:
-            return Response({'error': 'Не найдено'}, status=404)
-        return Response({
-            'task_id':        t.task_id,
-            'status':         t.status,
-            'progress':       t.progress,
-            'progress_text':  t.progress_text,
-            'last_run_at':    t.last_run_at.isoformat() if t.last_run_at else None,
-            'last_run_result': t.last_run_result,
-        })
+            wait = max(0, min(int(request.query_params.get('wait', 0)), self.LONGPOLL_MAX))
+        except (TypeError, ValueError):
+            wait = 0
+        since = request.query_params.get('since')
+
+        subscribed = bool(wait and since) and events.subscribe()
+        try:
+            seq = events.current_seq()
+            try:
+                t = ScheduledTask.objects.get(task_id=task_id)
+            except ScheduledTask.DoesNotExist:
+                return Response({'error': 'Не найдено'}, status=404)
+            if subscribed and _task_version(t) == since:
+                connection.close()   # не держим соединение с БД, пока ждём
+                _, changed = events.wait(seq, {task_id}, wait)
+                if changed:
+                    t.refresh_from_db()
+            return Response(_task_state(t))
+        finally:
+            if subscribed:
+                events.unsubscribe()
+
+
+class ScheduledTaskCancelView(APIView):
+    """
+    POST — остановка задания. В очереди — отменяется сразу; выполняется — останавливается
+    между пачками (компаниями, хостами, шагами) с сохранением уже полученного и итогом в истории.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, task_id):
+        if task_id not in PUBLIC_EVENT_TASKS and not IsAdmin().has_permission(request, self):
+            return Response({'error': 'Недостаточно прав'}, status=403)
+        job = jobs.active(f'task:{task_id}')
+        if job is None:
+            return Response({'error': 'Задание не выполняется'}, status=400)
+        outcome = jobs.cancel(job)
+        if outcome is None:
+            return Response({'error': 'Задание уже завершено'}, status=400)
+        if outcome == 'cancelled':
+            message = 'Задание отменено'
+        else:
+            message = 'Остановка запрошена — задание завершится после текущей пачки'
+        return Response({'ok': True, 'status': outcome, 'message': message, 'job_id': str(job.pk)})
+
+
+class _EventStreamRenderer(BaseRenderer):
+    """Чтобы DRF принимал Accept: text/event-stream (ответ отдаётся StreamingHttpResponse)."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode()
+
+
+class ScheduledTaskEventsView(APIView):
+    """
+    GET /api/clients/scheduled-tasks/events/?task_id=update_rnm,backup_system — Server-Sent Events.
+    Сразу отдаёт текущее состояние заданий, дальше — событие progress только при изменении
+    status / progress / progress_text. Раз в KEEPALIVE сек — комментарий, чтобы прокси не закрыл
+    соединение; через STREAM_MAX сек поток закрывается, клиент переподключается сам (retry).
+    Без task_id — все задания (не администраторам — только PUBLIC_EVENT_TASKS).
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, _EventStreamRenderer]
+    KEEPALIVE = 15
+    STREAM_MAX = 300
+
+    def get(self, request):
+        import time
+        from django.db import connection
+        from django.http import StreamingHttpResponse
+        from ..models import ScheduledTask
+        from .. import events
+
+        task_ids = {t.strip() for t in request.query_params.get('task_id', '').split(',') if t.strip()} or None
+        if not IsAdmin().has_permission(request, self):
+            task_ids = (task_ids or PUBLIC_EVENT_TASKS) & PUBLIC_EVENT_TASKS
+            if not task_ids:
+                return Response({'error': 'Недостаточно прав'}, status=403)
+
+        def _event(name, data):
+            return f'event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+        def _stream():
+            if not events.subscribe():
+                yield 'retry: 10000\n' + _event('busy', {'error': 'Слишком много подписчиков, повтор через 10 сек'})
+                return
+            try:
+                yield 'retry: 3000\n\n'
+                deadline = time.monotonic() + self.STREAM_MAX
+                seq = events.current_seq()
+                sent = {}
+                changed = task_ids
+                while True:
+                    qs = ScheduledTask.objects.all()
+                    if changed is not None:
+                        qs = qs.filter(task_id__in=changed)
+                    states = [_task_state(t) for t in qs]
+                    connection.close()   # не держим соединение с БД между событиями
+                    for state in states:
+                        if sent.get(state['task_id']) != state['version']:
+                            sent[state['task_id']] = state['version']
+                            yield _event('progress', state)
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    while True:
+                        seq, changed = events.wait(seq, task_ids, min(self.KEEPALIVE, remaining))
+                        if changed:
+                            break
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return
+                        yield ': keepalive\n\n'
+            finally:
+                events.unsubscribe()
+
+        response = StreamingHttpResponse(_stream(), content_type='text/event-stream')
+        response['X-Accel-Buffering'] = 'no'   # nginx отдаёт события сразу
+        response['Cache-Control'] = 'no-cache'
+        return response
 
 
 def _run_update_rnm(task_id, company_id, user_id, only_expiring=False):
@@ -169,7 +406,7 @@ def _run_update_rnm(task_id, company_id, user_id, only_expiring=False):
     from django.utils import timezone
     from datetime import timedelta
     from django.contrib.auth import get_user_model
-    from ..models import ScheduledTask, Client, KktData, ClientActivity, OfdCompany
+    from ..models import Client, KktData, ClientActivity, OfdCompany
 
     User = get_user_model()
     try:
@@ -177,8 +414,8 @@ def _run_update_rnm(task_id, company_id, user_id, only_expiring=False):
     except Exception:
         user = None
 
-    def _set(**kwargs):
-        ScheduledTask.objects.filter(task_id=task_id).update(**kwargs)
+    run = RunRecorder(task_id, user_id=user_id, params={'company_id': company_id, 'only_expiring': only_expiring})
+    _set = ProgressReporter(task_id, run=run)
 
     # Определяем название компании если задан фильтр
     company_name = None
@@ -235,6 +472,7 @@ def _run_update_rnm(task_id, company_id, user_id, only_expiring=False):
             return
 
         total_kkts  = sum(len(k) for _, k in clients_with_kkt)
+        run.update(items_total=total_kkts)
         done_kkts   = 0
         fetched_total = 0
         errors_total  = 0
@@ -248,8 +486,13 @@ def _run_update_rnm(task_id, company_id, user_id, only_expiring=False):
 
         total_companies = len(by_company)
         company_idx = 0
+        stopped = None
 
         for company_id_key, company_clients in by_company.items():
+            # Остановка (отмена, лимит времени) — между компаниями: уже полученное сохранено
+            stopped = jobs.stop_reason()
+            if stopped:
+                break
             company_idx += 1
             # Берём inn/token из первого клиента группы
             first_client = company_clients[0][0]
@@ -267,10 +510,12 @@ def _run_update_rnm(task_id, company_id, user_id, only_expiring=False):
 
             # Один запрос к ОФД — получаем все ККТ компании
             try:
-                result = subprocess.run(
-                    [script, inn, token],
-                    capture_output=True, text=True, timeout=60
-                )
+                run.add('ofd_calls')
+                with run.timed('companies', company_label):
+                    result = subprocess.run(
+                        [script, inn, token],
+                        capture_output=True, text=True, timeout=60
+                    )
                 if not result.stdout.strip():
                     stderr_info = (result.stderr or '')[:200]
                     for client, kkts in company_clients:
@@ -351,6 +596,7 @@ def _run_update_rnm(task_id, company_id, user_id, only_expiring=False):
                                 action=f'Изменён номер ФН (регламент)\nРНМ: {rnm}\nНомер ФН: «{old_fn}» → «{kkt_obj.fn_number}»'
                             )
 
+        run.update(items_done=fetched_total, errors=errors_total)
         elapsed = timezone.now() - started_at
         elapsed_str = f'{int(elapsed.total_seconds() // 60)} мин {int(elapsed.total_seconds() % 60)} сек'
 
@@ -368,12 +614,15 @@ def _run_update_rnm(task_id, company_id, user_id, only_expiring=False):
             f'Ошибок: {errors_total}. '
             f'Время выполнения: {elapsed_str}.'
         )
+        if stopped:
+            summary = f'Остановлено: {stopped} (компаний обработано: {company_idx - 1} из {total_companies}).\n' + summary
         if error_log:
             summary += '\n\nОшибки:\n' + '\n'.join(error_log)
 
-        _set(status='success' if errors_total == 0 else 'error',
+        _set(status=_final_status(stopped, errors_total),
              progress=100,
-             progress_text=f'Готово: обновлено {fetched_total} ККТ за {elapsed_str}',
+             progress_text=(f'Остановлено: {stopped}. Обновлено {fetched_total} ККТ за {elapsed_str}' if stopped
+                            else f'Готово: обновлено {fetched_total} ККТ за {elapsed_str}'),
              last_run_result=summary)
 
     except Exception as e:
@@ -386,11 +635,17 @@ def _run_update_rnm(task_id, company_id, user_id, only_expiring=False):
 
 
 def _run_fetch_external_ip(task_id, user_id):
-    """Фоновая функция получения внешнего IP по всем клиентам через SSH на Микротик"""
-    import paramiko
+    """
+    Фоновая функция получения внешнего IP по всем клиентам через SSH на Микротик.
+    Микротики опрашиваются параллельно (SSH_FANOUT_WORKERS), изменения IP пишутся в БД пачками.
+    За одну SSH-сессию сборщик получает и остальные секции (IP касс, ресурсы, интерфейсы) —
+    они сохраняются в MikrotikState.
+    """
     from django.utils import timezone
     from django.contrib.auth import get_user_model
-    from ..models import ScheduledTask, Client, ClientActivity, SystemSettings
+    from ..models import Client, ClientActivity, SystemSettings
+    from .ssh_utils import fan_out, ssh_error_text
+    from .mikrotik import collect, collect_deadline, collection_state, save_states, default_sections
 
     User = get_user_model()
     try:
@@ -398,12 +653,14 @@ def _run_fetch_external_ip(task_id, user_id):
     except Exception:
         user = None
 
-    def _set(**kwargs):
-        ScheduledTask.objects.filter(task_id=task_id).update(**kwargs)
+    run = RunRecorder(task_id, user_id=user_id)
+    _set = ProgressReporter(task_id, run=run)
 
     _set(status='running', progress=0, progress_text='Инициализация...', last_run_at=timezone.now())
     started_at = timezone.now()
 
+    FLUSH_EVERY = 100  # изменённых IP — пачка записи в БД
+
     try:
         settings_obj = SystemSettings.get()
         if not settings_obj.ssh_user or not settings_obj.ssh_password_encrypted:
@@ -425,72 +682,67 @@ def _run_fetch_external_ip(task_id, user_id):
                  last_run_result='Нет клиентов с заполненным полем Subnet для определения IP Микротика')
             return
 
-        updated   = 0
-        changed   = 0
-        errors    = 0
-        error_log = []
-        cmd = ':put ([/tool fetch url="https://api.ipify.org" http-method=get output=user as-value]->"data")'
+        sections = default_sections()
+        if 'external_ip' not in sections:
+            sections.insert(0, 'external_ip')
 
-        for i, client in enumerate(clients):
-            mikrotik_ip = client.mikrotik_ip
-            pct = int((i / total) * 100)
-            _set(progress=pct,
-                 progress_text=f'Клиент {i+1}/{total}: {client.address or client.pharmacy_code} ({mikrotik_ip})')
-            try:
-                from .misc_views import _make_ssh_client, _save_known_hosts
-                ssh = _make_ssh_client(mikrotik_ip)
-                ssh.connect(mikrotik_ip, username=ssh_user, password=ssh_password, timeout=10, port=22)
-                _save_known_hosts(ssh)
-                stdin, stdout, stderr = ssh.exec_command(cmd, timeout=15)
-                new_ip = stdout.read().decode().strip()
-                ssh.close()
-
-                if not new_ip:
-                    errors += 1
-                    error_log.append(f'{client.address or client.pharmacy_code} ({mikrotik_ip}): пустой ответ')
-                    continue
+        stats = {'done': 0, 'updated': 0, 'changed': 0, 'errors': 0}
+        error_log = []
+        changed_clients = []
+        activities = []
+        states = []
+
+        def _flush():
+            save_states(states)
+            states.clear()
+            if not changed_clients:
+                return
+            Client.objects.bulk_update(changed_clients, ['external_ip'], batch_size=500)
+            ClientActivity.objects.bulk_create(activities, batch_size=500)
+            changed_clients.clear()
+            activities.clear()
+
+        def _fetch(client):
+            run.add('ssh_calls')
+            with run.timed('hosts', client.mikrotik_ip):
+                return collect(client.mikrotik_ip, ssh_user, ssh_password, sections)
+
+        def _on_result(client, result, error):
+            label = f'{_safe_log(client.address or client.pharmacy_code)} ({_safe_log(client.mikrotik_ip)})'
+            stats['done'] += 1
+            if error is not None:
+                stats['errors'] += 1
+                error_log.append(f'{label}: {_safe_log(ssh_error_text(error))}')
+            else:
+                states.append(collection_state(client, client.mikrotik_ip, result, sections, timezone.now()))
+                if 'external_ip' not in result:
+                    stats['errors'] += 1
+                    error_log.append(f'{label}: {_safe_log(result["errors"]["external_ip"])}')
+                else:
+                    new_ip = result['external_ip']
+                    old_ip = client.external_ip or ''
+                    if new_ip != old_ip:
+                        stats['changed'] += 1
+                        client.external_ip = new_ip
+                        changed_clients.append(client)
+                        if user:
+                            activities.append(ClientActivity(
+                                client=client, user=user,
+                                action=f'Обновлён внешний IP (регламент)\n«{old_ip or "не задан"}» → «{new_ip}»'
+                            ))
+                    stats['updated'] += 1
 
-                # Проверяем что получили валидный IP, а не строку ошибки от Микротика
-                import re as _re
-                if not _re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', new_ip):
-                    errors += 1
-                    error_log.append(f'{_safe_log(client.address or client.pharmacy_code)} ({_safe_log(mikrotik_ip)}): неверный ответ от Микротика: {_safe_log(new_ip[:50])}')
-                    continue
+            if len(changed_clients) >= FLUSH_EVERY or len(states) >= FLUSH_EVERY:
+                _flush()
+            _set(progress=int(stats['done'] / total * 100),
+                 progress_text=f'Опрошено {stats["done"]}/{total}, ошибок: {stats["errors"]}')
 
-                old_ip = client.external_ip or ''
-                if new_ip != old_ip:
-                    changed += 1
-                    client.external_ip = new_ip
-                    client.save(update_fields=['external_ip'])
-                    if user:
-                        ClientActivity.objects.create(
-                            client=client, user=user,
-                            action=f'Обновлён внешний IP (регламент)\n«{old_ip or "не задан"}» → «{new_ip}»'
-                        )
-                updated += 1
-
-            except paramiko.AuthenticationException:
-                errors += 1
-                error_log.append(f'{_safe_log(client.address or client.pharmacy_code)} ({_safe_log(mikrotik_ip)}): ошибка аутентификации SSH')
-            except paramiko.SSHException as e:
-                errors += 1
-                err_str = str(e)
-                if 'not found in known_hosts' in err_str or 'changed' in err_str.lower():
-                    error_log.append(
-                        f'{_safe_log(client.address or client.pharmacy_code)} ({_safe_log(mikrotik_ip)}): '
-                        f'⚠️ SSH ключ хоста изменился (замена Микротика?). '
-                        f'Удалите запись из known_hosts: /opt/support-portal/known_hosts'
-                    )
-                else:
-                    error_log.append(f'{_safe_log(client.address or client.pharmacy_code)} ({_safe_log(mikrotik_ip)}): SSH ошибка: {_safe_log(err_str[:120])}')
-            except Exception as e:
-                errors += 1
-                err_str = str(e)
-                if 'timed out' in err_str.lower() or 'timeout' in err_str.lower():
-                    error_log.append(f'{_safe_log(client.address or client.pharmacy_code)} ({_safe_log(mikrotik_ip)}): таймаут подключения')
-                else:
-                    error_log.append(f'{_safe_log(client.address or client.pharmacy_code)} ({_safe_log(mikrotik_ip)}): {_safe_log(err_str[:120])}')
+        stopped = fan_out(clients, _fetch, _on_result, deadline=collect_deadline(), stop=jobs.stop_reason)
+        stopped = jobs.stop_reason() if stopped else None
+        _flush()
 
+        updated, changed, errors = stats['updated'], stats['changed'], stats['errors']
+        run.update(items_total=total, items_done=updated, errors=errors)
         elapsed = timezone.now() - started_at
         elapsed_str = f'{int(elapsed.total_seconds() // 60)} мин {int(elapsed.total_seconds() % 60)} сек'
 
@@ -501,12 +753,15 @@ def _run_fetch_external_ip(task_id, user_id):
             f'Ошибок: {errors}. '
             f'Время выполнения: {elapsed_str}.'
         )
+        if stopped:
+            summary = f'Остановлено: {stopped} (обработано {stats["done"]} из {total}).\n' + summary
         if error_log:
             summary += '\n\nОшибки:\n' + '\n'.join(error_log)
 
-        _set(status='success' if errors == 0 else 'error',
+        _set(status=_final_status(stopped, errors),
              progress=100,
-             progress_text=f'Готово: опрошено {updated} из {total}, изменился IP: {changed}. Время: {elapsed_str}',
+             progress_text=(f'Остановлено: {stopped}. Опрошено {updated} из {total}. Время: {elapsed_str}' if stopped
+                            else f'Готово: опрошено {updated} из {total}, изменился IP: {changed}. Время: {elapsed_str}'),
              last_run_result=summary)
 
     except Exception as e:
@@ -516,84 +771,206 @@ def _run_fetch_external_ip(task_id, user_id):
              last_run_result=f'Критическая ошибка: {str(e)}\n{traceback.format_exc()[:500]}')
 
 
-class ScheduledTaskCronView(APIView):
-    """Применить расписание — управляет crontab через cron_manager.sh на хосте"""
-    permission_classes = [IsAuthenticated, IsAdmin]
+def _run_warm_kassa_ips(task_id, user_id):
+    """
+    Фоновая функция: обновляет кеш IP касс (MikrotikState) по всем активным клиентам —
+    карточка клиента после этого открывается без ожидания SSH.
+    Микротики опрашиваются параллельно (fan_out), кеш пишется пачками.
+    """
+    from django.utils import timezone
+    from ..models import Client, SystemSettings
+    from .ssh_utils import fan_out, ssh_error_text
+    from .mikrotik import collect, collect_deadline, collection_state, save_states
 
-    CRON_MANAGER = '/usr/local/bin/cron_manager.sh'
-    SCHEDULER_SCRIPT = '/opt/support-portal/scheduler_run.sh'
+    run = RunRecorder(task_id, user_id=user_id)
+    _set = ProgressReporter(task_id, run=run)
 
-    def _call(self, *args):
-        """Вызвать cron_manager.sh с аргументами, вернуть (stdout, stderr, returncode)"""
-        result = subprocess.run(
-            [self.CRON_MANAGER] + list(args),
-            capture_output=True, text=True, timeout=10
+    _set(status='running', progress=0, progress_text='Инициализация...', last_run_at=timezone.now())
+    started_at = timezone.now()
+
+    FLUSH_EVERY = 200
+
+    try:
+        settings_obj = SystemSettings.get()
+        if not settings_obj.ssh_user or not settings_obj.ssh_password_encrypted:
+            _set(status='error', progress=0,
+                 progress_text='Ошибка: SSH не настроен',
+                 last_run_result='SSH пользователь или пароль не заданы в настройках системы')
+            return
+
+        ssh_user     = settings_obj.ssh_user
+        ssh_password = settings_obj.ssh_password
+
+        clients = [c for c in Client.objects.filter(is_draft=False, status=Client.STATUS_ACTIVE, subnet__isnull=False).exclude(subnet='') if c.mikrotik_ip]
+        total = len(clients)
+        if total == 0:
+            _set(status='success', progress=100,
+                 progress_text='Нет клиентов с Микротиком',
+                 last_run_result='Нет клиентов с заполненным полем Subnet для определения IP Микротика')
+            return
+
+        stats = {'done': 0, 'updated': 0, 'errors': 0}
+        error_log = []
+        states = []
+
+        sections = ['kassa_ips']
+
+        def _flush():
+            save_states(states)
+            states.clear()
+
+        def _on_result(client, result, error):
+            stats['done'] += 1
+            label = f'{_safe_log(client.address or client.pharmacy_code)} ({_safe_log(client.mikrotik_ip)})'
+            if error is not None:
+                stats['errors'] += 1
+                error_log.append(f'{label}: {_safe_log(ssh_error_text(error))}')
+            elif 'kassa_ips' not in result:
+                stats['errors'] += 1
+                error_log.append(f'{label}: {_safe_log(result["errors"]["kassa_ips"])}')
+            else:
+                stats['updated'] += 1
+                states.append(collection_state(client, client.mikrotik_ip, result, sections, timezone.now()))
+                if len(states) >= FLUSH_EVERY:
+                    _flush()
+            _set(progress=int(stats['done'] / total * 100),
+                 progress_text=f'Опрошено {stats["done"]}/{total}, ошибок: {stats["errors"]}')
+
+        def _fetch(client):
+            run.add('ssh_calls')
+            with run.timed('hosts', client.mikrotik_ip):
+                return collect(client.mikrotik_ip, ssh_user, ssh_password, sections)
+
+        stopped = fan_out(clients, _fetch, _on_result, deadline=collect_deadline(), stop=jobs.stop_reason)
+        stopped = jobs.stop_reason() if stopped else None
+        _flush()
+        run.update(items_total=total, items_done=stats['updated'], errors=stats['errors'])
+
+        elapsed = timezone.now() - started_at
+        elapsed_str = f'{int(elapsed.total_seconds() // 60)} мин {int(elapsed.total_seconds() % 60)} сек'
+        summary = (
+            f'Всего клиентов: {total}. '
+            f'Обновлено: {stats["updated"]}. '
+            f'Ошибок: {stats["errors"]}. '
+            f'Время выполнения: {elapsed_str}.'
         )
-        return result.stdout.strip(), result.stderr.strip(), result.returncode
+        if stopped:
+            summary = f'Остановлено: {stopped} (обработано {stats["done"]} из {total}).\n' + summary
+        if error_log:
+            summary += '\n\nОшибки:\n' + '\n'.join(error_log)
+
+        _set(status=_final_status(stopped, stats['errors']),
+             progress=100,
+             progress_text=(f'Остановлено: {stopped}. Обновлено {stats["updated"]} из {total}. Время: {elapsed_str}'
+                            if stopped else f'Готово: обновлено {stats["updated"]} из {total}. Время: {elapsed_str}'),
+             last_run_result=summary)
+
+    except Exception as e:
+        import traceback
+        _set(status='error', progress=0,
+             progress_text='Ошибка выполнения',
+             last_run_result=f'Критическая ошибка: {str(e)}\n{traceback.format_exc()[:500]}')
+
+
+def _run_archive_activity(task_id, user_id):
+    """
+    Фоновая функция: переносит историю клиентов старше ACTIVITY_HOT_DAYS в сжатый помесячный архив
+    и удаляет архив старше ACTIVITY_ARCHIVE_DAYS (activity_archive.py).
+    """
+    import traceback
+    from django.conf import settings
+    from django.utils import timezone
+    from .. import activity_archive
+
+    run = RunRecorder(task_id, user_id=user_id)
+    _set = ProgressReporter(task_id, run=run)
+
+    _set(status='running', progress=0, progress_text='Инициализация...', last_run_at=timezone.now())
+    started_at = timezone.now()
+
+    try:
+        def _on_progress(moved, total):
+            _set(progress=int(moved / total * 95), progress_text=f'Перенесено в архив {moved}/{total}')
+
+        moved, total, stopped = activity_archive.archive(
+            settings.ACTIVITY_HOT_DAYS, stop=jobs.stop_reason, on_progress=_on_progress,
+        )
+        stopped = jobs.stop_reason() if stopped else None
+        purged = 0 if stopped else activity_archive.purge(settings.ACTIVITY_ARCHIVE_DAYS)
+        run.update(items_total=total, items_done=moved)
+
+        elapsed = timezone.now() - started_at
+        elapsed_str = f'{int(elapsed.total_seconds() // 60)} мин {int(elapsed.total_seconds() % 60)} сек'
+        summary = (
+            f'Записей старше {settings.ACTIVITY_HOT_DAYS} дн.: {total}. '
+            f'Перенесено в архив: {moved}. '
+            f'Удалено месяцев архива: {purged}. '
+            f'Время выполнения: {elapsed_str}.'
+        )
+        if stopped:
+            summary = f'Остановлено: {stopped} (перенесено {moved} из {total}).\n' + summary
+
+        _set(status=_final_status(stopped, 0),
+             progress=100,
+             progress_text=(f'Остановлено: {stopped}. Перенесено {moved} из {total}. Время: {elapsed_str}'
+                            if stopped else f'Готово: перенесено {moved}. Время: {elapsed_str}'),
+             last_run_result=summary)
+
+    except Exception as e:
+        _set(status='error', progress=0,
+             progress_text='Ошибка выполнения',
+             last_run_result=f'Критическая ошибка: {str(e)}\n{traceback.format_exc()[:500]}')
+
+
+class ScheduledTaskCronView(APIView):
+    """
+    Расписание задания. Хранится в ScheduledTask (schedule_time / schedule_days по местному времени),
+    запускает задания встроенный планировщик воркера (apps/clients/scheduler.py).
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    @staticmethod
+    def _describe(t, tz_offset):
+        from django.utils import timezone
+        from .. import scheduler
+        next_run = scheduler.next_slot(t, tz_offset, timezone.now()) if t.enabled else None
+        return {
+            'task_id':        t.task_id,
+            'enabled':        t.enabled,
+            'schedule_time':  t.schedule_time,
+            'schedule_days':  t.schedule_days,
+            'next_run_at':    next_run.isoformat() if next_run else None,
+            'last_fired_at':  t.schedule_fired_at.isoformat() if t.schedule_fired_at else None,
+            'scheduler_active': scheduler.leader_active(),
+        }
 
     def post(self, request):
+        from ..models import SystemSettings
+        from .. import scheduler
         task_id       = request.data.get('task_id', 'update_rnm')
         enabled       = request.data.get('enabled', False)
         schedule_time = (request.data.get('schedule_time') or '').strip()
         schedule_days = request.data.get('schedule_days', '0,1,2,3,4')
 
-        MARKER = f'{self.SCHEDULER_SCRIPT} {task_id}'
+        if task_id not in SCHEDULED_TASKS:
+            return Response({'error': f'Недопустимый task_id. Разрешены: {", ".join(SCHEDULED_TASKS)}'}, status=400)
 
         if enabled:
             # Валидация времени
             if not schedule_time or ':' not in schedule_time:
                 return Response({'error': 'Укажите время в формате ЧЧ:ММ'}, status=400)
             try:
-                hh, mm = schedule_time.split(':')
-                hh, mm = int(hh), int(mm)
-                if not (0 <= hh <= 23 and 0 <= mm <= 59):
-                    raise ValueError
+                scheduler.parse_time(schedule_time)
             except ValueError:
                 return Response({'error': 'Некорректное время'}, status=400)
+            try:
+                days = scheduler.parse_days(schedule_days)
+            except ValueError:
+                return Response({'error': 'Некорректные дни недели'}, status=400)
+            if not days:
+                return Response({'error': 'Выберите хотя бы один день недели'}, status=400)
 
-            # Конвертируем местное время → UTC с учётом timezone_offset из настроек
-            from ..models import SystemSettings
-            settings_obj = SystemSettings.get()
-            tz_offset = settings_obj.timezone_offset  # например +6 для Омска
-            total_minutes = hh * 60 + mm - tz_offset * 60
-            # Нормализуем в 0..1439
-            total_minutes = total_minutes % (24 * 60)
-            utc_hh = total_minutes // 60
-            utc_mm = total_minutes % 60
-
-            # Если смещение сдвигает за полночь — корректируем дни
-            day_shift = (hh * 60 + mm - tz_offset * 60) // (24 * 60)
-
-            # Конвертируем дни: у нас 0=пн..6=вс → cron 1=пн..7=вс (0=вс тоже работает)
-            if isinstance(schedule_days, list):
-                days_list = [int(d) for d in schedule_days]
-            else:
-                days_list = [int(d) for d in str(schedule_days).split(',') if d.strip()]
-
-            # Применяем сдвиг дня если время переехало за полночь
-            if day_shift != 0:
-                days_list = [((d + day_shift) % 7) for d in days_list]
-
-            cron_days = [(d + 1) % 7 for d in days_list]
-            cron_days_str = ','.join(str(d) for d in sorted(set(cron_days)))
-
-            cron_line = f'{utc_mm} {utc_hh} * * {cron_days_str} {self.SCHEDULER_SCRIPT} {task_id}'
-
-            stdout, stderr, rc = self._call('set', MARKER, cron_line)
-            if rc != 0 or stdout != 'OK':
-                return Response({'error': f'Ошибка записи в crontab: {stderr or stdout}'}, status=500)
-
-            utc_str = f'{utc_hh:02d}:{utc_mm:02d} UTC'
-            tz_label = f'UTC+{tz_offset}' if tz_offset >= 0 else f'UTC{tz_offset}'
-            action = f'Расписание включено: {schedule_time} ({tz_label}) = {utc_str}, дни {cron_days_str} (cron)'
-        else:
-            cron_line = None
-            stdout, stderr, rc = self._call('remove', MARKER)
-            if rc != 0:
-                return Response({'error': f'Ошибка удаления из crontab: {stderr or stdout}'}, status=500)
-            action = 'Расписание выключено'
-
-        # Сохраняем настройки в БД
+        # Сохраняем настройки в БД — планировщик прочитает их на следующем шаге
         t = _get_or_create_task(task_id)
         t.enabled = bool(enabled)
         if schedule_time:
@@ -604,17 +981,28 @@ class ScheduledTaskCronView(APIView):
             else:
                 t.schedule_days = str(schedule_days)
         t.save()
+        scheduler.mark_schedule_changed([task_id])
+        t.refresh_from_db()
 
-        return Response({'ok': True, 'message': action, 'cron_line': cron_line or 'удалено'})
+        tz_offset = SystemSettings.get().timezone_offset
+        info = self._describe(t, tz_offset)
+        if enabled:
+            tz_label = f'UTC+{tz_offset}' if tz_offset >= 0 else f'UTC{tz_offset}'
+            action = f'Расписание включено: {schedule_time} ({tz_label})'
+            if info['next_run_at']:
+                from datetime import timedelta
+                local_next = datetime.fromisoformat(info['next_run_at']) + timedelta(hours=tz_offset)
+                action += f', следующий запуск {local_next:%d.%m %H:%M}'
+        else:
+            action = 'Расписание выключено'
+        return Response({'ok': True, 'message': action, **info})
 
     def get(self, request):
-        """Показать текущую crontab-строку для задания"""
+        """Расписание задания и время следующего запуска"""
+        from ..models import SystemSettings
         task_id = request.query_params.get('task_id', 'update_rnm')
-        MARKER  = f'{self.SCHEDULER_SCRIPT} {task_id}'
-        stdout, stderr, rc = self._call('list', MARKER)
-        if rc != 0:
-            return Response({'error': stderr or 'Ошибка чтения crontab'}, status=500)
-        return Response({'cron_line': stdout or None})
+        t = _get_or_create_task(task_id)
+        return Response(self._describe(t, SystemSettings.get().timezone_offset))
 
 
 # ─────────────────────────────────────────────────────────────
@@ -623,30 +1011,28 @@ class ScheduledTaskCronView(APIView):
 
 SYNC_TASK_ID = 'rnm_sync'
 
+# Автопривязка: минимальная оценка лучшего кандидата
+# и минимальный отрыв от второго (иначе привязка неоднозначна)
+RNM_MATCH_THRESHOLD = 0.85
+RNM_MATCH_MARGIN    = 0.1
+
 
 class RnmSyncView(APIView):
     """Запуск сверки РНМ с ОФД и получение результата."""
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        import threading
         from ..models import ScheduledTask
         company_id = request.data.get('company_id')  # None = все компании
 
-        t, _ = ScheduledTask.objects.get_or_create(
+        ScheduledTask.objects.get_or_create(
             task_id=SYNC_TASK_ID,
             defaults={'name': 'Сверка РНМ с ОФД'}
         )
-        if t.status == 'running':
+        job = _enqueue_task('rnm_sync', SYNC_TASK_ID, request.user, company_id=company_id)
+        if job is None:
             return Response({'error': 'Сверка уже выполняется'}, status=400)
-
-        thread = threading.Thread(
-            target=_run_rnm_sync,
-            args=(company_id, request.user.id),
-            daemon=True,
-        )
-        thread.start()
-        return Response({'ok': True, 'message': 'Сверка запущена'})
+        return Response({'ok': True, 'message': 'Сверка запущена', 'job_id': str(job.pk)})
 
     def delete(self, request):
         """Удалить ККТ по РНМ с записью в историю изменений."""
@@ -693,13 +1079,129 @@ class RnmSyncView(APIView):
         })
 
 
+class RnmSyncApplyView(APIView):
+    """
+    Массовая привязка РНМ из результата сверки к клиентам.
+
+    POST /api/clients/rnm-sync/apply/
+      threshold — привязать все РНМ, у которых лучший кандидат набрал не меньше (по умолчанию 0.85)
+      links     — явный список [{rnm, client_id}] (выбор оператора), применяется вместе с threshold
+      rnms      — ограничить автопривязку этими РНМ
+    ККТ и записи истории создаются пакетно, привязанные РНМ убираются из результата сверки.
+    """
+    permission_classes = [IsAuthenticated, CanEditClient]
+
+    def post(self, request):
+        from django.db import transaction
+        from ..models import ScheduledTask, KktData, ClientActivity, Client
+
+        try:
+            threshold = float(request.data.get('threshold', RNM_MATCH_THRESHOLD))
+        except (TypeError, ValueError):
+            return Response({'error': 'Некорректный threshold'}, status=400)
+        links = request.data.get('links') or []
+        only_rnms = {str(r).strip() for r in (request.data.get('rnms') or []) if str(r).strip()}
+        if not isinstance(links, list):
+            return Response({'error': 'links должен быть списком'}, status=400)
+        pairs = []
+        for i, link in enumerate(links):
+            if not isinstance(link, dict):
+                return Response({'error': f'links[{i}]: ожидается объект {{rnm, client_id}}'}, status=400)
+            client_id = link.get('client_id')
+            if isinstance(client_id, bool) or not str(client_id).strip().isdigit():
+                return Response({'error': f'links[{i}]: некорректный client_id «{client_id}»'}, status=400)
+            pairs.append((str(link.get('rnm', '')).strip(), int(client_id)))
+
+        with transaction.atomic():
+            try:
+                t = ScheduledTask.objects.select_for_update().get(task_id=SYNC_TASK_ID)
+            except ScheduledTask.DoesNotExist:
+                return Response({'error': 'Сверка ещё не выполнялась'}, status=404)
+            if t.status == 'running':
+                return Response({'error': 'Сверка выполняется — дождитесь результата'}, status=400)
+            try:
+                result = json.loads(t.last_run_result or '')
+            except Exception:
+                result = None
+            if not result or 'missing_in_us' not in result:
+                return Response({'error': 'Нет результата сверки'}, status=404)
+
+            missing = {item['rnm']: item for item in result['missing_in_us']}
+
+            # РНМ → client_id: сначала явный выбор оператора, затем автопривязка по порогу
+            plan = {}
+            skipped = []
+            for rnm, client_id in pairs:
+                if rnm not in missing:
+                    skipped.append({'rnm': rnm, 'reason': 'РНМ отсутствует в результате сверки'})
+                    continue
+                plan[rnm] = client_id
+
+            for rnm, item in missing.items():
+                if rnm in plan or (only_rnms and rnm not in only_rnms):
+                    continue
+                candidates = item.get('candidates') or []
+                if not candidates or candidates[0]['score'] < threshold:
+                    continue
+                if len(candidates) > 1 and candidates[0]['score'] - candidates[1]['score'] < RNM_MATCH_MARGIN:
+                    skipped.append({'rnm': rnm, 'reason': 'Несколько похожих адресов — нужен ручной выбор'})
+                    continue
+                plan[rnm] = candidates[0]['client_id']
+
+            # Клиент должен принадлежать компании из сверки, РНМ не должен быть уже привязан
+            clients = Client.objects.filter(pk__in=set(plan.values()), is_draft=False).in_bulk()
+            existing = set(
+                KktData.objects.filter(kkt_reg_id__in=list(plan)).values_list('kkt_reg_id', flat=True)
+            )
+
+            kkt_objs = []
+            activities = []
+            applied = []
+            for rnm, client_id in plan.items():
+                item = missing[rnm]
+                client = clients.get(client_id)
+                if client is None or client.ofd_company_id != item['company_id']:
+                    skipped.append({'rnm': rnm, 'reason': 'Клиент не найден в компании ОФД'})
+                    continue
+                if rnm in existing:
+                    skipped.append({'rnm': rnm, 'reason': 'РНМ уже привязан'})
+                    continue
+                kkt_objs.append(KktData(
+                    client=client,
+                    kkt_reg_id=rnm,
+                    kkt_model=item.get('model', ''),
+                    fn_number=item.get('fn', ''),
+                    fiscal_address=item.get('address', ''),
+                ))
+                activities.append(ClientActivity(
+                    client=client, user=request.user,
+                    action=f'Добавлена ККТ (сверка РНМ)\nРНМ: {rnm}\nСерийный номер: —\nНомер ФН: {item.get("fn") or "—"}'
+                ))
+                applied.append({'rnm': rnm, 'client_id': client.id, 'client_name': client.address or f'#{client.id}'})
+
+            KktData.objects.bulk_create(kkt_objs, batch_size=500)
+            ClientActivity.objects.bulk_create(activities, batch_size=500)
+
+            applied_rnms = {a['rnm'] for a in applied}
+            result['missing_in_us'] = [i for i in result['missing_in_us'] if i['rnm'] not in applied_rnms]
+            t.last_run_result = json.dumps(result, ensure_ascii=False)
+            t.save(update_fields=['last_run_result'])
+
+        return Response({
+            'ok': True,
+            'applied': applied,
+            'skipped': skipped,
+            'message': f'Привязано РНМ: {len(applied)}, пропущено: {len(skipped)}',
+        })
+
+
 def _run_rnm_sync(company_id, user_id):
     """Фоновая сверка РНМ с ОФД."""
-    from ..models import ScheduledTask, KktData, OfdCompany, Client
+    from ..models import KktData, OfdCompany, Client
     from django.utils import timezone
 
-    def _set(**kwargs):
-        ScheduledTask.objects.filter(task_id=SYNC_TASK_ID).update(**kwargs)
+    run = RunRecorder(SYNC_TASK_ID, user_id=user_id, params={'company_id': company_id})
+    _set = ProgressReporter(SYNC_TASK_ID, run=run)
 
     _set(status='running', progress=0, progress_text='Инициализация...', last_run_at=timezone.now())
 
@@ -718,8 +1220,14 @@ def _run_rnm_sync(company_id, user_id):
         total_missing_ofd = []   # есть у нас, нет в ОФД
         total_missing_us  = []   # есть в ОФД, нет у нас
         errors = []
+        stopped = None
+        checked = 0
 
         for idx, company in enumerate(companies):
+            stopped = jobs.stop_reason()
+            if stopped:
+                break
+            checked = idx + 1
             pct = int((idx / len(companies)) * 90)
             _set(progress=pct, progress_text=f'Компания {idx+1}/{len(companies)}: {company.name}')
 
@@ -729,7 +1237,9 @@ def _run_rnm_sync(company_id, user_id):
 
             # Получаем все РНМ из ОФД по ИНН — один запрос, без детализации
             try:
-                ofd_items = ofd_get_all_rnm(company.inn, company.ofd_token, timeout=60)
+                run.add('ofd_calls')
+                with run.timed('companies', company.name):
+                    ofd_items = ofd_get_all_rnm(company.inn, company.ofd_token, timeout=60)
             except Exception as e:
                 errors.append(f'{company.name}: ошибка запроса к ОФД — {str(e)[:100]}')
                 continue
@@ -770,9 +1280,25 @@ def _run_rnm_sync(company_id, user_id):
             ofd_set = set(ofd_rnms.keys())
             our_set = set(our_rnms.keys())
 
+            # Индекс адресов клиентов компании — для подбора кандидатов на привязку
+            missing_rnms = sorted(ofd_set - our_set)
+            address_index = None
+            if missing_rnms:
+                address_index = AddressIndex(
+                    Client.objects.filter(ofd_company=company, is_draft=False).only('id', 'address')
+                )
+
             # Есть в ОФД, нет у нас
-            for rnm in sorted(ofd_set - our_set):
+            for rnm in missing_rnms:
                 info = ofd_rnms[rnm]
+                candidates = [
+                    {
+                        'client_id':   c.id,
+                        'client_name': c.address or f'#{c.id}',
+                        'score':       round(score, 2),
+                    }
+                    for score, c in address_index.candidates(info['address'])
+                ]
                 total_missing_us.append({
                     'company_id':   company.id,
                     'company_name': company.name,
@@ -780,6 +1306,7 @@ def _run_rnm_sync(company_id, user_id):
                     'address':      info['address'],
                     'model':        info['model'],
                     'fn':           info['fn'],
+                    'candidates':   candidates,
                 })
 
             # Есть у нас, нет в ОФД
@@ -796,21 +1323,27 @@ def _run_rnm_sync(company_id, user_id):
                 })
 
         result = {
-            'companies_checked': len(companies),
+            'companies_checked': checked,
+            'companies_total':   len(companies),
+            'cancelled':         stopped,
+            'match_threshold':   RNM_MATCH_THRESHOLD,
             'missing_in_us':     total_missing_us,    # есть в ОФД, нет у нас
             'missing_in_ofd':    total_missing_ofd,   # есть у нас, нет в ОФД
             'errors':            errors,
         }
 
+        run.update(items_total=len(companies), items_done=checked, errors=len(errors))
         summary = (
-            f'Проверено компаний: {len(companies)}. '
+            f'Проверено компаний: {checked} из {len(companies)}. '
             f'Есть в ОФД, нет у нас: {len(total_missing_us)}. '
             f'Есть у нас, нет в ОФД: {len(total_missing_ofd)}. '
             f'Ошибок: {len(errors)}.'
         )
+        if stopped:
+            summary = f'Остановлено: {stopped}. ' + summary
 
         _set(
-            status='success' if not errors else 'error',
+            status=_final_status(stopped, errors),
             progress=100,
             progress_text=summary,
             last_run_result=json.dumps(result, ensure_ascii=False),
@@ -828,14 +1361,20 @@ def _run_rnm_sync(company_id, user_id):
 # ─────────────────────────────────────────────────────────────
 
 def _run_backup_system(task_id, user_id):
-    """Полный бэкап: дамп БД + медиафайлы. Хранит последние 7 копий."""
+    """
+    Полный бэкап одним проходом: дамп БД (backup.dump_database) и манифест медиа (backup_media)
+    пишутся прямо в сжатый архив (backup_archive.ArchiveWriter). Манифест бэкапа — manifest.json
+    в архиве и запись в индексе (backup_index). Хранит последние 7 копий; с BACKUP_S3_* — ещё и
+    удалённую копию (backup_remote).
+    """
+    import json
     import traceback
-    import shutil
+    from django.conf import settings
     from django.utils import timezone
-    from ..models import ScheduledTask
-
-    def _set(**kwargs):
-        ScheduledTask.objects.filter(task_id=task_id).update(**kwargs)
+    from .. import backup_index, backup_media, backup_remote
+    from ..backup import dump_database, estimate_size
+    from ..backup_archive import ArchiveWriter, CODECS, is_archive, archive_stem, resolve_codec
+    _set = ProgressReporter(task_id, run=RunRecorder(task_id, user_id=user_id))
 
     _set(status='running', progress=0, progress_text='Инициализация...', last_run_at=timezone.now())
     started_at = timezone.now()
@@ -844,90 +1383,143 @@ def _run_backup_system(task_id, user_id):
     MEDIA_DIR  = '/app/media'
     KEEP_DAYS  = 7
 
+    def _fmt(b):
+        if b >= 1024 ** 2: return f'{b / 1024 ** 2:.1f} МБ'
+        if b >= 1024:      return f'{b / 1024:.1f} КБ'
+        return f'{b} Б'
+
+    archive = None
     try:
         os.makedirs(BACKUP_DIR, exist_ok=True)
         stamp = timezone.now().strftime('%Y-%m-%d_%H-%M-%S')
-        backup_folder = os.path.join(BACKUP_DIR, f'backup_{stamp}')
-        os.makedirs(backup_folder, exist_ok=True)
-
-        # ── 1. Дамп базы данных через Django dumpdata ────────
-        _set(progress=10, progress_text='Создание дампа базы данных...')
-        db_file = os.path.join(backup_folder, 'db.json')
-        from django.core.management import call_command
-        import io
-        buf = io.StringIO()
-        call_command(
-            'dumpdata',
-            '--natural-foreign',
-            '--natural-primary',
-            '--exclude=contenttypes',
-            '--exclude=auth.permission',
-            '--indent=2',
-            stdout=buf,
-        )
-        db_data = buf.getvalue()
-        with open(db_file, 'w', encoding='utf-8') as f:
-            f.write(db_data)
-        db_size = os.path.getsize(db_file)
-
-        # ── 2. Копирование медиафайлов ───────────────────────
-        _set(progress=40, progress_text='Копирование медиафайлов...')
-        media_dst = os.path.join(backup_folder, 'media')
-        if os.path.exists(MEDIA_DIR):
-            shutil.copytree(MEDIA_DIR, media_dst)
-            media_size = sum(
-                os.path.getsize(os.path.join(dp, f))
-                for dp, dn, fn in os.walk(media_dst) for f in fn
-            )
-        else:
-            os.makedirs(media_dst, exist_ok=True)
-            media_size = 0
-
-        # ── 3. Архивируем папку бэкапа ───────────────────────
-        _set(progress=70, progress_text='Архивирование...')
-        archive_path = os.path.join(BACKUP_DIR, f'backup_{stamp}')
-        shutil.make_archive(archive_path, 'gztar', BACKUP_DIR, f'backup_{stamp}')
-        shutil.rmtree(backup_folder)
-        archive_file = archive_path + '.tar.gz'
-        archive_size = os.path.getsize(archive_file)
-
-        # ── 4. Удаляем старые бэкапы — оставляем последние KEEP_DAYS копий ─
+        name = f'backup_{stamp}'
+        codec = resolve_codec()
+        archive_file = os.path.join(BACKUP_DIR, name + CODECS[codec]['ext'])
+
+        # ── 1. Дамп базы данных — сразу в архив ─────────────
+        _set(progress=5, progress_text='Создание дампа базы данных...')
+        estimate = estimate_size()
+
+        def _progress(done):
+            pct = 5 + int(65 * min(done / estimate, 1)) if estimate else 5
+            _set(progress=pct, progress_text=f'Дамп базы данных: {_fmt(done)}')
+
+        archive = ArchiveWriter(archive_file, name, codec=codec, on_progress=_progress)
+        dump = dump_database(archive, stop=jobs.stop_reason, tmp_root=BACKUP_DIR)
+        db_size = dump['size'] if dump else 0
+
+        stopped = jobs.stop_reason()
+        if stopped:
+            archive.abort()
+            _set(status='cancelled', progress=0, progress_text=f'Остановлено: {stopped}',
+                 last_run_result=f'Резервное копирование остановлено на дампе БД: {stopped}. Копия не создана')
+            return
+
+        # ── 2. Медиафайлы: новые — в общее хранилище, в архив — манифест ─
+        archive.on_progress = None
+        _set(progress=70, progress_text='Медиафайлы: поиск изменений...')
+        media = backup_media.snapshot(MEDIA_DIR, BACKUP_DIR, name, stop=jobs.stop_reason)
+        media_size = media['size'] if media else 0
+
+        stopped = jobs.stop_reason()
+        if stopped:
+            archive.abort()
+            _set(status='cancelled', progress=0, progress_text=f'Остановлено: {stopped}',
+                 last_run_result=f'Резервное копирование остановлено на копировании медиа: {stopped}. Копия не создана')
+            return
+
+        archive.add_file(backup_media.manifest_path(BACKUP_DIR, name), backup_media.MANIFEST_NAME)
+        manifest = {
+            'version': 1,
+            'file': os.path.basename(archive_file),
+            'name': name,
+            'created_at': started_at.timestamp(),
+            'duration': round((timezone.now() - started_at).total_seconds(), 1),
+            'codec': codec,
+            'db': dump,
+            'media': media,
+        }
+        archive.add_bytes(backup_index.MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=1).encode())
+        _set(progress=85, progress_text='Завершение архива...')
+        archive_size = archive.close()
+        manifest['archive'] = {'size': archive_size, 'sha256': archive.sha256}
+        backup_index.add(BACKUP_DIR, manifest)
+        archive_sha, archive = archive.sha256, None
+
+        # ── 3. Удаляем старые бэкапы — оставляем последние KEEP_DAYS копий ─
         _set(progress=90, progress_text='Очистка старых резервных копий...')
         all_backups = sorted(
-            [f for f in os.listdir(BACKUP_DIR) if f.startswith('backup_') and f.endswith('.tar.gz')],
+            [f for f in os.listdir(BACKUP_DIR) if is_archive(f)],
             reverse=True  # новые первые
         )
-        removed = 0
+        removed = []
         remove_errors = []
         for fname in all_backups[KEEP_DAYS:]:  # всё что после 7-го
             fpath = os.path.join(BACKUP_DIR, fname)
             try:
                 os.remove(fpath)
-                removed += 1
+                removed.append(fname)
             except Exception as e:
                 remove_errors.append(f'{fname}: {e}')
+        backup_index.remove(BACKUP_DIR, removed)
+        # Блобы медиа, на которые больше не ссылается ни одна копия
+        kept = {archive_stem(f) for f in os.listdir(BACKUP_DIR) if is_archive(f)}
+        blobs = backup_media.gc(BACKUP_DIR, kept)
+
+        # ── 4. Удалённая копия (если настроена) ────────────
+        remote_note, remote_error = '', ''
+        if backup_remote.enabled():
+            def _remote_progress(done, total):
+                pct = 92 + int(7 * min(done / total, 1)) if total else 92
+                _set(progress=pct, progress_text=f'Удалённая копия: {_fmt(done)} из {_fmt(total)}')
+
+            _set(progress=92, progress_text='Удалённая копия...')
+            try:
+                r = backup_remote.replicate(BACKUP_DIR, stop=jobs.stop_reason, on_progress=_remote_progress)
+            except backup_remote.RemoteError as e:
+                remote_error = str(e)
+                remote_note = f'\nУдалённая копия: ошибка — {remote_error}'
+            else:
+                remote_note = (
+                    f'\nУдалённая копия: архивов {r["archives"]} ({_fmt(r["bytes"])}), '
+                    f'медиа {r["blobs"]} ({_fmt(r["blob_bytes"])}); удалено архивов {r["removed"]}, блобов {r["removed_blobs"]}'
+                )
+                if r['stopped']:
+                    remote_note = '\nУдалённая копия: остановлена, догрузится следующим запуском' + remote_note
 
         elapsed = timezone.now() - started_at
         elapsed_str = f'{int(elapsed.total_seconds() // 60)} мин {int(elapsed.total_seconds() % 60)} сек'
 
-        def _fmt(b):
-            if b >= 1024 ** 2: return f'{b / 1024 ** 2:.1f} МБ'
-            if b >= 1024:      return f'{b / 1024:.1f} КБ'
-            return f'{b} Б'
-
         summary = (
             f'Бэкап создан: {archive_file}\n'
-            f'БД: {_fmt(db_size)}, медиа: {_fmt(media_size)}, архив: {_fmt(archive_size)}\n'
-            f'Удалено старых копий: {removed}\n'
+            f'БД ({dump["format"]}): {_fmt(db_size)}, архив ({codec}): {_fmt(archive_size)}\n'
+            f'Медиа: {media["files"]} файлов, {_fmt(media_size)}; новых: {media["new_files"]}, {_fmt(media["new_size"])}\n'
+            f'Хранилище медиа: {_fmt(blobs["size"])} ({blobs["blobs"]} файлов), '
+            f'освобождено {_fmt(blobs["removed_size"])}\n'
+            f'Строк в БД: {sum(dump["rows"].values())} ({len(dump["rows"])} таблиц), SHA-256: {archive_sha[:16]}…\n'
+            f'Удалено старых копий: {len(removed)}\n'
             f'Время выполнения: {elapsed_str}'
         )
+        if codec != settings.BACKUP_COMPRESSION:
+            summary += f'\nСжатие {settings.BACKUP_COMPRESSION} недоступно (нет модуля zstandard и утилиты zstd) — {codec}'
+        if dump['fallback']:
+            summary += f'\npg_dump не использован: {dump["fallback"]}'
         if remove_errors:
             summary += '\nОшибки удаления:\n' + '\n'.join(remove_errors)
+        summary += remote_note
+        if remote_error:
+            # Локальная копия есть, но без удалённой бэкап неполный — задание с ошибкой
+            _set(status='error', progress=100,
+                 progress_text='Локальная копия создана, удалённая — ошибка',
+                 last_run_result=summary)
+            return
         _set(status='success', progress=100,
              progress_text=f'Готово. Архив: {_fmt(archive_size)}, время: {elapsed_str}',
              last_run_result=summary)
 
     except Exception as e:
+        if archive is not None:
+            archive.abort()
         _set(status='error', progress=0,
              progress_text='Ошибка резервного копирования',
              last_run_result=f'Критическая ошибка:\n{str(e)}\n{traceback.format_exc()[:800]}')
@@ -941,42 +1533,64 @@ BACKUP_DIR = '/opt/support-portal/backups'
 
 
 class BackupListView(APIView):
-    """Список доступных резервных копий."""
+    """Список доступных резервных копий — из индекса (backup_index), без stat и распаковки архивов."""
     permission_classes = [IsAuthenticated, IsAdmin]
 
     def get(self, request):
         if not os.path.exists(BACKUP_DIR):
             return Response([])
 
+        import datetime
+        from ..backup_index import archive_size, backups as backup_entries
         backups = []
-        for fname in sorted(os.listdir(BACKUP_DIR), reverse=True):
-            if fname.startswith('backup_') and fname.endswith('.tar.gz'):
-                fpath = os.path.join(BACKUP_DIR, fname)
-                stat = os.stat(fpath)
-                size = stat.st_size
-                if size >= 1024 ** 2:
-                    size_str = f'{size / 1024 ** 2:.1f} МБ'
-                elif size >= 1024:
-                    size_str = f'{size / 1024:.1f} КБ'
-                else:
-                    size_str = f'{size} Б'
-                import datetime
-                mtime = datetime.datetime.fromtimestamp(stat.st_mtime).strftime('%d.%m.%Y %H:%M:%S')
-                backups.append({
-                    'filename': fname,
-                    'size': size,
-                    'size_str': size_str,
-                    'created_at': mtime,
-                })
+        for entry in backup_entries(BACKUP_DIR):
+            size = archive_size(entry)
+            if size >= 1024 ** 2:
+                size_str = f'{size / 1024 ** 2:.1f} МБ'
+            elif size >= 1024:
+                size_str = f'{size / 1024:.1f} КБ'
+            else:
+                size_str = f'{size} Б'
+            db = entry.get('db') or {}
+            media = entry.get('media') or {}
+            backups.append({
+                'filename': entry['file'],
+                'size': size,
+                'size_str': size_str,
+                'created_at': datetime.datetime.fromtimestamp(entry['created_at']).strftime('%d.%m.%Y %H:%M:%S'),
+                'has_manifest': 'archive' in entry,
+                'codec': entry.get('codec'),
+                'duration': entry.get('duration'),
+                'db_format': db.get('format'),
+                'db_rows': sum(db['rows'].values()) if db.get('rows') else None,
+                'db_tables': db.get('rows'),
+                'media_files': media.get('files'),
+                'media_size': media.get('size'),
+                'sha256': entry.get('archive', {}).get('sha256'),
+            })
         return Response(backups)
 
 
+class BackupVerifyView(APIView):
+    """Проверка бэкапа по манифесту без восстановления: SHA-256 архива и блобы медиа."""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def post(self, request):
+        filename = request.data.get('filename', '').strip()
+        if not filename or '/' in filename or '..' in filename:
+            return Response({'error': 'Недопустимое имя файла'}, status=400)
+        from ..backup_index import verify
+        result = verify(BACKUP_DIR, filename)
+        if not result['checked'] and result['errors']:
+            return Response({'error': result['errors'][0]}, status=404)
+        return Response(result)
+
+
 class BackupRestoreView(APIView):
     """Восстановление из резервной копии."""
     permission_classes = [IsAuthenticated, IsAdmin]
 
     def post(self, request):
-        import threading
         filename = request.data.get('filename', '').strip()
         if not filename:
             return Response({'error': 'Имя файла не указано'}, status=400)
@@ -991,20 +1605,15 @@ class BackupRestoreView(APIView):
 
         from ..models import ScheduledTask
         RESTORE_TASK_ID = 'restore_backup'
-        t, _ = ScheduledTask.objects.get_or_create(
+        ScheduledTask.objects.get_or_create(
             task_id=RESTORE_TASK_ID,
             defaults={'name': 'Восстановление из бэкапа'}
         )
-        if t.status == 'running':
-            return Response({'error': 'Восстановление уже выполняется'}, status=400)
-
-        thread = threading.Thread(
-            target=_run_restore_backup,
-            args=(RESTORE_TASK_ID, filepath, request.user.id),
-            daemon=True,
-        )
-        thread.start()
-        return Response({'ok': True, 'message': f'Восстановление запущено из {filename}'})
+        job = _enqueue_task('restore_backup', RESTORE_TASK_ID, request.user,
+                            conflicts=('backup_system', 'archive_activity'), filepath=filepath)
+        if job is None:
+            return Response({'error': 'Восстановление или резервное копирование уже выполняется'}, status=400)
+        return Response({'ok': True, 'message': f'Восстановление запущено из {filename}', 'job_id': str(job.pk)})
 
     def get(self, request):
         """Прогресс восстановления."""
@@ -1024,25 +1633,38 @@ class BackupRestoreView(APIView):
 
 
 def _run_restore_backup(task_id, filepath, user_id):
-    """Фоновое восстановление: распаковка архива → flush → loaddata → копирование медиа."""
+    """
+    Фоновое восстановление: распаковка архива → загрузка дампа в промежуточную схему → замена данных
+    одной транзакцией (backup.restore_database) → синхронизация медиа.
+    """
     import shutil
     import traceback
     import tempfile
     from django.utils import timezone
-    from ..models import ScheduledTask
-
-    def _set(**kwargs):
-        ScheduledTask.objects.filter(task_id=task_id).update(**kwargs)
+    _set = ProgressReporter(
+        task_id, run=RunRecorder(task_id, user_id=user_id, params={'file': os.path.basename(filepath)}),
+    )
 
     _set(status='running', progress=0, progress_text='Инициализация...', last_run_at=timezone.now())
     started_at = timezone.now()
     tmp_dir = None
 
     try:
-        # ── 1. Распаковка архива ─────────────────────────────
+        # ── 1. Проверка по манифесту и распаковка архива ────
+        from .. import backup_index
+        entry = {e['file']: e for e in backup_index.backups(BACKUP_DIR)}.get(os.path.basename(filepath), {})
+        if 'archive' in entry:
+            _set(progress=5, progress_text='Проверка контрольной суммы архива...')
+            if backup_index.sha256_file(filepath) != entry['archive']['sha256']:
+                _set(status='error', progress=0,
+                     progress_text='Ошибка: архив повреждён',
+                     last_run_result='База данных не изменялась. Контрольная сумма архива не совпадает с манифестом')
+                return
+
         _set(progress=10, progress_text='Распаковка архива...')
         tmp_dir = tempfile.mkdtemp(prefix='restore_')
-        shutil.unpack_archive(filepath, tmp_dir, 'gztar')
+        from ..backup_archive import extract
+        extract(filepath, tmp_dir)
 
         # Найти папку внутри архива
         entries = os.listdir(tmp_dir)
@@ -1051,61 +1673,61 @@ def _run_restore_backup(task_id, filepath, user_id):
         else:
             restore_root = tmp_dir
 
-        db_file    = os.path.join(restore_root, 'db.json')
-        media_src  = os.path.join(restore_root, 'media')
+        from ..backup import find_dump, restore_database
+        from .. import backup_media
+        db_format, db_file = find_dump(restore_root)
+        media_src  = os.path.join(restore_root, 'media')   # бэкапы до хранилища медиа
+        media_manifest = os.path.join(restore_root, backup_media.MANIFEST_NAME)
 
-        if not os.path.exists(db_file):
+        if db_file is None:
             _set(status='error', progress=0,
-                 progress_text='Ошибка: db.json не найден в архиве',
-                 last_run_result='Архив повреждён или имеет неверную структуру')
+                 progress_text='Ошибка: дамп БД не найден в архиве',
+                 last_run_result='Архив повреждён или имеет неверную структуру (нет db.dump, db.dir или db.json)')
             return
 
-        # ── 2. Очистка БД (только пользовательские таблицы) ─
-        _set(progress=30, progress_text='Очистка базы данных...')
-        from django.db import connection
-        # Таблицы которые не трогаем — системные Django
-        SKIP_TABLES = {
-            'django_migrations',
-            'django_content_type',
-            'auth_permission',
-            'auth_group',
-            'auth_group_permissions',
-        }
-        with connection.cursor() as cursor:
-            cursor.execute("SET session_replication_role = 'replica';")
-            tables = connection.introspection.table_names(cursor)
-            for table in tables:
-                if table in SKIP_TABLES or table.startswith('django_'):
-                    continue
-                cursor.execute(f'TRUNCATE TABLE "{table}" RESTART IDENTITY CASCADE;')
-            cursor.execute("SET session_replication_role = 'origin';")
-
-        # ── 3. Загрузка дампа ────────────────────────────────
-        _set(progress=55, progress_text='Восстановление данных из дампа...')
-        from django.core.management import call_command
-        # Копируем db.json в /tmp внутри контейнера чтобы loaddata нашёл файл
-        internal_db = '/tmp/restore_db.json'
-        shutil.copy2(db_file, internal_db)
-        try:
-            call_command('loaddata', internal_db, format='json', verbosity=0)
-        finally:
-            if os.path.exists(internal_db):
-                os.remove(internal_db)
+        media_files = None
+        if os.path.exists(media_manifest):
+            media_files = backup_media.read_manifest(media_manifest)
+            missing = backup_media.missing_blobs(media_files, BACKUP_DIR)
+            if missing:
+                _set(status='error', progress=0,
+                     progress_text=f'Ошибка: в хранилище медиа нет {len(missing)} файлов',
+                     last_run_result='База данных не изменялась. Нет в хранилище медиа:\n' + '\n'.join(missing[:50]))
+                return
+
+        # ── 2. Загрузка дампа и замена данных ───────────────
+        # Портал работает на прежних данных до замены; остановиться можно до неё
+        def _db_progress(done, total):
+            _set(progress=20 + int(done / max(total, 1) * 55),
+                 progress_text=f'Загрузка дампа ({db_format}): таблиц {done} из {total}...')
+
+        _set(progress=20, progress_text=f'Загрузка дампа ({db_format})...')
+        db = restore_database(db_format, db_file, stop=jobs.stop_reason, on_progress=_db_progress)
+        if db is None:
+            stopped = jobs.stop_reason() or 'остановлено'
+            _set(status='cancelled', progress=0,
+                 progress_text=f'Остановлено: {stopped}. База данных не изменялась',
+                 last_run_result=f'Восстановление из {os.path.basename(filepath)} остановлено до замены данных: {stopped}')
+            return
+        db_note = f', таблиц {db["tables"]}, строк {db["rows"]}' if db['tables'] is not None else ''
 
-        # ── 4. Восстановление медиафайлов ────────────────────
+        # ── 3. Восстановление медиафайлов ────────────────────
         _set(progress=80, progress_text='Восстановление медиафайлов...')
         media_dst = '/app/media'
-        if os.path.exists(media_src):
-            if os.path.exists(media_dst):
-                shutil.rmtree(media_dst)
-            shutil.copytree(media_src, media_dst)
+        m = None
+        if media_files is not None:
+            m = backup_media.restore(media_files, media_dst, BACKUP_DIR)
+        elif os.path.exists(media_src):
+            m = backup_media.restore_dir(media_src, media_dst)
+        media_note = f'\nМедиа: скопировано {m["copied"]}, без изменений {m["kept"]}, удалено {m["removed"]}' if m else ''
 
         elapsed = timezone.now() - started_at
         elapsed_str = f'{int(elapsed.total_seconds() // 60)} мин {int(elapsed.total_seconds() % 60)} сек'
 
         _set(status='success', progress=100,
              progress_text=f'Готово. Время: {elapsed_str}',
-             last_run_result=f'Восстановление выполнено из: {os.path.basename(filepath)}\nВремя: {elapsed_str}')
+             last_run_result=(f'Восстановление выполнено из: {os.path.basename(filepath)}\n'
+                              f'Дамп БД: {db_format}{db_note}{media_note}\nВремя: {elapsed_str}'))
 
     except Exception as e:
         _set(status='error', progress=0,
@@ -1114,3 +1736,56 @@ def _run_restore_backup(task_id, filepath, user_id):
     finally:
         if tmp_dir and os.path.exists(tmp_dir):
             shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# ─────────────────────────────────────────────────────────────
+#  Задания очереди (выполняет manage.py run_worker)
+# ─────────────────────────────────────────────────────────────
+
+@jobs.register('task.update_rnm', concurrency=1, max_attempts=2, timeout=6 * 3600, deadline=5 * 3600,
+               on_abort=_abort_task)
+def _job_update_rnm(job, task_id, user_id=None, company_id=None, only_expiring=False):
+    _run_update_rnm(task_id, company_id, user_id, only_expiring=only_expiring)
+    return _task_result(task_id)
+
+
+@jobs.register('task.fetch_external_ip', concurrency=1, max_attempts=2, timeout=2 * 3600, deadline=90 * 60,
+               on_abort=_abort_task)
+def _job_fetch_external_ip(job, task_id, user_id=None):
+    _run_fetch_external_ip(task_id, user_id)
+    return _task_result(task_id)
+
+
+@jobs.register('task.warm_kassa_ips', concurrency=1, max_attempts=2, timeout=2 * 3600, deadline=90 * 60,
+               on_abort=_abort_task)
+def _job_warm_kassa_ips(job, task_id, user_id=None):
+    _run_warm_kassa_ips(task_id, user_id)
+    return _task_result(task_id)
+
+
+@jobs.register('task.archive_activity', concurrency=1, max_attempts=2, timeout=2 * 3600, deadline=90 * 60,
+               on_abort=_abort_task)
+def _job_archive_activity(job, task_id, user_id=None):
+    _run_archive_activity(task_id, user_id)
+    return _task_result(task_id)
+
+
+@jobs.register('task.backup_system', concurrency=1, max_attempts=2, timeout=2 * 3600, deadline=90 * 60,
+               on_abort=_abort_task)
+def _job_backup_system(job, task_id, user_id=None):
+    _run_backup_system(task_id, user_id)
+    return _task_result(task_id)
+
+
+@jobs.register('rnm_sync', concurrency=1, max_attempts=2, timeout=6 * 3600, deadline=5 * 3600,
+               on_abort=_abort_task)
+def _job_rnm_sync(job, task_id, user_id=None, company_id=None):
+    _run_rnm_sync(company_id, user_id)
+    return _task_result(task_id)
+
+
+# Восстановление не повторяется автоматически: прерванное на середине требует решения администратора
+@jobs.register('restore_backup', priority=20, concurrency=1, timeout=2 * 3600, on_abort=_abort_task)
+def _job_restore_backup(job, task_id, filepath, user_id=None):
+    _run_restore_backup(task_id, filepath, user_id)
+    return _task_result(task_id)
@@ -0,0 +1,372 @@
+"""
+SSH к Микротикам: проверка host key, пул сессий, выполнение команды, параллельный обход.
+"""
+
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from django.conf import settings
+
+from .host_keys import get_store, make_policy
+
+# Команда Микротика: внешний IP через ipify
+EXTERNAL_IP_CMD = ':put ([/tool fetch url="https://api.ipify.org" http-method=get output=user as-value]->"data")'
+
+
+def _make_ssh_client(host):
+    """
+    Создаёт SSHClient с проверкой host key через хранилище ключей (host_keys.py).
+    При первом подключении — запоминает ключ (как ssh-keyscan).
+    При повторных — проверяет что ключ не изменился (защита от MITM).
+    """
+    import paramiko
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(make_policy())
+    return ssh
+
+
+class SSHSessionPool:
+    """
+    Пул SSH-сессий к Микротикам внутри процесса воркера.
+
+    Сессия после команды не закрывается, а возвращается в пул и переиспользуется
+    следующей командой к тому же хосту — без повторного handshake и аутентификации.
+    Ключ пула — (host, username, хеш пароля): смена пароля в настройках даёт новые сессии.
+
+    - не больше max_per_host одновременных сессий к одному хосту (остальные ждут);
+    - простаивающие дольше idle_timeout сессии закрываются;
+    - всего простаивающих не больше max_idle — лишние, самые старые, закрываются;
+    - на транспорт ставится keepalive, перед выдачей проверяется transport.is_active() и что ключ
+      хоста не отозван (отзыв в другом процессе виден по mtime known_hosts);
+    - evict(host) — сессии к хосту закрываются сразу (отзыв ключа), выданные не вернутся в пул.
+    """
+
+    def __init__(self, idle_timeout, keepalive, max_per_host, max_idle):
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.max_per_host = max_per_host
+        self.max_idle = max_idle
+        self._cond = threading.Condition()
+        self._idle = {}     # key → [(ssh, last_used)], последние — свежие
+        self._in_use = {}   # key → число выданных сессий
+        self._evicted = {}  # host → счётчик evict(): сессии, открытые до него, в пул не возвращаются
+        self._janitor = None
+
+    @staticmethod
+    def _key(host, username, password):
+        return host, username, hashlib.sha256((password or '').encode()).hexdigest()
+
+    @staticmethod
+    def _alive(ssh):
+        transport = ssh.get_transport()
+        return transport is not None and transport.is_active()
+
+    @staticmethod
+    def _trusted(host, ssh):
+        """Ключ, с которым открыта сессия, всё ещё сохранён для хоста."""
+        key = ssh.get_transport().get_remote_server_key()
+        saved = get_store().get(host).get(key.get_name())
+        return saved is not None and saved.asbytes() == key.asbytes()
+
+    def _connect(self, host, username, password, connect_timeout):
+        ssh = _make_ssh_client(host)
+        try:
+            ssh.connect(
+                host, username=username, password=password, port=22,
+                timeout=connect_timeout, banner_timeout=connect_timeout, auth_timeout=connect_timeout,
+            )
+            if self.keepalive:
+                ssh.get_transport().set_keepalive(self.keepalive)
+        except Exception:
+            ssh.close()
+            raise
+        with self._cond:
+            ssh._pool_epoch = self._evicted.get(host, 0)
+        return ssh
+
+    def _acquire(self, key, host, username, password, connect_timeout):
+        """Возвращает (ssh, reused). Ждёт не дольше connect_timeout, если к хосту уже max_per_host сессий."""
+        to_close = []
+        with self._cond:
+            ok = self._cond.wait_for(
+                lambda: self._in_use.get(key, 0) < self.max_per_host, timeout=connect_timeout,
+            )
+            if not ok:
+                raise TimeoutError(f'занято {self.max_per_host} SSH-сессий к {host}')
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            ssh = None
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate, last_used = idle.pop()
+                if time.monotonic() - last_used < self.idle_timeout and self._alive(candidate):
+                    ssh = candidate
+                    break
+                to_close.append(candidate)
+            if not idle:
+                self._idle.pop(key, None)
+        for old in to_close:
+            old.close()
+        if ssh is not None and not self._trusted(host, ssh):
+            ssh.close()
+            ssh = None
+        if ssh is not None:
+            return ssh, True
+        try:
+            return self._connect(host, username, password, connect_timeout), False
+        except Exception:
+            self._release(key, None)
+            raise
+
+    def _release(self, key, ssh):
+        """Возвращает сессию в пул; ssh=None — сессия закрыта/отброшена."""
+        to_close = []
+        with self._cond:
+            self._in_use[key] -= 1
+            if not self._in_use[key]:
+                del self._in_use[key]
+            fresh = ssh is not None and getattr(ssh, '_pool_epoch', 0) == self._evicted.get(key[0], 0)
+            if fresh and self._alive(ssh):
+                self._idle.setdefault(key, []).append((ssh, time.monotonic()))
+                ssh = None
+            to_close.extend(self._evict_locked())
+            self._cond.notify_all()
+            self._start_janitor_locked()
+        if ssh is not None:
+            to_close.append(ssh)
+        for old in to_close:
+            old.close()
+
+    def _evict_locked(self):
+        """Убирает из пула просроченные сессии и лишние сверх max_idle. Вызывать под self._cond."""
+        now = time.monotonic()
+        evicted, fresh = [], []
+        for key, sessions in list(self._idle.items()):
+            for ssh, last_used in sessions:
+                if now - last_used >= self.idle_timeout:
+                    evicted.append(ssh)
+                else:
+                    fresh.append((last_used, key, ssh))
+        fresh.sort(key=lambda x: x[0])
+        overflow = {id(ssh) for _, _, ssh in fresh[:max(0, len(fresh) - self.max_idle)]}
+        for key in list(self._idle):
+            kept = []
+            for ssh, last_used in self._idle[key]:
+                if id(ssh) in overflow:
+                    evicted.append(ssh)
+                elif now - last_used < self.idle_timeout:
+                    kept.append((ssh, last_used))
+            if kept:
+                self._idle[key] = kept
+            else:
+                del self._idle[key]
+        return evicted
+
+    def _start_janitor_locked(self):
+        """Фоновый поток, закрывающий простаивающие сессии, даже если команд больше нет."""
+        if self._janitor is not None and self._janitor.is_alive():
+            return
+        self._janitor = threading.Thread(target=self._janitor_loop, name='ssh-pool-janitor', daemon=True)
+        self._janitor.start()
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(max(1, self.idle_timeout / 2))
+            with self._cond:
+                to_close = self._evict_locked()
+                empty = not self._idle
+            for ssh in to_close:
+                ssh.close()
+            if empty:
+                with self._cond:
+                    if not self._idle:
+                        self._janitor = None
+                        return
+
+    @contextmanager
+    def session(self, host, username, password, connect_timeout=10):
+        """Выдаёт SSHClient из пула. Если внутри блока было исключение — сессия закрывается."""
+        key = self._key(host, username, password)
+        ssh, _ = self._acquire(key, host, username, password, connect_timeout)
+        try:
+            yield ssh
+        except BaseException:
+            self._release(key, None)
+            ssh.close()
+            raise
+        self._release(key, ssh)
+
+    def run(self, host, username, password, cmd, connect_timeout=10, exec_timeout=15):
+        """
+        Выполняет команду и возвращает stdout.
+        Если сессия из пула оказалась мёртвой (Микротик перезагрузился) — одна попытка
+        на новом подключении.
+        """
+        import paramiko
+        key = self._key(host, username, password)
+        for attempt in range(2):
+            ssh, reused = self._acquire(key, host, username, password, connect_timeout)
+            try:
+                try:
+                    stdin, stdout, stderr = ssh.exec_command(cmd, timeout=exec_timeout)
+                except (paramiko.SSHException, EOFError, OSError):
+                    if reused and attempt == 0:
+                        self._release(key, None)
+                        ssh.close()
+                        continue
+                    raise
+                output = stdout.read().decode('utf-8', errors='replace').strip()
+            except BaseException:
+                self._release(key, None)
+                ssh.close()
+                raise
+            self._release(key, ssh)
+            return output
+
+    def evict(self, host):
+        """Закрывает простаивающие сессии к хосту; выданные сейчас закроются при возврате."""
+        with self._cond:
+            self._evicted[host] = self._evicted.get(host, 0) + 1
+            sessions = [ssh for key in [k for k in self._idle if k[0] == host] for ssh, _ in self._idle.pop(key)]
+        for ssh in sessions:
+            ssh.close()
+
+    def close_all(self):
+        with self._cond:
+            sessions = [ssh for items in self._idle.values() for ssh, _ in items]
+            self._idle.clear()
+        for ssh in sessions:
+            ssh.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Пул создаётся лениво — уже после fork воркера gunicorn."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SSHSessionPool(
+                idle_timeout=settings.SSH_POOL_IDLE_TIMEOUT,
+                keepalive=settings.SSH_POOL_KEEPALIVE,
+                max_per_host=settings.SSH_POOL_MAX_PER_HOST,
+                max_idle=settings.SSH_POOL_MAX_IDLE,
+            )
+        return _pool
+
+
+def close_pool():
+    """Закрывает сессии пула этого процесса (остановка воркера). Пул не создавался — ничего."""
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.close_all()
+
+
+def mikrotik_exec(host, username, password, cmd, connect_timeout=10, exec_timeout=15):
+    """Выполняет команду на Микротике через пул сессий, возвращает stdout."""
+    return get_pool().run(host, username, password, cmd,
+                          connect_timeout=connect_timeout, exec_timeout=exec_timeout)
+
+
+def host_key_changed(e):
+    """Ошибка из-за несовпадения сохранённого host key."""
+    import paramiko
+    if isinstance(e, paramiko.BadHostKeyException):
+        return True
+    return isinstance(e, paramiko.SSHException) and 'not found in known_hosts' in str(e)
+
+
+def ssh_error_text(e):
+    """Короткое описание ошибки SSH для журнала задания."""
+    import paramiko
+    err_str = str(e)
+    if isinstance(e, paramiko.AuthenticationException):
+        return 'ошибка аутентификации SSH'
+    if host_key_changed(e):
+        return (
+            '⚠️ SSH ключ хоста изменился (замена Микротика?). '
+            'Удалите сохранённый ключ в списке SSH-ключей (system-settings/ssh-host-keys/)'
+        )
+    if isinstance(e, paramiko.SSHException):
+        return f'SSH ошибка: {err_str[:120]}'
+    if isinstance(e, TimeoutError) or 'timed out' in err_str.lower() or 'timeout' in err_str.lower():
+        return 'таймаут подключения'
+    return err_str[:120]
+
+
+# Запас предела на хост сверх таймаутов SSH: ожидание сессии в пуле, проверка ключа, разбор вывода
+DEADLINE_MARGIN = 10
+
+
+def host_deadline(connect_timeout=10, exec_timeout=15):
+    """Предел fan_out на один хост: SSH_HOST_DEADLINE, если задан, иначе подключение + выполнение + запас."""
+    return settings.SSH_HOST_DEADLINE or connect_timeout + exec_timeout + DEADLINE_MARGIN
+
+
+def fan_out(items, fn, on_result, max_workers=None, deadline=None, stop=None):
+    """
+    Выполняет fn(item) для всех items параллельно — не более max_workers одновременно.
+
+    on_result(item, result, error) вызывается в вызывающем потоке по мере готовности,
+    поэтому запись в БД остаётся в одном потоке. Если fn(item) не уложилась в deadline
+    секунд с момента старта (по умолчанию host_deadline()) — on_result получает TimeoutError,
+    а поток дорабатывает сам (его ограничивают таймауты сокетов) и результат отбрасывается.
+
+    stop() → True (проверяется не реже раза в секунду) — новые items не запускаются,
+    незавершённые отбрасываются без on_result; возвращается True.
+    """
+    max_workers = max_workers or settings.SSH_FANOUT_WORKERS
+    deadline = deadline or host_deadline()
+
+    started = {}
+    started_lock = threading.Lock()
+
+    def _call(key, item):
+        with started_lock:
+            started[key] = time.monotonic()
+        return fn(item)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ssh-fanout')
+    items_iter = enumerate(items)
+    pending = {}  # future → (key, item)
+
+    def _submit_next():
+        for key, item in items_iter:
+            pending[executor.submit(_call, key, item)] = (key, item)
+            return True
+        return False
+
+    try:
+        for _ in range(max_workers):
+            if not _submit_next():
+                break
+
+        while pending:
+            if stop is not None and stop():
+                return True
+            done, _ = wait(list(pending), timeout=1, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for fut in done:
+                key, item = pending.pop(fut)
+                try:
+                    result, error = fut.result(), None
+                except Exception as e:
+                    result, error = None, e
+                on_result(item, result, error)
+                _submit_next()
+
+            for fut, (key, item) in list(pending.items()):
+                with started_lock:
+                    t0 = started.get(key)
+                if t0 is not None and now - t0 > deadline:
+                    pending.pop(fut)
+                    on_result(item, None, TimeoutError(f'не уложился в {deadline} сек'))
+                    _submit_next()
+        return False
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
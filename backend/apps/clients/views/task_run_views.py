@@ -0,0 +1,120 @@
+from datetime import timedelta
+from statistics import median
+
+from django.utils import timezone
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from apps.accounts.permissions import IsAdmin
+from ..models import ScheduledTaskRun
+from ..task_runs import timings_items
+
+# Последний запуск дольше медианы предыдущих во столько раз — регрессия
+REGRESSION_RATIO = 1.5
+SLOWEST_KEYS = 10
+
+_LIST_FIELDS = (
+    'id', 'task_id', 'status', 'message', 'started_at', 'finished_at', 'duration',
+    'items_total', 'items_done', 'items_per_sec', 'errors', 'ofd_calls', 'ssh_calls',
+)
+
+
+def _run_payload(run, timings=False):
+    data = {f: getattr(run, f) for f in _LIST_FIELDS}
+    data['user'] = run.user.full_name if run.user else None
+    data['params'] = run.params
+    if timings:
+        data['timings'] = run.timings
+    return data
+
+
+def _int_param(request, name, default, maximum):
+    try:
+        return max(1, min(int(request.query_params.get(name, default)), maximum))
+    except (TypeError, ValueError):
+        return default
+
+
+class ScheduledTaskRunListView(APIView):
+    """GET /api/clients/scheduled-tasks/{task_id}/runs/?limit=50 — история запусков (без времени по ключам)"""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request, task_id):
+        limit = _int_param(request, 'limit', 50, 500)
+        runs = ScheduledTaskRun.objects.filter(task_id=task_id).select_related('user').defer('timings')[:limit]
+        return Response([_run_payload(r) for r in runs])
+
+
+class ScheduledTaskRunDetailView(APIView):
+    """GET /api/clients/scheduled-tasks/runs/{id}/ — запуск целиком, с временем по компаниям / хостам"""
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request, run_id):
+        try:
+            run = ScheduledTaskRun.objects.select_related('user').get(pk=run_id)
+        except ScheduledTaskRun.DoesNotExist:
+            return Response({'error': 'Запуск не найден'}, status=404)
+        return Response(_run_payload(run, timings=True))
+
+
+class ScheduledTaskTrendView(APIView):
+    """
+    GET /api/clients/scheduled-tasks/{task_id}/trend/?days=90 — данные для графика:
+    точки (длительность, объектов/сек, ошибки) по завершённым запускам, сводка с признаком
+    регрессии и самые медленные компании / хосты за период.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request, task_id):
+        days = _int_param(request, 'days', 90, 3650)
+        runs = list(
+            ScheduledTaskRun.objects
+            .filter(task_id=task_id, started_at__gte=timezone.now() - timedelta(days=days))
+            .exclude(status='running')
+            .order_by('started_at')
+        )
+
+        points = [{
+            'id': r.id, 'started_at': r.started_at, 'status': r.status, 'duration': r.duration,
+            'items_done': r.items_done, 'items_per_sec': r.items_per_sec, 'errors': r.errors,
+            'ofd_calls': r.ofd_calls, 'ssh_calls': r.ssh_calls,
+        } for r in runs]
+
+        durations = [r.duration for r in runs if r.duration is not None]
+        summary = {
+            'runs': len(runs),
+            'errors': sum(1 for r in runs if r.status == 'error'),
+            'avg_duration': round(sum(durations) / len(durations), 3) if durations else None,
+            'median_duration': round(median(durations), 3) if durations else None,
+            'max_duration': max(durations) if durations else None,
+            'last_duration': durations[-1] if durations else None,
+            'regression_ratio': None,
+            'regression': False,
+        }
+        if len(durations) >= 2:
+            baseline = median(durations[:-1])
+            if baseline > 0:
+                ratio = durations[-1] / baseline
+                summary['regression_ratio'] = round(ratio, 2)
+                summary['regression'] = ratio >= REGRESSION_RATIO
+
+        # Самые медленные ключи за период: по каждой группе (companies / hosts)
+        groups = {}
+        for r in runs:
+            for group, values in (r.timings or {}).items():
+                bucket = groups.setdefault(group, {})
+                for key, sec in timings_items(values):
+                    stat = bucket.setdefault(key, {'key': key, 'runs': 0, 'total': 0.0, 'max': 0.0})
+                    stat['runs'] += 1
+                    stat['total'] += sec
+                    stat['max'] = max(stat['max'], sec)
+                    stat['last'] = sec
+        slowest = {}
+        for group, bucket in groups.items():
+            stats = sorted(bucket.values(), key=lambda s: s['total'] / s['runs'], reverse=True)[:SLOWEST_KEYS]
+            slowest[group] = [{
+                'key': s['key'], 'runs': s['runs'], 'avg': round(s['total'] / s['runs'], 3),
+                'max': round(s['max'], 3), 'last': round(s['last'], 3),
+            } for s in stats]
+
+        return Response({'task_id': task_id, 'days': days, 'points': points, 'summary': summary, 'slowest': slowest})
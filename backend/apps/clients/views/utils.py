@@ -1,5 +1,3 @@
-import subprocess
-
 FIELD_LABELS = {
     'last_name': 'Фамилия',
     'first_name': 'Имя',
@@ -37,16 +35,31 @@ STATUS_LABELS = {'active': 'Активен', 'inactive': 'Неактивен'}
 
 
 def ping_ip(ip, timeout=5):
-    try:
-        result = subprocess.run(
-            ['ping', '-c', '1', '-W', str(timeout), '-i', '0.2', ip],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            timeout=timeout + 1
-        )
-        return result.returncode == 0
-    except Exception:
-        return False
+    """Доступность одного адреса — через reachability (ICMP/TCP, результат кешируется)."""
+    from .reachability import is_alive
+    return is_alive(ip, timeout=timeout)
+
+
+def month_range(year, month):
+    """
+    Границы месяца [первое число, первое число следующего) — для фильтра date__gte / date__lt.
+    В отличие от date__month такое условие использует индекс по полю.
+    ValueError — year / month не число или такого месяца нет (month=13).
+    """
+    import datetime
+    start = datetime.date(int(year), int(month), 1)
+    end = datetime.date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+def month_datetime_range(year, month):
+    """То же для DateTimeField: полночь в текущем часовом поясе (как у __date / __month)."""
+    import datetime
+    from django.utils import timezone
+    return tuple(
+        timezone.make_aware(datetime.datetime.combine(d, datetime.time.min))
+        for d in month_range(year, month)
+    )
 
 
 def build_change_log(old_client, new_data, provider_map):
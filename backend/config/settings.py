@@ -146,3 +146,85 @@ MEDIA_ROOT = '/app/media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 ENCRYPTION_KEY = _require_env('ENCRYPTION_KEY', '')
+
+# Очередь фоновых заданий (apps/clients/jobs.py, manage.py run_worker)
+JOBS_EAGER               = os.getenv('JOBS_EAGER', 'False') == 'True'  # без воркера: выполнять в процессе веб-сервера
+JOBS_WORKER_CONCURRENCY  = int(os.getenv('JOBS_WORKER_CONCURRENCY', '4'))   # заданий одновременно на воркер
+JOBS_POLL_INTERVAL       = float(os.getenv('JOBS_POLL_INTERVAL', '1'))      # сек между опросами пустой очереди
+JOBS_HEARTBEAT           = int(os.getenv('JOBS_HEARTBEAT', '10'))           # сек между отметками воркера
+JOBS_LEASE               = int(os.getenv('JOBS_LEASE', '60'))               # сек без отметки — задание потеряно
+# Мягкие лимиты времени по типам заданий, сек: «task.update_rnm=14400,rnm_sync=3600».
+# По истечении задание останавливается между пачками с частичным результатом (статус «Остановлено»)
+JOBS_DEADLINES = {
+    kind.strip(): int(sec)
+    for kind, _, sec in (item.partition('=') for item in os.getenv('JOBS_DEADLINES', '').split(','))
+    if kind.strip() and sec.strip()
+}
+
+# Планировщик регламентных заданий (apps/clients/scheduler.py) — поток воркера
+SCHEDULER_INTERVAL       = int(os.getenv('SCHEDULER_INTERVAL', '15'))        # сек между проверками расписания
+SCHEDULER_MISFIRE_GRACE  = int(os.getenv('SCHEDULER_MISFIRE_GRACE', '600'))  # сек: пропущенный слот ещё запускается
+
+# Push-канал прогресса заданий (apps/clients/events.py): SSE и long-poll.
+# Каждый ожидающий запрос занимает поток gunicorn (--threads) — держим запас под обычные запросы
+TASK_EVENTS_MAX_WAITERS = int(os.getenv('TASK_EVENTS_MAX_WAITERS', '8'))  # на процесс
+# Прогресс регламентных заданий (apps/clients/progress.py): текст без смены процента пишется не чаще
+TASK_PROGRESS_INTERVAL  = float(os.getenv('TASK_PROGRESS_INTERVAL', '1'))  # сек
+# История запусков заданий (apps/clients/task_runs.py): хранится не дольше и не больше
+TASK_RUN_HISTORY_DAYS   = int(os.getenv('TASK_RUN_HISTORY_DAYS', '365'))  # дней
+TASK_RUN_HISTORY_MAX    = int(os.getenv('TASK_RUN_HISTORY_MAX', '500'))   # запусков на задание
+
+# Резервное копирование БД (apps/clients/backup.py)
+BACKUP_DB_FORMAT = os.getenv('BACKUP_DB_FORMAT', 'custom')  # custom | directory — pg_dump; json — dumpdata
+BACKUP_DB_JOBS   = int(os.getenv('BACKUP_DB_JOBS', '2'))    # процессов pg_dump (directory) и pg_restore
+# Архив бэкапа (apps/clients/backup_archive.py): сжатие на лету
+BACKUP_COMPRESSION         = os.getenv('BACKUP_COMPRESSION', 'gzip')                # gzip | xz | zstd
+BACKUP_COMPRESSION_LEVEL   = int(os.getenv('BACKUP_COMPRESSION_LEVEL', '0'))        # 0 — по умолчанию для алгоритма
+BACKUP_COMPRESSION_THREADS = int(os.getenv('BACKUP_COMPRESSION_THREADS', '0'))      # 0 — все ядра (pigz / xz / zstd)
+BACKUP_ARCHIVE_PART_MB     = float(os.getenv('BACKUP_ARCHIVE_PART_MB', '16'))       # часть потока дампа в памяти
+
+# Удалённая копия бэкапов в S3-совместимом хранилище (apps/clients/backup_remote.py); пустой endpoint — выключено
+BACKUP_S3_ENDPOINT   = os.getenv('BACKUP_S3_ENDPOINT', '')          # https://storage.yandexcloud.net, http://minio:9000
+BACKUP_S3_BUCKET     = os.getenv('BACKUP_S3_BUCKET', '')
+BACKUP_S3_ACCESS_KEY = os.getenv('BACKUP_S3_ACCESS_KEY', '')
+BACKUP_S3_SECRET_KEY = os.getenv('BACKUP_S3_SECRET_KEY', '')
+BACKUP_S3_REGION     = os.getenv('BACKUP_S3_REGION', 'us-east-1')
+BACKUP_S3_PREFIX     = os.getenv('BACKUP_S3_PREFIX', 'support-portal/')
+BACKUP_S3_PART_MB    = float(os.getenv('BACKUP_S3_PART_MB', '16'))  # часть multipart-загрузки (не меньше 5)
+BACKUP_S3_CONCURRENCY = int(os.getenv('BACKUP_S3_CONCURRENCY', '4'))
+BACKUP_S3_BANDWIDTH_KBPS = int(os.getenv('BACKUP_S3_BANDWIDTH_KBPS', '0'))  # 0 — без ограничения
+BACKUP_S3_BANDWIDTH_HOURS = os.getenv('BACKUP_S3_BANDWIDTH_HOURS', '')      # 8-21 — ограничение только в эти часы
+BACKUP_S3_KEEP       = int(os.getenv('BACKUP_S3_KEEP', '30'))       # архивов в бакете
+BACKUP_S3_TIMEOUT    = int(os.getenv('BACKUP_S3_TIMEOUT', '120'))
+
+# Параллельный опрос Микротиков по SSH (регламентные задания)
+SSH_FANOUT_WORKERS = int(os.getenv('SSH_FANOUT_WORKERS', '32'))  # одновременных подключений
+SSH_HOST_DEADLINE  = int(os.getenv('SSH_HOST_DEADLINE', '0'))    # сек на один Микротик; 0 — таймауты SSH + запас
+
+# Пул SSH-сессий к Микротикам (в пределах воркера)
+SSH_POOL_IDLE_TIMEOUT = int(os.getenv('SSH_POOL_IDLE_TIMEOUT', '120'))  # сек простоя до закрытия
+SSH_POOL_KEEPALIVE    = int(os.getenv('SSH_POOL_KEEPALIVE', '30'))      # сек между keepalive
+SSH_POOL_MAX_PER_HOST = int(os.getenv('SSH_POOL_MAX_PER_HOST', '2'))    # сессий к одному Микротику
+SSH_POOL_MAX_IDLE     = int(os.getenv('SSH_POOL_MAX_IDLE', '64'))       # простаивающих сессий всего
+
+# Кеш IP касс из DHCP Микротика (views/mikrotik.py)
+KASSA_CACHE_TTL       = int(os.getenv('KASSA_CACHE_TTL', '3600'))         # сек — отдаём без обновления
+KASSA_CACHE_MAX_STALE = int(os.getenv('KASSA_CACHE_MAX_STALE', '604800')) # сек — отдаём и обновляем в фоне
+
+# Секции сборщика данных Микротика — выполняются одним скриптом в одной SSH-сессии
+MIKROTIK_COLLECT_SECTIONS = os.getenv('MIKROTIK_COLLECT_SECTIONS', 'external_ip,kassa_ips,resource,interfaces')
+
+# Проверка доступности хостов (views/reachability.py)
+REACHABILITY_METHOD    = os.getenv('REACHABILITY_METHOD', 'auto')          # auto | icmp | icmp-raw | tcp
+REACHABILITY_TIMEOUT   = float(os.getenv('REACHABILITY_TIMEOUT', '1.5'))   # сек ожидания ответа
+REACHABILITY_PARALLEL  = int(os.getenv('REACHABILITY_PARALLEL', '1024'))   # проверок одновременно
+REACHABILITY_CACHE_TTL = int(os.getenv('REACHABILITY_CACHE_TTL', '30'))    # сек жизни результата
+REACHABILITY_TCP_PORTS = os.getenv('REACHABILITY_TCP_PORTS', '22,80,443,8291')
+
+# Мониторинг доступности сети (manage.py monitor_network)
+NETWORK_MONITOR_INTERVAL = int(os.getenv('NETWORK_MONITOR_INTERVAL', '60'))  # сек между обходами
+NETWORK_HISTORY_DAYS     = int(os.getenv('NETWORK_HISTORY_DAYS', '180'))     # сколько суток хранить историю
+
+# История клиентов (задание archive_activity, apps/clients/activity_archive.py)
+ACTIVITY_HOT_DAYS     = int(os.getenv('ACTIVITY_HOT_DAYS', '180'))    # суток в основной таблице, старше — в архив
+ACTIVITY_ARCHIVE_DAYS = int(os.getenv('ACTIVITY_ARCHIVE_DAYS', '0'))  # суток в архиве (0 — бессрочно)
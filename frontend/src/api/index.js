@@ -38,11 +38,57 @@ api.interceptors.response.use(
 
 export default api;
 
+// Фоновое задание: запрос отвечает 202 с job_id, ждём результат опросом /clients/jobs/<id>/.
+// Возвращает { data: результат } как обычный ответ; ошибка задания — исключение с response.data.error.
+export const waitJob = async (request, interval = 1000) => {
+  const { data: job } = await request;
+  for (;;) {
+    await new Promise((resolve) => setTimeout(resolve, interval));
+    const { data: state } = await api.get(`/clients/jobs/${job.job_id}/`);
+    if (state.status === 'queued' || state.status === 'running') continue;
+    const result = state.result || {};
+    if (state.status !== 'success' || result.error) {
+      const error = new Error(result.error || state.progress_text || 'Задание не выполнено');
+      error.response = { data: { error: error.message } };
+      throw error;
+    }
+    return { data: result };
+  }
+};
+
 export const authAPI = {
   login: (email, password) => api.post('/auth/token/', { email, password }),
   me: () => api.get('/auth/users/me/'),
 };
 
+// Прогресс регламентного задания long-poll'ом: запрос ждёт на сервере изменения состояния
+// (не дольше wait сек), onState(state) вызывается на каждое изменение. Наблюдение заканчивается,
+// когда задание не выполняется или запрос не удался (onState не вызывается). Возвращает функцию остановки.
+export const watchTask = (taskId, onState, { wait = 25, onError } = {}) => {
+  let stopped = false;
+  (async () => {
+    let since = '';
+    while (!stopped) {
+      try {
+        const { data } = await api.get(`/clients/scheduled-tasks/${taskId}/progress/`, { params: { since, wait } });
+        if (stopped) return;
+        if (data.status !== 'running' || data.version !== since) {
+          since = data.version;
+          onState(data);
+        } else {
+          // Без изменений: истёк wait или сервер сверх лимита подписок ответил сразу — не частим
+          await new Promise((resolve) => setTimeout(resolve, 2000));
+        }
+        if (data.status !== 'running') return;
+      } catch (e) {
+        if (!stopped && onError) onError(e);
+        return;
+      }
+    }
+  })();
+  return () => { stopped = true; };
+};
+
 export const clientsAPI = {
   list: (params) => api.get('/clients/', { params }),
   get: (id) => api.get(`/clients/${id}/`),
@@ -51,6 +97,10 @@ export const clientsAPI = {
   delete: (id) => api.delete(`/clients/${id}/`),
   getNotes: (id) => api.get(`/clients/${id}/notes/`),
   addNote: (id, text) => api.post(`/clients/${id}/notes/`, { text }),
+  getActivityArchive: (id, params) => api.get(`/clients/${id}/activity_archive/`, { params }),
+  // Запросы к ОФД выполняются фоновым заданием — промис завершается вместе с заданием
+  fetchOfdKkt: (id) => waitJob(api.post(`/clients/${id}/ofd_kkt/`)),
+  refreshOfdKkt: (id, data) => waitJob(api.patch(`/clients/${id}/ofd_kkt/`, data)),
   createDraft: () => api.post('/clients/create_draft/'),
   discardDraft: (id) => api.delete(`/clients/${id}/discard_draft/`),
   getFiles: (id) => api.get(`/clients/${id}/files/`),
@@ -40,6 +40,8 @@ export default function ClientDetailPage() {
 
   // История
   const [showAllActivity, setShowAllActivity] = useState(false);
+  const [archivedActivity, setArchivedActivity] = useState(null);
+  const [archiveLoading, setArchiveLoading] = useState(false);
 
   // Пинг
   const [pingResults, setPingResults] = useState({ external_ip: null, mikrotik_ip: null, server_ip: null });
@@ -63,6 +65,7 @@ export default function ClientDetailPage() {
         clientsAPI.getFiles(id),
       ]);
       setClient(clientRes.data);
+      setArchivedActivity(null);
       setNotes(notesRes.data);
       setFiles(filesRes.data);
     } catch {
@@ -125,7 +128,7 @@ export default function ClientDetailPage() {
   const fetchKktFromOfd = async () => {
     setKktFetching(true);
     try {
-      const res = await api.post(`/clients/${id}/ofd_kkt/`);
+      const res = await clientsAPI.fetchOfdKkt(id);
       message.success(res.data.message || 'Данные ККТ получены с ОФД');
       if (res.data.errors?.length > 0) res.data.errors.forEach(e => message.warning(e, 5));
       await loadKktData();
@@ -137,7 +140,7 @@ export default function ClientDetailPage() {
   const refreshKktByRnm = async () => {
     setKktRefreshing(true);
     try {
-      const res = await api.patch(`/clients/${id}/ofd_kkt/`);
+      const res = await clientsAPI.refreshOfdKkt(id);
       message.success(res.data.message || 'ККТ обновлены');
       if (res.data.errors?.length > 0) res.data.errors.forEach(e => message.warning(e, 5));
       await loadKktData();
@@ -186,6 +189,17 @@ export default function ClientDetailPage() {
     finally { setNoteSending(false); }
   };
 
+  // ─── Архив истории ──────────────────────────────────────
+  const loadActivityArchive = async () => {
+    setArchiveLoading(true);
+    try {
+      const { data } = await clientsAPI.getActivityArchive(id);
+      setArchivedActivity(data);
+      setShowAllActivity(true);
+    } catch { message.error('Ошибка загрузки архива истории'); }
+    finally { setArchiveLoading(false); }
+  };
+
   // ─── Удаление ───────────────────────────────────────────
   const handleDelete = async () => {
     try {
@@ -199,6 +213,7 @@ export default function ClientDetailPage() {
   if (!client) return <div>Клиент не найден</div>;
 
   const pageTitle = client.address || client.company || `Клиент #${client.id}`;
+  const activities = [...(client.activities || []), ...(archivedActivity || [])];
 
   const tabItems = [
     {
@@ -307,15 +322,15 @@ export default function ClientDetailPage() {
         <Col span={8}>
           {/* История */}
           <Card
-            title={<Space>История изменений <Tag>{client.activities?.length || 0}</Tag></Space>}
+            title={<Space>История изменений <Tag>{(client.activities?.length || 0) + (client.activities_archived || 0)}</Tag></Space>}
             style={{ marginBottom: 16 }}
           >
-            {!client.activities?.length ? (
+            {!activities.length && !client.activities_archived ? (
               <Empty description="История пуста" image={Empty.PRESENTED_IMAGE_SIMPLE} />
             ) : (
               <>
                 <Timeline
-                  items={(showAllActivity ? client.activities : client.activities.slice(0, 2)).map((a) => ({
+                  items={(showAllActivity ? activities : activities.slice(0, 2)).map((a) => ({
                     dot: <span style={{ fontSize: 14 }}><ActivityIcon action={a.action} /></span>,
                     children: (
                       <div style={{ marginBottom: 4 }}>
@@ -345,11 +360,18 @@ export default function ClientDetailPage() {
                     ),
                   }))}
                 />
-                {client.activities.length > 2 && (
+                {activities.length > 2 && (
                   <Button type="link" size="small" onClick={() => setShowAllActivity(!showAllActivity)} style={{ padding: 0 }}>
-                    {showAllActivity ? '▲ Свернуть' : `▼ Показать ещё ${client.activities.length - 2}`}
+                    {showAllActivity ? '▲ Свернуть' : `▼ Показать ещё ${activities.length - 2}`}
                   </Button>
                 )}
+                {client.activities_archived > 0 && !archivedActivity && (
+                  <div>
+                    <Button type="link" size="small" loading={archiveLoading} onClick={loadActivityArchive} style={{ padding: 0 }}>
+                      Показать архив ({client.activities_archived})
+                    </Button>
+                  </div>
+                )}
               </>
             )}
           </Card>
@@ -170,7 +170,7 @@ export default function ClientFormPage() {
     }
     setKktFetching(true);
     try {
-      const res = await api.post(`/clients/${id}/ofd_kkt/`);
+      const res = await clientsAPI.fetchOfdKkt(id);
       message.success(res.data.message || 'Данные ККТ получены с ОФД');
       if (res.data.errors?.length) res.data.errors.forEach(e => message.warning(e, 5));
       await loadKktData();
@@ -183,7 +183,7 @@ export default function ClientFormPage() {
     if (!id) return;
     setKktRefreshing(true);
     try {
-      const res = await api.patch(`/clients/${id}/ofd_kkt/`);
+      const res = await clientsAPI.refreshOfdKkt(id);
       message.success(res.data.message || 'ККТ обновлены');
       if (res.data.errors?.length) res.data.errors.forEach(e => message.warning(e, 5));
       await loadKktData();
@@ -197,7 +197,7 @@ export default function ClientFormPage() {
     if (!rnm) { message.warning('Введите РНМ'); return; }
     setAddByRnmLoading(true);
     try {
-      const res = await api.patch(`/clients/${id}/ofd_kkt/`, { rnm_override: rnm });
+      const res = await clientsAPI.refreshOfdKkt(id, { rnm_override: rnm });
       message.success(res.data.message || 'ККТ добавлена');
       setAddByRnmVisible(false); setAddByRnmValue('');
       await loadKktData();
@@ -222,7 +222,7 @@ export default function ClientFormPage() {
     try {
       for (const rnm of filled) {
         try {
-          const res = await api.patch(`/clients/${id}/ofd_kkt/`, { rnm_override: rnm.trim() });
+          const res = await clientsAPI.refreshOfdKkt(id, { rnm_override: rnm.trim() });
           if (res.data.success) fetched.push(rnm.trim());
           else if (res.data.errors?.length) errors.push(...res.data.errors);
         } catch (e) {
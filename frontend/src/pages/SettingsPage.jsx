@@ -3,7 +3,7 @@ import { Spin, Space, Tabs, Typography, message } from 'antd';
 import {
   SettingOutlined, CalendarOutlined, RobotOutlined,
 } from '@ant-design/icons';
-import { settingsAPI } from '../api';
+import { settingsAPI, watchTask } from '../api';
 import api from '../api/axios';
 import SettingsAccounts    from './settings/SettingsAccounts';
 import SettingsAutomation  from './settings/SettingsAutomation';
@@ -96,6 +96,9 @@ export default function SettingsPage() {
 
   useEffect(() => { loadTasks(); loadCompanies(); }, []); // eslint-disable-line
 
+  // Уход со страницы — наблюдение за заданиями прекращается
+  useEffect(() => () => { pollRef.current?.(); restorePollRef.current?.(); }, []);
+
   const loadCompanies = async () => {
     try {
       const { data } = await api.get('/clients/ofd-companies/');
@@ -253,7 +256,7 @@ export default function SettingsPage() {
       for (const t of data) {
         try {
           const { data: cronData } = await api.get(`/clients/scheduled-tasks/cron/?task_id=${t.task_id}`);
-          setCronLine(prev => ({ ...prev, [t.task_id]: cronData.cron_line }));
+          setCronLine(prev => ({ ...prev, [t.task_id]: cronData }));
         } catch { /* ignore */ }
       }
     } catch { /* ignore */ }
@@ -283,19 +286,16 @@ export default function SettingsPage() {
 
   const startPolling = (task_id) => {
     setPolling(true);
-    pollRef.current = setInterval(async () => {
-      try {
-        const { data } = await api.get(`/clients/scheduled-tasks/${task_id}/progress/`);
-        setTasks(prev => prev.map(t => t.task_id === task_id ? { ...t, ...data } : t));
-        if (data.status !== 'running') {
-          clearInterval(pollRef.current);
-          setPolling(false);
-          setTaskResult(data);
-          setResultModal(true);
-          loadTasks();
-        }
-      } catch { clearInterval(pollRef.current); setPolling(false); }
-    }, 2000);
+    pollRef.current = watchTask(task_id, (data) => {
+      setTasks(prev => prev.map(t => t.task_id === task_id ? { ...t, ...data } : t));
+      if (data.status !== 'running') {
+        pollRef.current = null;
+        setPolling(false);
+        setTaskResult(data);
+        setResultModal(true);
+        loadTasks();
+      }
+    }, { onError: () => { pollRef.current = null; setPolling(false); } });
   };
 
   const handleRunTask = async () => {
@@ -324,6 +324,16 @@ export default function SettingsPage() {
     }
   };
 
+  const handleCancelTask = async (task_id) => {
+    try {
+      const { data } = await api.post(`/clients/scheduled-tasks/${task_id}/cancel/`);
+      message.info(data.message);
+      await loadTasks();
+    } catch (e) {
+      message.error(e.response?.data?.error || 'Ошибка остановки');
+    }
+  };
+
   const openRunModal = async () => {
     setRunScope(null); setSelectedCompany(null); setRunModal(true);
   };
@@ -349,30 +359,35 @@ export default function SettingsPage() {
     } finally { setBackupsLoading(false); }
   };
 
+  const handleVerifyBackup = async (filename) => {
+    try {
+      const { data } = await api.post('/clients/backups/verify/', { filename });
+      if (!data.ok) message.error(`Бэкап повреждён: ${data.errors.join('; ')}`, 8);
+      else if (data.checked.length) message.success(`Бэкап цел: ${data.checked.join(', ')}`);
+      else message.warning('У бэкапа нет манифеста — проверить нечем');
+    } catch (e) {
+      message.error(e.response?.data?.error || 'Ошибка проверки бэкапа');
+    }
+  };
+
   const handleRestore = async (filename) => {
     try {
       await api.post('/clients/backups/restore/', { filename });
       setRestoring(true);
       setRestoreProgress({ status: 'running', progress: 0, progress_text: 'Запуск...' });
-      // Поллинг прогресса восстановления
-      restorePollRef.current = setInterval(async () => {
-        try {
-          const { data } = await api.get('/clients/backups/restore/');
-          setRestoreProgress(data);
-          if (data.status === 'success' || data.status === 'error') {
-            clearInterval(restorePollRef.current);
-            setRestoring(false);
-            if (data.status === 'success') {
-              message.success('Восстановление завершено успешно');
-            } else {
-              message.error('Ошибка восстановления');
-            }
-          }
-        } catch {
-          clearInterval(restorePollRef.current);
+      // Прогресс восстановления — long-poll, ответ приходит при изменении состояния
+      restorePollRef.current = watchTask('restore_backup', (data) => {
+        setRestoreProgress(data);
+        if (data.status === 'success' || data.status === 'error') {
+          restorePollRef.current = null;
           setRestoring(false);
+          if (data.status === 'success') {
+            message.success('Восстановление завершено успешно');
+          } else {
+            message.error('Ошибка восстановления');
+          }
         }
-      }, 2000);
+      }, { onError: () => { restorePollRef.current = null; setRestoring(false); } });
     } catch (e) {
       message.error(e.response?.data?.error || 'Ошибка запуска восстановления');
     }
@@ -430,7 +445,7 @@ export default function SettingsPage() {
           scheduleLocal={scheduleLocal} cronLine={cronLine}
           timezoneOffset={timezoneOffset} savingTimezone={savingTimezone} saveTimezone={saveTimezone}
           patchLocal={patchLocal} handleApplyCron={handleApplyCron} applyingCron={applyingCron}
-          openRunModal={openRunModal} handleRunTaskDirect={handleRunTaskDirect}
+          openRunModal={openRunModal} handleRunTaskDirect={handleRunTaskDirect} handleCancelTask={handleCancelTask}
           setTaskResult={setTaskResult} setResultModal={setResultModal}
           taskResult={taskResult} resultModal={resultModal}
           runModal={runModal} setRunModal={setRunModal}
@@ -439,6 +454,7 @@ export default function SettingsPage() {
           handleRunTask={handleRunTask}
           backups={backups} backupsLoading={backupsLoading} loadBackups={loadBackups}
           handleRestore={handleRestore} restoring={restoring} restoreProgress={restoreProgress}
+          handleVerifyBackup={handleVerifyBackup}
         />
       ),
     },
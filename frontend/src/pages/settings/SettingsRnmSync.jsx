@@ -9,6 +9,7 @@ import {
   DeleteOutlined, DownloadOutlined,
 } from '@ant-design/icons';
 import api from '../../api/axios';
+import { clientsAPI, watchTask } from '../../api';
 
 const { Text } = Typography;
 
@@ -28,6 +29,7 @@ export default function SettingsRnmSync({ companies }) {
   // Загружаем текущий статус при монтировании
   useEffect(() => {
     loadStatus();
+    return () => pollRef.current?.();
   }, []); // eslint-disable-line
 
   const loadStatus = async () => {
@@ -42,25 +44,18 @@ export default function SettingsRnmSync({ companies }) {
     } catch {}
   };
 
+  // Прогресс — long-poll, ответ приходит при изменении состояния; итог сверки — из rnm-sync/
   const startPolling = () => {
     if (pollRef.current) return;
-    pollRef.current = setInterval(async () => {
-      try {
-        const { data } = await api.get('/clients/rnm-sync/');
-        setStatus(data.status);
-        setProgress(data.progress || 0);
-        setProgressText(data.progress_text || '');
-        setLastRunAt(data.last_run_at);
-        if (data.result) setResult(data.result);
-        if (data.status !== 'running') {
-          clearInterval(pollRef.current);
-          pollRef.current = null;
-        }
-      } catch {
-        clearInterval(pollRef.current);
+    pollRef.current = watchTask('rnm_sync', (data) => {
+      setStatus(data.status);
+      setProgress(data.progress || 0);
+      setProgressText(data.progress_text || '');
+      if (data.status !== 'running') {
         pollRef.current = null;
+        loadStatus();
       }
-    }, 2000);
+    }, { onError: () => { pollRef.current = null; } });
   };
 
   const handleRun = async () => {
@@ -119,9 +114,7 @@ export default function SettingsRnmSync({ companies }) {
     }
     setAddingRnm(item.rnm);
     try {
-      const res = await api.patch(`/clients/${clientId}/ofd_kkt/`, {
-        rnm_override: item.rnm,
-      });
+      const res = await clientsAPI.refreshOfdKkt(clientId, { rnm_override: item.rnm });
       message.success(res.data.message || `РНМ ${item.rnm} добавлен`);
       setResult(prev => ({
         ...prev,
@@ -144,8 +137,8 @@ export default function SettingsRnmSync({ companies }) {
     error:   <CloseCircleOutlined style={{ color: '#ff4d4f' }} />,
   }[status] || null;
 
-  const statusColor = { idle: 'default', running: 'processing', success: 'success', error: 'error' }[status];
-  const statusLabel = { idle: 'Ожидает', running: 'Выполняется', success: 'Успешно', error: 'Ошибка' }[status];
+  const statusColor = { idle: 'default', running: 'processing', success: 'success', error: 'error', cancelled: 'warning' }[status];
+  const statusLabel = { idle: 'Ожидает', running: 'Выполняется', success: 'Успешно', error: 'Ошибка', cancelled: 'Остановлено' }[status];
 
   const missingInUs  = result?.missing_in_us  || [];
   const missingInOfd = result?.missing_in_ofd || [];
@@ -7,7 +7,7 @@ import {
   CalendarOutlined, ClockCircleOutlined, PlayCircleOutlined,
   FileTextOutlined, SyncOutlined, SettingOutlined,
   CheckCircleOutlined, CloseCircleOutlined, MinusCircleOutlined,
-  DatabaseOutlined, ReloadOutlined, RollbackOutlined,
+  DatabaseOutlined, ReloadOutlined, RollbackOutlined, StopOutlined, SafetyCertificateOutlined, InboxOutlined,
 } from '@ant-design/icons';
 import useThemeStore from '../../store/themeStore';
 
@@ -35,6 +35,13 @@ const TIMEZONE_OPTIONS = [
   { label: 'UTC+12 (Камчатка)', value: 12 },
 ];
 
+// Время UTC (ISO) → «дд.мм ЧЧ:ММ» по часовому поясу расписания
+const formatLocal = (iso, offset) => {
+  const d = new Date(new Date(iso).getTime() + (offset || 0) * 3600 * 1000);
+  const pad = (n) => String(n).padStart(2, '0');
+  return `${pad(d.getUTCDate())}.${pad(d.getUTCMonth() + 1)} ${pad(d.getUTCHours())}:${pad(d.getUTCMinutes())}`;
+};
+
 const DAYS_OPTIONS = [
   { label: 'Пн', value: 0 }, { label: 'Вт', value: 1 },
   { label: 'Ср', value: 2 }, { label: 'Чт', value: 3 },
@@ -43,7 +50,7 @@ const DAYS_OPTIONS = [
 ];
 
 function TaskCard({
-  taskId, title, icon, onRun,
+  taskId, title, icon, onRun, handleCancelTask,
   tasks, tasksLoading, polling,
   scheduleLocal, cronLine, timezoneOffset,
   patchLocal, handleApplyCron, applyingCron,
@@ -60,9 +67,10 @@ function TaskCard({
     running: <SyncOutlined spin style={{ color: '#1677ff' }} />,
     success: <CheckCircleOutlined style={{ color: '#52c41a' }} />,
     error:   <CloseCircleOutlined style={{ color: '#ff4d4f' }} />,
+    cancelled: <StopOutlined style={{ color: '#faad14' }} />,
   }[task.status] || null;
-  const statusColor = { idle: 'default', running: 'processing', success: 'success', error: 'error' }[task.status];
-  const statusLabel = { idle: 'Ожидает', running: 'Выполняется', success: 'Успешно', error: 'Ошибка' }[task.status];
+  const statusColor = { idle: 'default', running: 'processing', success: 'success', error: 'error', cancelled: 'warning' }[task.status];
+  const statusLabel = { idle: 'Ожидает', running: 'Выполняется', success: 'Успешно', error: 'Ошибка', cancelled: 'Остановлено' }[task.status];
   const loc = scheduleLocal[taskId] || {};
   const currentCron = cronLine[taskId];
 
@@ -86,6 +94,17 @@ function TaskCard({
               Запустить
             </Button>
           </Tooltip>
+          {isRunning && (
+            <Popconfirm
+              title="Остановить задание?"
+              description="Уже полученные данные сохранятся"
+              onConfirm={() => handleCancelTask(taskId)}
+              okText="Остановить"
+              cancelText="Нет"
+            >
+              <Button danger icon={<StopOutlined />}>Остановить</Button>
+            </Popconfirm>
+          )}
           {task.last_run_at && (
             <Tooltip title="Результат последнего запуска">
               <Button icon={<FileTextOutlined />} onClick={() => { setTaskResult(task); setResultModal(true); }}>
@@ -166,11 +185,11 @@ function TaskCard({
               </Space>
             );
           })()}
-          {currentCron && (
+          {currentCron?.next_run_at && (
             <div style={{ fontSize: 12, color: '#888' }}>
-              <span style={{ marginRight: 6 }}>Активная cron-строка:</span>
+              <span style={{ marginRight: 6 }}>Следующий запуск:</span>
               <code style={{ background: isDark ? '#2a2a2a' : '#f0f0f0', padding: '2px 8px', borderRadius: 4, fontFamily: 'monospace' }}>
-                {currentCron.split('#')[0].trim()}
+                {formatLocal(currentCron.next_run_at, timezoneOffset)}
               </code>
             </div>
           )}
@@ -178,7 +197,7 @@ function TaskCard({
             Применить расписание
           </Button>
           <div style={{ fontSize: 12, color: '#aaa' }}>
-            Изменения применяются к crontab сервера. Перед применением убедитесь что выполнен <code>python3 setup_scheduler.py</code>
+            Расписание выполняет планировщик воркера{currentCron?.scheduler_active === false ? ' — сейчас не запущен, проверьте сервис worker' : ''}
           </div>
         </Space>
       </div>
@@ -191,7 +210,7 @@ export default function SettingsScheduler({
   scheduleLocal, cronLine,
   timezoneOffset, savingTimezone, saveTimezone,
   patchLocal, handleApplyCron, applyingCron,
-  openRunModal, handleRunTaskDirect,
+  openRunModal, handleRunTaskDirect, handleCancelTask,
   setTaskResult, setResultModal,
   taskResult, resultModal,
   runModal, setRunModal,
@@ -199,7 +218,7 @@ export default function SettingsScheduler({
   companies, selectedCompany, setSelectedCompany,
   handleRunTask,
   backups, backupsLoading, loadBackups,
-  handleRestore, restoring, restoreProgress,
+  handleRestore, restoring, restoreProgress, handleVerifyBackup,
 }) {
   const isDark = useThemeStore((s) => s.isDark);
 
@@ -211,7 +230,7 @@ export default function SettingsScheduler({
     tasks, tasksLoading, polling,
     scheduleLocal, cronLine, timezoneOffset,
     patchLocal, handleApplyCron, applyingCron,
-    setTaskResult, setResultModal,
+    setTaskResult, setResultModal, handleCancelTask,
     isDark,
   };
 
@@ -231,7 +250,7 @@ export default function SettingsScheduler({
           filterOption={(input, opt) => opt.label.toLowerCase().includes(input.toLowerCase())}
         />
         <Text type="secondary" style={{ fontSize: 12 }}>
-          Время вводится по выбранному поясу, конвертируется в UTC для cron
+          Время вводится по выбранному поясу
         </Text>
       </div>
 
@@ -256,6 +275,13 @@ export default function SettingsScheduler({
         icon={<DatabaseOutlined style={{ color: '#722ed1' }} />}
         onRun={() => handleRunTaskDirect('backup_system')}
       />
+      <TaskCard
+        {...taskCardProps}
+        taskId="archive_activity"
+        title="Архивация истории клиентов"
+        icon={<InboxOutlined style={{ color: '#fa8c16' }} />}
+        onRun={() => handleRunTaskDirect('archive_activity')}
+      />
 
       {/* ── Список бэкапов и восстановление ── */}
       <Card
@@ -308,34 +334,55 @@ export default function SettingsScheduler({
                 key: 'size_str',
                 width: 100,
               },
+              {
+                title: 'Содержимое',
+                key: 'contents',
+                width: 200,
+                render: (_, record) => record.has_manifest ? (
+                  <Tooltip title={`Дамп: ${record.db_format}, сжатие: ${record.codec}, время: ${record.duration} сек, SHA-256: ${record.sha256}`}>
+                    <span style={{ fontSize: 12 }}>
+                      {record.db_rows} строк · {record.media_files} медиа
+                    </span>
+                  </Tooltip>
+                ) : <span style={{ fontSize: 12, color: '#888' }}>нет манифеста</span>,
+              },
               {
                 title: '',
                 key: 'action',
-                width: 130,
+                width: 170,
                 render: (_, record) => (
-                  <Popconfirm
-                    title="Восстановить из этого бэкапа?"
-                    description={
-                      <div>
-                        <div>Все текущие данные будут заменены.</div>
-                        <div style={{ color: '#ff4d4f', marginTop: 4 }}>Это действие необратимо.</div>
-                      </div>
-                    }
-                    okText="Восстановить"
-                    cancelText="Отмена"
-                    okButtonProps={{ danger: true }}
-                    onConfirm={() => handleRestore(record.filename)}
-                    disabled={restoring}
-                  >
-                    <Button
-                      danger
-                      size="small"
-                      icon={<RollbackOutlined />}
+                  <Space size={4}>
+                    <Tooltip title="Проверить контрольную сумму без восстановления">
+                      <Button
+                        size="small"
+                        icon={<SafetyCertificateOutlined />}
+                        onClick={() => handleVerifyBackup(record.filename)}
+                      />
+                    </Tooltip>
+                    <Popconfirm
+                      title="Восстановить из этого бэкапа?"
+                      description={
+                        <div>
+                          <div>Все текущие данные будут заменены.</div>
+                          <div style={{ color: '#ff4d4f', marginTop: 4 }}>Это действие необратимо.</div>
+                        </div>
+                      }
+                      okText="Восстановить"
+                      cancelText="Отмена"
+                      okButtonProps={{ danger: true }}
+                      onConfirm={() => handleRestore(record.filename)}
                       disabled={restoring}
                     >
-                      Восстановить
-                    </Button>
-                  </Popconfirm>
+                      <Button
+                        danger
+                        size="small"
+                        icon={<RollbackOutlined />}
+                        disabled={restoring}
+                      >
+                        Восстановить
+                      </Button>
+                    </Popconfirm>
+                  </Space>
                 ),
               },
             ]}